@@ -0,0 +1,263 @@
+import json
+import argparse
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from StockBarStore import DATE_COLUMN, read_contract_file
+from StockProcessData import Type, ZenIncrementalProcessor
+
+
+# 向量化回测：交易准则是返回目标持仓数组的函数（正数做多、负数做空、0 空仓），
+# 第 t 根K线收盘时的目标持仓在第 t+1 根K线开盘时成交，成交、手续费、持仓与盈亏全部以数组运算完成
+DEFAULT_INITIAL_CASH = 1_000_000.0
+TRADING_DAYS_PER_YEAR = 252
+
+# bars 为逐根K线的持仓与权益，trades 为持仓不变的各段交易，stats 为汇总指标
+BacktestResult = namedtuple("BacktestResult", ["bars", "trades", "stats"])
+# BarData 的数组属性与对应的列名
+BAR_COLUMNS = (("date", DATE_COLUMN), ("open", "开盘价"), ("high", "最高价"), ("low", "最低价"),
+               ("close", "收盘价"), ("volume", "成交量"), ("position", "持仓量"))
+
+
+def moving_average(values, window):
+    """简单移动平均，前 window - 1 根为 NaN。"""
+    return pd.Series(values, dtype=float).rolling(window).mean().to_numpy()
+
+
+def hold_last(signal):
+    """将每个非零信号延续到下一个非零信号出现为止，首个信号之前为 0，NaN 视为无信号。"""
+    signal = np.nan_to_num(np.asarray(signal, dtype=float))
+    last = np.where(signal != 0, np.arange(len(signal)), -1)
+    if len(last):
+        last = np.maximum.accumulate(last)
+    return np.where(last >= 0, signal[np.maximum(last, 0)], 0.0)
+
+
+def zen_fenxing(df):
+    """
+    与原始K线对齐的缠论顶底分型：1 为顶分型、-1 为底分型。
+    包含处理中后续K线可能改写甚至弹出已合并的K线，对全量历史处理得到的分型会随未来K线变化（重绘），
+    因此用 `ZenIncrementalProcessor` 逐根推进，在每根K线收盘时只取当时已知的最新分型：
+    出现新的分型（所在合并K线或方向与上次发出的不同，且位置不早于上次）时记在该K线上，之后被改写或弹出的分型不再撤回。
+    """
+    high = pd.to_numeric(df["最高价"], errors="coerce").to_numpy(dtype=float)
+    low = pd.to_numeric(df["最低价"], errors="coerce").to_numpy(dtype=float)
+    open_ = pd.to_numeric(df["开盘价"], errors="coerce").to_numpy(dtype=float) if "开盘价" in df.columns else high
+    close = pd.to_numeric(df["收盘价"], errors="coerce").to_numpy(dtype=float) if "收盘价" in df.columns else low
+    signal = np.zeros(len(df), dtype=np.int8)
+    processor = ZenIncrementalProcessor()
+    last = None  # 上次发出的分型：(合并K线起始的原始K线位置, 方向)
+    for i in range(len(df)):
+        processor.append({"最高价": high[i], "最低价": low[i], "开盘价": open_[i], "收盘价": close[i]}, tentative=False)
+        if not processor.fenxing_idx:
+            continue
+        k = processor.fenxing_idx[-1]
+        current = (processor.merger.idx[k], processor.fenxing[k])
+        if current != last and (last is None or current[0] >= last[0]):
+            signal[i] = 1 if current[1] == Type.TOP else -1
+            last = current
+    return signal
+
+
+class BarData:
+    """
+    回测用的K线数组视图。indicator() 按键缓存指标的计算结果，
+    同一份数据上回测多组参数时，均线、缠论分型等只计算一次。
+    """
+
+    def __init__(self, df):
+        self._frame = df.reset_index(drop=True)
+        self.n = len(self._frame)
+
+        def column(name):
+            if name not in self._frame.columns:
+                return np.full(self.n, np.nan)
+            return pd.to_numeric(self._frame[name], errors="coerce").to_numpy(dtype=float)
+
+        self.date = (self._frame[DATE_COLUMN].to_numpy() if DATE_COLUMN in self._frame.columns
+                     else np.arange(self.n))
+        for attr, name in BAR_COLUMNS[1:]:
+            setattr(self, attr, column(name))
+        self._cache = {}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """由 BAR_COLUMNS 中各属性名对应的数组构造（可为内存映射的视图，不复制），frame 在首次访问时生成。"""
+        bars = cls.__new__(cls)
+        bars._frame = None
+        bars.n = len(arrays["close"])
+        for attr, _ in BAR_COLUMNS:
+            setattr(bars, attr, arrays[attr])
+        bars._cache = {}
+        return bars
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = pd.DataFrame({name: getattr(self, attr) for attr, name in BAR_COLUMNS})
+        return self._frame
+
+    def __len__(self):
+        return self.n
+
+    def indicator(self, key, func):
+        """返回键为 key 的指标，首次访问时调用 func() 计算。"""
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    def fenxing(self):
+        """逐根收盘时已知的缠论顶底分型（不含未来K线），见 `zen_fenxing`。"""
+        return self.indicator(("fenxing",), lambda: zen_fenxing(self.frame))
+
+
+def ma_cross(bars, fast=5, slow=20):
+    """均线交叉：快线在慢线之上做多，之下做空，均线形成之前空仓。"""
+    fast_ma = bars.indicator(("ma", fast), lambda: moving_average(bars.close, fast))
+    slow_ma = bars.indicator(("ma", slow), lambda: moving_average(bars.close, slow))
+    return np.nan_to_num(np.sign(fast_ma - slow_ma))
+
+
+def breakout(bars, window=20):
+    """通道突破：收盘价高于此前 window 根K线的最高价做多，低于最低价做空，否则维持原方向。"""
+    upper = bars.indicator(("highest", window),
+                           lambda: pd.Series(bars.high).rolling(window).max().shift(1).to_numpy())
+    lower = bars.indicator(("lowest", window),
+                           lambda: pd.Series(bars.low).rolling(window).min().shift(1).to_numpy())
+    return hold_last(np.where(bars.close > upper, 1.0, np.where(bars.close < lower, -1.0, 0.0)))
+
+
+def fenxing_reversal(bars, hold=0):
+    """缠论分型反转：底分型确认后做多，顶分型确认后做空；hold 大于 0 时持有 hold 根K线后空仓。"""
+    signal = -bars.fenxing().astype(float)
+    position = hold_last(signal)
+    if hold > 0:
+        last = np.maximum.accumulate(np.where(signal != 0, np.arange(len(signal)), -1)) if len(signal) else signal
+        position = np.where(np.arange(len(signal)) - last < hold, position, 0.0)
+    return position
+
+
+RULES = {"ma_cross": ma_cross, "breakout": breakout, "fenxing_reversal": fenxing_reversal}
+
+
+def _trade_legs(bars, position, trade, multiplier):
+    # 持仓变化的K线之间为一段交易，按开盘价进出（未平仓的一段按最后收盘价计），盈亏不含手续费与滑点
+    n = len(position)
+    change = np.flatnonzero(trade != 0)
+    ends = np.append(change[1:], n)
+    held = position[change] != 0
+    starts, ends = change[held], ends[held]
+    size = position[starts]
+    entry_price = bars.open[starts]
+    closed = ends < n
+    exit_price = np.where(closed, bars.open[np.minimum(ends, n - 1)], bars.close[-1] if n else np.nan)
+    exit_date = pd.Series(bars.date[np.minimum(ends, n - 1)], dtype=object).where(closed, None)
+    return pd.DataFrame({
+        "方向": np.where(size > 0, "多", "空"),
+        "手数": np.abs(size),
+        "开仓日期": bars.date[starts],
+        "开仓价": entry_price,
+        "平仓日期": exit_date.to_numpy(),
+        "平仓价": exit_price,
+        "盈亏": size * (exit_price - entry_price) * multiplier,
+    })
+
+
+def run_backtest(data, rule, params=None, lots=1.0, multiplier=1.0, fee_rate=0.0, fee_per_lot=0.0,
+                 slippage=0.0, initial_cash=DEFAULT_INITIAL_CASH):
+    """
+    在一个合约的K线上回测交易准则。
+
+    Args:
+        data (pd.DataFrame | BarData): 按日期排序的K线（按合约输出的文件内容）。
+        rule: 准则函数 rule(bars, **params)，返回每根K线收盘时的目标持仓（以 lots 为单位）。
+        lots (float): 每单位信号对应的手数。
+        multiplier (float): 合约乘数，每点价格变动对应的金额。
+        fee_rate (float): 按成交金额计的手续费率。
+        fee_per_lot (float): 每手固定手续费。
+        slippage (float): 每手成交价相对开盘价的不利滑点（价格点数）。
+        initial_cash (float): 初始资金。
+
+    Returns:
+        BacktestResult: 逐根K线的持仓、成交、盈亏与权益，各段交易，以及汇总指标。
+    """
+    bars = data if isinstance(data, BarData) else BarData(data)
+    n = len(bars)
+    target = np.nan_to_num(np.asarray(rule(bars, **(params or {})), dtype=float)) * lots
+    if target.shape != (n,):
+        raise ValueError(f"准则返回的目标持仓长度为 {target.shape}，应为 {n}")
+
+    # 收盘发出的目标持仓在下一根开盘成交
+    position = np.concatenate([[0.0], target[:-1]]) if n else target
+    previous = np.concatenate([[0.0], position[:-1]]) if n else position
+    trade = position - previous
+    fill_price = np.where(trade != 0, bars.open + slippage * np.sign(trade), np.nan)
+    # 逐根盈亏：隔夜持仓承担开盘跳空，开盘后的持仓承担开盘至收盘的变动，成交扣除滑点
+    prev_close = np.concatenate([[np.nan], bars.close[:-1]]) if n else bars.close
+    gap = np.where(previous != 0, previous * (bars.open - prev_close), 0.0)
+    pnl = np.nan_to_num(gap + position * (bars.close - bars.open) - np.abs(trade) * slippage) * multiplier
+    fees = np.nan_to_num(np.abs(trade) * (np.nan_to_num(fill_price) * multiplier * fee_rate + fee_per_lot))
+    equity = initial_cash + np.cumsum(pnl - fees)
+
+    trades = _trade_legs(bars, position, trade, multiplier)
+    base = np.concatenate([[initial_cash], equity[:-1]]) if n else equity
+    returns = np.divide(equity - base, base, out=np.zeros(n), where=base != 0)
+    drawdown = 1.0 - equity / np.maximum.accumulate(equity) if n else equity
+    std = returns.std()
+    stats = {
+        "bars": n,
+        "final_equity": float(equity[-1]) if n else initial_cash,
+        "total_pnl": float(pnl.sum()),
+        "total_fees": float(fees.sum()),
+        "total_return": float(equity[-1] / initial_cash - 1.0) if n else 0.0,
+        "max_drawdown": float(drawdown.max()) if n else 0.0,
+        "sharpe": float(returns.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR)) if std > 0 else 0.0,
+        "trades": len(trades),
+        "win_rate": float((trades["盈亏"] > 0).mean()) if len(trades) else 0.0,
+        "exposure": float((position != 0).mean()) if n else 0.0,
+        "final_position": float(position[-1]) if n else 0.0,
+    }
+    frame = pd.DataFrame({
+        "日期": bars.date, "持仓": position, "成交": trade, "成交价": fill_price,
+        "盈亏": pnl, "手续费": fees, "权益": equity,
+    })
+    return BacktestResult(frame, trades, stats)
+
+
+def backtest_file(filename, rule, params=None, **options):
+    """读取合约文件（.json 或 .kbar）并回测，options 同 `run_backtest`。"""
+    return run_backtest(read_contract_file(filename), rule, params, **options)
+
+
+def _parse_param(text):
+    name, _, value = text.partition("=")
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在合约文件上回测交易准则")
+    parser.add_argument("file", help="按合约输出的 .json 或 .kbar 文件")
+    parser.add_argument("--rule", choices=sorted(RULES), default="ma_cross", help="交易准则")
+    parser.add_argument("--param", action="append", default=[], help="准则参数，形如 fast=5，可重复")
+    parser.add_argument("--lots", type=float, default=1.0, help="每单位信号的手数")
+    parser.add_argument("--multiplier", type=float, default=1.0, help="合约乘数")
+    parser.add_argument("--fee-rate", type=float, default=0.0, help="按成交金额计的手续费率")
+    parser.add_argument("--fee-per-lot", type=float, default=0.0, help="每手固定手续费")
+    parser.add_argument("--slippage", type=float, default=0.0, help="每手滑点（价格点数）")
+    parser.add_argument("--initial-cash", type=float, default=DEFAULT_INITIAL_CASH, help="初始资金")
+    args = parser.parse_args(argv)
+
+    result = backtest_file(args.file, RULES[args.rule], dict(_parse_param(text) for text in args.param),
+                           lots=args.lots, multiplier=args.multiplier, fee_rate=args.fee_rate,
+                           fee_per_lot=args.fee_per_lot, slippage=args.slippage, initial_cash=args.initial_cash)
+    print(json.dumps(result.stats, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+
+JSON_SUFFIX = ".json"
+BAR_SUFFIX = ".kbar"
+CONTRACT_FILE_SUFFIXES = (JSON_SUFFIX, BAR_SUFFIX)
+OUTPUT_FORMATS = {"json": JSON_SUFFIX, "kbar": BAR_SUFFIX}
+
+# .kbar 文件布局：MAGIC | 各列数据块（按 64 字节对齐） | 尾部 JSON 描述 | 尾部长度(uint64) | MAGIC
+# 尾部描述记录行数以及每列的名称、dtype、偏移和可选的缺失值掩码偏移，数据块可直接内存映射
+MAGIC = b"KQBAR01\n"
+_ALIGN = 64
+_LENGTH = struct.Struct("<Q")
+DATE_COLUMN = "日期"
+
+
+def contract_file_suffix(output_format):
+    """返回输出格式对应的文件后缀。"""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"未知的输出格式: {output_format}")
+    return OUTPUT_FORMATS[output_format]
+
+
+def is_contract_file(file_name):
+    return file_name.endswith(CONTRACT_FILE_SUFFIXES)
+
+
+def _date_to_int(series):
+    """日期统一存为 YYYYMMDD 整数；已是整数时原样保留，无法解析时返回 None。"""
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return series.to_numpy(dtype=np.int64)
+    try:
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            dates = series
+        else:
+            text = series.astype(str).str.replace("-", "", regex=False).str.replace("/", "", regex=False)
+            dates = pd.to_datetime(text, format="%Y%m%d")
+    except (TypeError, ValueError):
+        return None
+    if dates.isna().any():
+        return None
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).to_numpy(dtype=np.int64)
+
+
+def _column_arrays(name, series):
+    """
+    将一列转换为可直接写盘的定长数组。
+
+    Returns:
+        tuple: (values, mask)，mask 为缺失值掩码，无缺失时为 None。
+    """
+    if name == DATE_COLUMN:
+        dates = _date_to_int(series)
+        if dates is not None:
+            return dates, None
+    if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(), None
+    if pd.api.types.infer_dtype(series, skipna=True) in ("integer", "floating", "mixed-integer-float", "empty"):
+        # 数值与缺失值混合的 object 列
+        return pd.to_numeric(series, errors="coerce").to_numpy(dtype=float), None
+    mask = series.isna().to_numpy()
+    text = series.astype(object).where(~mask, "").astype(str).to_numpy()
+    return text.astype(str), (mask if mask.any() else None)
+
+
+def save_bars(path, df):
+    """
+    将K线 DataFrame 按列写入 .kbar 文件：数值列保持原 dtype，日期存为整数，文本列存为定长字符串。
+    """
+    columns = []
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+
+        def write_block(array):
+            pad = (-f.tell()) % _ALIGN
+            f.write(b"\0" * pad)
+            offset = f.tell()
+            f.write(np.ascontiguousarray(array).tobytes())
+            return offset
+
+        for name in df.columns:
+            values, mask = _column_arrays(name, df[name])
+            entry = {"name": str(name), "dtype": values.dtype.str, "offset": write_block(values)}
+            if mask is not None:
+                entry["mask_offset"] = write_block(mask.astype(np.bool_))
+            columns.append(entry)
+        footer = json.dumps({"rows": len(df), "columns": columns}, ensure_ascii=False).encode("utf-8")
+        f.write(footer)
+        f.write(_LENGTH.pack(len(footer)))
+        f.write(MAGIC)
+    os.replace(temp_path, path)
+
+
+def read_bar_meta(path):
+    """读取 .kbar 文件的尾部描述。"""
+    with open(path, 'rb') as f:
+        f.seek(-(len(MAGIC) + _LENGTH.size), os.SEEK_END)
+        tail = f.read()
+        if tail[_LENGTH.size:] != MAGIC:
+            raise ValueError(f"不是有效的 {BAR_SUFFIX} 文件: {path}")
+        footer_length = _LENGTH.unpack(tail[:_LENGTH.size])[0]
+        f.seek(-(len(MAGIC) + _LENGTH.size + footer_length), os.SEEK_END)
+        return json.loads(f.read(footer_length).decode("utf-8"))
+
+
+def read_bar_columns(path, columns=None, mmap=True, meta=None):
+    """
+    以 numpy 数组读取 .kbar 文件中的指定列，mmap 为 True 时返回只读内存映射，不复制数据。
+
+    Returns:
+        dict: 列名到 (values, mask) 的映射，mask 为缺失值掩码或 None。
+    """
+    meta = meta or read_bar_meta(path)
+    rows = meta["rows"]
+    wanted = None if columns is None else set(columns)
+    result = {}
+    for entry in meta["columns"]:
+        if wanted is not None and entry["name"] not in wanted:
+            continue
+        dtype = np.dtype(entry["dtype"])
+        values = _read_block(path, dtype, entry["offset"], rows, mmap)
+        mask = None
+        if "mask_offset" in entry:
+            mask = _read_block(path, np.dtype(np.bool_), entry["mask_offset"], rows, mmap)
+        result[entry["name"]] = (values, mask)
+    return result
+
+
+def _read_block(path, dtype, offset, rows, mmap):
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(rows,))
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return np.fromfile(f, dtype=dtype, count=rows)
+
+
+def _to_series(values, mask):
+    if values.dtype.kind == "U":
+        series = pd.Series(np.asarray(values).astype(object))
+        if mask is not None:
+            series[np.asarray(mask)] = np.nan
+        return series
+    return pd.Series(np.array(values))
+
+
+def load_bars(path, columns=None, mmap=True, rows=None):
+    """读取 .kbar 文件为 DataFrame，列顺序与写入时一致；rows 为行切片或行号数组时只读取这些行。"""
+    arrays = read_bar_columns(path, columns, mmap)
+    if rows is not None:
+        arrays = {name: (values[rows], None if mask is None else mask[rows])
+                  for name, (values, mask) in arrays.items()}
+    return pd.DataFrame({name: _to_series(values, mask) for name, (values, mask) in arrays.items()})
+
+
+def read_contract_file(path, columns=None):
+    """按后缀读取按合约输出的文件：.kbar 直接按列读取，.json 使用 pd.read_json。"""
+    if path.endswith(BAR_SUFFIX):
+        return load_bars(path, columns)
+    df = pd.read_json(path)
+    return df if columns is None else df[[col for col in columns if col in df.columns]]
+
+
+def write_contract_file(path, items, output_format="json"):
+    """将一个合约的记录列表写入 JSON 或 .kbar 文件。"""
+    if output_format == "kbar":
+        save_bars(path, pd.DataFrame(items))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(items, f, ensure_ascii=False, indent=4)
+
+
+def export_bars_to_json(path, out_path=None):
+    """将 .kbar 文件导出为与流水线 JSON 相同结构的记录列表文件。"""
+    out_path = out_path or os.path.splitext(path)[0] + JSON_SUFFIX
+    records = load_bars(path, mmap=False).to_dict(orient='records')
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=4)
+    return out_path
@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import contextlib
+
+import StockFileTotallyProcess
+import StockSyntheticData
+from StockBarStore import is_contract_file, read_contract_file
+from StockContractStore import load_window, rebuild_json_store
+from StockPipelineMetrics import RunMetrics, collecting
+from StockProcessData import zen_include_process
+
+
+# 基准测试：用合成数据在不同规模下计时流水线各阶段、缠论处理、合约文件读取与K线图准备，
+# 并对每项结果计算摘要与基准摘要文件比对，更换更快的实现后可确认输出完全一致
+DEFAULT_SIZES = (1000, 10000, 100000)
+CASES = ("pipeline", "zen", "load", "chart")
+DEFAULT_GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark.golden")
+BENCH_CONTRACTS = 4  # 流水线基准中的合约个数，K线总数平均分配
+BARS_PER_WORKBOOK = 2500  # 流水线基准中每个工作簿大约包含的K线根数
+WINDOW_BARS = 250  # 区间读取基准读取的末尾K线根数
+
+
+def frame_digest(df):
+    """DataFrame 内容的摘要：列名与各列取值逐列序列化后计算 sha256，浮点数按 repr 精确比较。"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(col) for col in df.columns], ensure_ascii=False).encode('utf-8'))
+    for col in df.columns:
+        digest.update(json.dumps(df[col].tolist(), ensure_ascii=False, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def folder_digest(folder_path):
+    """目录下全部合约文件（按文件名排序）的文件名与字节内容的摘要。"""
+    digest = hashlib.sha256()
+    for file_name in sorted(file for file in os.listdir(folder_path) if is_contract_file(file)):
+        digest.update(file_name.encode('utf-8'))
+        with open(os.path.join(folder_path, file_name), 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def best_time(func, repeat):
+    """执行 repeat 次，返回 (最短耗时, 最后一次的结果)。"""
+    best, result = None, None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_pipeline(size, work_dir, seed, repeat):
+    """文件、内存与流水三种模式的全流程，逐阶段耗时取自运行报告；各模式的输出摘要必须一致。"""
+    input_folder = os.path.join(work_dir, f"archive_{size}")
+    if not os.path.isdir(input_folder):
+        StockSyntheticData.generate_archive(input_folder, size, BENCH_CONTRACTS,
+                                            max(1, size // BARS_PER_WORKBOOK), seed)
+    results = []
+    for mode, options in (("files", {}), ("in_memory", {"in_memory": True}), ("pipelined", {"pipelined": True})):
+        best = None
+        for _ in range(max(1, repeat)):
+            output_folder = os.path.join(work_dir, f"pipeline_{mode}_{size}")
+            shutil.rmtree(output_folder, ignore_errors=True)
+            metrics = RunMetrics()
+            with collecting(metrics), contextlib.redirect_stdout(io.StringIO()):
+                StockFileTotallyProcess.main(input_folder, output_folder, **options)
+            if best is None or metrics.seconds < best.seconds:
+                best = metrics
+        stages = {name: round(entry["seconds"], 6) for name, entry in best.stages.items()}
+        results.append({"case": f"pipeline_{mode}", "seconds": best.seconds, "stages": stages,
+                        "digest": folder_digest(output_folder)})
+    return results
+
+
+def bench_zen(size, work_dir, seed, repeat):
+    df = StockSyntheticData.generate_bars(size, seed=seed)
+    seconds, result = best_time(lambda: zen_include_process(df), repeat)
+    return [{"case": "zen", "seconds": seconds, "rows_out": len(result), "digest": frame_digest(result)}]
+
+
+def bench_load(size, work_dir, seed, repeat):
+    """整文件读取 .json 与 .kbar，以及按日期区间读取末尾 WINDOW_BARS 根K线（JSON 建有日期索引）。"""
+    folder = os.path.join(work_dir, f"contracts_{size}")
+    paths = {}
+    for output_format in ("json", "kbar"):
+        paths[output_format] = StockSyntheticData.generate_contract_files(folder, size, 1, seed, output_format)[0]
+    rebuild_json_store(paths["json"])
+    window_start = int(StockSyntheticData.trading_dates(size)[max(0, size - WINDOW_BARS)])
+    results = []
+    for output_format, path in paths.items():
+        seconds, df = best_time(lambda: read_contract_file(path), repeat)
+        results.append({"case": f"load_{output_format}", "seconds": seconds, "digest": frame_digest(df)})
+        seconds, df = best_time(lambda: load_window(path, window_start), repeat)
+        results.append({"case": f"load_window_{output_format}", "seconds": seconds, "digest": frame_digest(df)})
+    return results
+
+
+def bench_chart(size, work_dir, seed, repeat):
+    """缠论结果的K线图：创建（含笔、线段、中枢）并在 Agg 画布上绘制默认视口与全量视口。"""
+    try:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from StockChartRender import DEFAULT_VIEW_BARS, KlineChart
+    except ImportError:
+        print("未安装 matplotlib，跳过K线图基准")
+        return []
+    zen = zen_include_process(StockSyntheticData.generate_bars(size, seed=seed))
+
+    def render():
+        chart = KlineChart(zen, zen=True, show_bi=True, show_zhongshu=True)
+        canvas = FigureCanvasAgg(chart.fig)
+        chart.set_view(chart.n - DEFAULT_VIEW_BARS, chart.n)
+        canvas.draw()
+        chart.set_view(0, chart.n)
+        canvas.draw()
+        chart.fig.clear()
+        return chart
+
+    seconds, chart = best_time(render, repeat)
+    verts = hashlib.sha256(json.dumps([path.vertices.tolist() for path in chart.bodies.get_paths()]).encode())
+    return [{"case": "chart", "seconds": seconds, "digest": verts.hexdigest()}]
+
+
+_BENCHES = {"pipeline": bench_pipeline, "zen": bench_zen, "load": bench_load, "chart": bench_chart}
+
+
+def load_golden(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("digests", {})
+
+
+def save_golden(path, digests):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"version": 1, "digests": dict(sorted(digests.items()))}, f, ensure_ascii=False, indent=2)
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, cases=CASES, work_dir=None, seed=0, repeat=1, golden_path=None,
+                   update_golden=False):
+    """
+    逐规模、逐项运行基准，并与基准摘要比对（摘要键为 "项目/规模/种子"）。
+
+    Returns:
+        list: 每项一条结果，golden 为 "ok"、"mismatch" 或 "missing"。
+    """
+    golden_path = golden_path or DEFAULT_GOLDEN_PATH
+    golden = load_golden(golden_path)
+    own_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="kumquat_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    try:
+        for size in sizes:
+            for case in cases:
+                for result in _BENCHES[case](size, work_dir, seed, repeat):
+                    key = f"{result['case']}/{size}/{seed}"
+                    expected = golden.get(key)
+                    result.update(size=size, key=key,
+                                  golden="missing" if expected is None else
+                                  "ok" if expected == result["digest"] else "mismatch")
+                    if update_golden:
+                        golden[key] = result["digest"]
+                    results.append(result)
+                    print(f"{result['case']:<20}{size:>8} 根  {result['seconds']:>9.4f} 秒  {result['golden']}")
+    finally:
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if update_golden:
+        save_golden(golden_path, golden)
+        print(f"基准摘要已更新: {golden_path}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kumquat 基准测试（合成数据）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="K线根数规模")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES), help="要运行的基准项目")
+    parser.add_argument("--repeat", type=int, default=1, help="每项重复次数，取最短耗时")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument("--work-dir", default=None, help="合成数据与输出的工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN_PATH, help="基准摘要文件路径")
+    parser.add_argument("--update-golden", action="store_true", help="以本次结果更新基准摘要")
+    parser.add_argument("--report", default=None, help="将全部结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.cases, args.work_dir, args.seed, args.repeat, args.golden,
+                             args.update_golden)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "results": results}, f, ensure_ascii=False, indent=2)
+    mismatches = [result["key"] for result in results if result["golden"] == "mismatch"]
+    if mismatches and not args.update_golden:
+        print(f"与基准摘要不一致: {', '.join(mismatches)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
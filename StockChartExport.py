@@ -0,0 +1,144 @@
+import os
+import time
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from StockBarStore import BAR_SUFFIX
+from StockContractCatalog import ContractCatalog
+from StockContractStore import date_key
+from StockProcessData import ProcessType, process_json_file
+
+
+# 无界面批量导出K线图：使用 Agg 画布，不依赖 Tk 与显示器；合约按批分给进程池，
+# 每个工作进程只设置一次字体，逐个合约创建 KlineChart（实体、影线、分型、成交量均为批量集合）并保存为 PNG/SVG。
+EXPORT_FORMATS = ("png", "svg")
+DEFAULT_EXPORT_BARS = 250  # 每张图显示的末尾K线根数，0 为全部历史（按组聚合绘制）
+DEFAULT_DPI = 100
+DEFAULT_BATCH_SIZE = 8  # 每个任务包含的合约数
+CJK_FONTS = ["Microsoft YaHei", "SimHei", "Noto Sans CJK SC", "WenQuanYi Micro Hei", "DejaVu Sans"]
+
+
+def select_files(catalog, keyword=""):
+    """与查看器的筛选一致：关键字为空时为全部合约，为日期时为当日处于交易区间内的合约，否则按文件名关键字筛选。"""
+    keyword = (keyword or "").strip()
+    if not keyword:
+        return catalog.files()
+    if date_key(keyword) is not None:
+        return catalog.traded_on(keyword)
+    return catalog.filter(keyword)
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.rcParams['font.sans-serif'] = CJK_FONTS
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    # 服务器上常缺少中文字体，缺字只影响标题与坐标轴文字，不逐字告警
+    warnings.filterwarnings("ignore", message="Glyph .* missing from")
+
+
+def export_chart(path, output_path, zen=False, bars=DEFAULT_EXPORT_BARS, dpi=DEFAULT_DPI, figsize=(12, 8)):
+    """读取一个合约文件（可做缠论处理）并导出K线、成交量/持仓量与分型图，返回K线根数。"""
+    from StockChartRender import KlineChart
+
+    process_type = ProcessType.ZEN_INCLUDE if zen else ProcessType.NO_PROCESS
+    df = process_json_file(path, process_type)
+    chart = KlineChart(df, zen=zen, show_bi=zen, show_zhongshu=zen, figsize=figsize)
+    try:
+        # 未绑定画布时 set_view 中的重绘不做任何事，只在 savefig 时按图片格式绘制一次
+        chart.set_view(chart.n - bars if bars else 0, chart.n)
+        chart.ax_k.set_title(f"{os.path.splitext(os.path.basename(path))[0]} {'缠中论禅K线图' if zen else 'K线图'}")
+        chart.fig.savefig(output_path, dpi=dpi)
+    finally:
+        chart.fig.clear()
+    return chart.n
+
+
+def _export_batch(paths, output_folder, image_format, options):
+    """导出一批合约，返回 (合约文件, 图片路径, K线根数, 耗时, 错误信息) 列表，单个合约出错不影响其余合约。"""
+    results = []
+    for path in paths:
+        output_path = os.path.join(output_folder, os.path.splitext(os.path.basename(path))[0] + "." + image_format)
+        start = time.perf_counter()
+        try:
+            rows, error = export_chart(path, output_path, **options), None
+        except Exception as e:
+            rows, error = 0, str(e)
+        results.append((path, output_path, rows, time.perf_counter() - start, error))
+    return results
+
+
+def export_charts(folder_path, output_folder, keyword="", image_format="png", workers=1,
+                  batch_size=DEFAULT_BATCH_SIZE, **options):
+    """
+    导出数据目录中全部（或筛选出的）合约的K线图。
+
+    Args:
+        folder_path (str): 合约文件目录。
+        output_folder (str): 图片输出目录，图片以合约名命名。
+        keyword (str): 筛选关键字，见 `select_files`。
+        image_format (str): png 或 svg。
+        workers (int): 并行进程数，1 为在当前进程中执行，None 或 0 时使用全部 CPU 核心。
+        batch_size (int): 每个任务包含的合约数。
+        options: 传给 `export_chart` 的 zen、bars、dpi、figsize。
+
+    Returns:
+        list: 每个合约一条 (合约文件, 图片路径, K线根数, 耗时, 错误信息)。
+    """
+    if image_format not in EXPORT_FORMATS:
+        raise ValueError(f"未知的图片格式: {image_format}")
+    # 打开时与数据目录同步，目录建立后新增或删除的合约文件也能正确导出或跳过
+    catalog = ContractCatalog.open(folder_path)
+    # 同一合约同时有 .json 与 .kbar 时只导出一张，优先读取列式的 .kbar
+    files = {}
+    for file in select_files(catalog, keyword):
+        contract = os.path.splitext(file)[0]
+        if contract not in files or file.endswith(BAR_SUFFIX):
+            files[contract] = file
+    paths = [os.path.join(folder_path, file) for file in sorted(files.values())]
+    os.makedirs(output_folder, exist_ok=True)
+    batches = [paths[i:i + max(1, batch_size)] for i in range(0, len(paths), max(1, batch_size))]
+    if not workers:
+        workers = os.cpu_count() or 1
+    print(f"共 {len(paths)} 个合约待导出，{min(workers, len(batches)) or 1} 个进程")
+
+    start = time.perf_counter()
+    results = []
+    if workers <= 1 or len(batches) <= 1:
+        _init_worker()
+        for batch in batches:
+            results.extend(_export_batch(batch, output_folder, image_format, options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [executor.submit(_export_batch, batch, output_folder, image_format, options)
+                       for batch in batches]
+            for future in as_completed(futures):
+                results.extend(future.result())
+    results.sort(key=lambda result: result[0])
+
+    errors = [result for result in results if result[4] is not None]
+    for path, _, _, _, error in errors:
+        print(f"导出失败 {os.path.basename(path)}: {error}")
+    print(f"已导出 {len(results) - len(errors)} 张K线图到 {output_folder}，耗时 {time.perf_counter() - start:.2f} 秒")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面批量导出合约K线图")
+    parser.add_argument("folder", help="合约文件目录")
+    parser.add_argument("output", help="图片输出目录")
+    parser.add_argument("--filter", default="", help="文件名关键字（区分大小写），或日期（导出当日在交易的合约）")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="png", help="图片格式")
+    parser.add_argument("--zen", action="store_true", help="做缠论处理并绘制分型、笔、线段与中枢")
+    parser.add_argument("--bars", type=int, default=DEFAULT_EXPORT_BARS, help="显示的末尾K线根数，0 为全部")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="PNG 分辨率")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数，0 为使用全部 CPU 核心")
+    args = parser.parse_args(argv)
+
+    results = export_charts(args.folder, args.output, args.filter, args.format, args.workers,
+                            zen=args.zen, bars=args.bars, dpi=args.dpi)
+    return 1 if any(result[4] is not None for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,246 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+
+from StockProcessData import build_zen_structure, fenxing_codes
+
+
+DEFAULT_VIEW_BARS = 120  # 打开K线图时显示的K线根数
+MAX_DRAWN_BARS = 600  # 视口内超过该根数时按组聚合绘制
+MARKER_MAX_BARS = 200  # 视口内K线不超过该根数时才绘制持仓量折线的圆点
+ZEN_COLOR = "goldenrod"
+RISE_COLOR = "red"
+FALL_COLOR = "green"
+
+
+def _rect_verts(x, y0, y1, half_width):
+    """批量生成矩形顶点，返回形状为 (n, 4, 2) 的数组。"""
+    left, right = x - half_width, x + half_width
+    return np.stack([
+        np.column_stack([left, y0]), np.column_stack([left, y1]),
+        np.column_stack([right, y1]), np.column_stack([right, y0]),
+    ], axis=1)
+
+
+def downsample_bars(arrays, start, stop, max_bars):
+    """
+    取 [start, stop) 区间的K线，根数超过 max_bars 时每 k 根聚合为一根：
+    开盘取首根、收盘取末根、最高/最低取极值、成交量求和、持仓量取末根。
+    分型标记保留组内最高价所在K线的顶分型与最低价所在K线的底分型，两者都有时记为 2。
+    分组边界按 k 的整数倍对齐，平移视口时聚合结果保持稳定。
+
+    Returns:
+        tuple: (x, 聚合后的数组字典, k)，x 为每组在原始K线序号坐标下的中心位置。
+    """
+    n = len(arrays["open"])
+    k = max(1, -(-(stop - start) // max_bars))
+    if k == 1:
+        return np.arange(start, stop, dtype=float), {name: values[start:stop] for name, values in arrays.items()}, 1
+    first = start // k * k
+    group_starts = np.arange(first, stop, k)
+    group_ends = np.minimum(group_starts + k, n)
+    offsets = group_starts - first
+    span = slice(first, group_ends[-1])
+    high, low, fenxing = arrays["high"][span], arrays["low"][span], arrays["fenxing"][span]
+    group_high = np.fmax.reduceat(high, offsets)
+    group_low = np.fmin.reduceat(low, offsets)
+    group = np.arange(len(high)) // k
+    top = np.logical_or.reduceat((fenxing == 1) & (high == group_high[group]), offsets)
+    bottom = np.logical_or.reduceat((fenxing == -1) & (low == group_low[group]), offsets)
+    result = {
+        "open": arrays["open"][group_starts],
+        "close": arrays["close"][group_ends - 1],
+        "high": group_high,
+        "low": group_low,
+        "volume": np.add.reduceat(np.nan_to_num(arrays["volume"][span]), offsets),
+        "position": arrays["position"][group_ends - 1],
+        "fenxing": np.where(top & bottom, 2, np.where(top, 1, np.where(bottom, -1, 0))).astype(np.int8),
+    }
+    return (group_starts + group_ends - 1) / 2.0, result, k
+
+
+# 与图形无关的绘图数据：各列数值数组（含分型编码）、是否有成交量/持仓量、日期文本、笔线段中枢结构（未绘制时为 None）
+ChartData = namedtuple("ChartData", ["arrays", "has_volume", "dates", "structure"])
+
+
+def prepare_chart_data(df, show_bi=False, show_zhongshu=False):
+    """KlineChart 中耗时的数据准备：数组转换与笔、线段、中枢构建。不创建 matplotlib 对象，可在后台线程执行。"""
+    n = len(df)
+
+    def column(name):
+        if name not in df.columns:
+            return np.full(n, np.nan)
+        return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+
+    arrays = {
+        "open": column("开盘价"), "close": column("收盘价"),
+        "high": column("最高价"), "low": column("最低价"),
+        "volume": column("成交量"), "position": column("持仓量"),
+        "fenxing": (fenxing_codes(df["顶底分型"]) if show_bi and "顶底分型" in df.columns
+                    else np.zeros(n, dtype=np.int8)),
+    }
+    structure = (build_zen_structure(df) if (show_bi or show_zhongshu) and "顶底分型" in df.columns
+                 else None)
+    return ChartData(arrays, "成交量" in df.columns and "持仓量" in df.columns,
+                     df["日期"].astype(str).to_numpy() if "日期" in df.columns else None, structure)
+
+
+class KlineChart:
+    """
+    视口化的K线图：实体、影线、分型标记、成交量各用一个集合批量绘制，只绘制视口内的K线，
+    视口过宽时按组聚合降采样。横坐标始终为原始K线序号，平移/缩放只更新集合数据并重绘当前视口。
+    不依赖 GUI，可嵌入 Tk 画布，也可在 Agg 后端下直接导出图片。
+    matplotlib 对象不是线程安全的，图形须在使用它的线程（Tk 主线程）中创建；
+    可先在后台线程用 `prepare_chart_data` 准备好 data 再传入。
+    """
+
+    def __init__(self, df, zen=False, show_bi=False, show_zhongshu=False, figsize=(12, 8),
+                 max_bars=MAX_DRAWN_BARS, data=None):
+        if data is None:
+            data = prepare_chart_data(df, show_bi, show_zhongshu)
+        self.df = df
+        self.n = len(df)
+        self.zen = zen
+        self.show_bi = show_bi
+        self.max_bars = max_bars
+        self.view = (0, 0)
+        self.arrays = data.arrays
+        self.has_volume = data.has_volume
+        self.dates = data.dates
+
+        self.fig = Figure(figsize=figsize)
+        self.ax_k, self.ax_pos = self.fig.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [4, 1]})
+        ax_k, ax_pos = self.ax_k, self.ax_pos
+
+        self.wicks = LineCollection([], linewidths=1, zorder=1)
+        self.bodies = PolyCollection([], zorder=2)
+        self.markers = PolyCollection([], zorder=5)
+        for collection in (self.wicks, self.bodies, self.markers):
+            ax_k.add_collection(collection)
+
+        # 笔、线段与中枢的端点很少，整体绘制一次，由 matplotlib 按视口裁剪
+        structure = data.structure
+        if structure is not None:
+            high, low = self.arrays["high"], self.arrays["low"]
+            if show_bi:
+                ax_k.plot(structure.bi_idx, np.where(structure.bi_is_top, high[structure.bi_idx], low[structure.bi_idx]),
+                          color="purple", linewidth=1, zorder=4)
+                ax_k.plot(structure.seg_idx,
+                          np.where(structure.seg_is_top, high[structure.seg_idx], low[structure.seg_idx]),
+                          color="blue", linewidth=2, zorder=4)
+            if show_zhongshu and len(structure.pivot_start):
+                pivot_x = (structure.pivot_start + structure.pivot_end) / 2.0
+                pivot_half = (structure.pivot_end - structure.pivot_start) / 2.0
+                ax_k.add_collection(PolyCollection(
+                    _rect_verts(pivot_x, structure.pivot_low, structure.pivot_high, pivot_half),
+                    facecolors="orange", edgecolors="darkorange", alpha=0.25, zorder=0))
+
+        ax_k.set_title("K线图")
+        ax_k.set_ylabel("价格")
+        ax_k.grid(axis="y")
+        self.ax_k_right = self._right_axis(ax_k, "价格")
+
+        self.volume_bars = None
+        self.position_line = None
+        self.ax_pos_right = None
+        if self.has_volume:
+            self.volume_bars = PolyCollection([], facecolors="#888888", alpha=0.6, label="成交量")
+            ax_pos.add_collection(self.volume_bars)
+            self.position_line, = ax_pos.plot([], [], color="blue", marker="o", markersize=5, label="持仓量")
+            ax_pos.set_ylabel("成交/持仓")
+            ax_pos.legend(loc="upper left", fontsize=8)
+            ax_pos.grid(axis="y")
+            self.ax_pos_right = self._right_axis(ax_pos, "成交/持仓")
+        else:
+            ax_pos.text(0.5, 0.5, "无成交量/持仓量数据", ha="center", va="center", fontsize=12,
+                        transform=ax_pos.transAxes)
+
+    @staticmethod
+    def _right_axis(ax, label):
+        # 右侧刻度，范围在每次更新视口后与左侧同步
+        right = ax.twinx()
+        right.set_ylabel(label, rotation=270, labelpad=15)
+        right.yaxis.set_label_position("right")
+        right.yaxis.set_ticks_position("right")
+        right.tick_params(axis="y", direction="in", pad=2)
+        right.grid(False)
+        return right
+
+    @staticmethod
+    def _sync_right_axis(ax, right):
+        # 先设刻度再设范围，避免超出范围的刻度把右侧范围撑大
+        right.set_yticks(ax.get_yticks())
+        right.set_ylim(ax.get_ylim())
+
+    def set_view(self, start, stop):
+        """显示原始K线序号 [start, stop) 区间，超出范围时自动收缩到数据内。"""
+        width = max(1, int(round(stop - start)))
+        width = min(width, max(self.n, 1))
+        start = int(round(min(max(start, 0), max(self.n - width, 0))))
+        stop = min(start + width, self.n)
+        self.view = (start, stop)
+        if self.n == 0:
+            return
+
+        x, bars, k = downsample_bars(self.arrays, start, stop, self.max_bars)
+        open_p, close_p, high, low = bars["open"], bars["close"], bars["high"], bars["low"]
+        if self.zen:
+            colors = ZEN_COLOR
+        else:
+            colors = np.where(close_p > open_p, RISE_COLOR, FALL_COLOR).tolist()
+        self.bodies.set_verts(_rect_verts(x, np.fmin(open_p, close_p), np.fmax(open_p, close_p), 0.2 * k))
+        self.bodies.set_facecolor(colors)
+        self.bodies.set_edgecolor(colors)
+        self.wicks.set_segments(np.stack([np.column_stack([x, low]), np.column_stack([x, high])], axis=1))
+        self.wicks.set_color(colors)
+
+        # 分型标记：顶分型在上方画红色小矩形，底分型在下方画绿色小矩形（聚合时 2 表示两者都有）
+        fenxing = bars["fenxing"]
+        span = high - low
+        top, bottom = (fenxing == 1) | (fenxing == 2), (fenxing == -1) | (fenxing == 2)
+        marker_x = np.concatenate([x[top], x[bottom]])
+        marker_y0 = np.concatenate([high[top] + span[top] * 0.03, low[bottom] - span[bottom] * 0.09])
+        marker_h = np.concatenate([span[top], span[bottom]]) * 0.06
+        self.markers.set_verts(_rect_verts(marker_x, marker_y0, marker_y0 + marker_h, 0.12 * k))
+        self.markers.set_color([RISE_COLOR] * int(top.sum()) + [FALL_COLOR] * int(bottom.sum()))
+
+        self.ax_k.set_xlim(start - 0.5, stop - 0.5)
+        finite_low, finite_high = low[np.isfinite(low)], high[np.isfinite(high)]
+        price_low = finite_low.min() if len(finite_low) else 0.0
+        price_high = finite_high.max() if len(finite_high) else 1.0
+        pad = (price_high - price_low) * 0.1 or 1.0
+        self.ax_k.set_ylim(price_low - pad, price_high + pad)
+        self._sync_right_axis(self.ax_k, self.ax_k_right)
+
+        if self.has_volume:
+            volume, position = bars["volume"], bars["position"]
+            self.volume_bars.set_verts(_rect_verts(x, np.zeros(len(x)), np.nan_to_num(volume), 0.3 * k))
+            self.position_line.set_data(x, position)
+            self.position_line.set_marker("o" if len(x) <= MARKER_MAX_BARS else "")
+            top_value = np.nanmax(np.concatenate([np.nan_to_num(volume), np.nan_to_num(position)]))
+            self.ax_pos.set_ylim(0, top_value * 1.1 or 1.0)
+            self._sync_right_axis(self.ax_pos, self.ax_pos_right)
+
+        if self.dates is not None:
+            step = max(1, -(-(stop - start) // 20))
+            ticks = np.arange(-(-start // step) * step, stop, step)
+            self.ax_pos.set_xticks(ticks)
+            self.ax_pos.set_xticklabels(self.dates[ticks], rotation=45, fontsize=8)
+        self.fig.canvas.draw_idle()
+
+    def pan(self, bars):
+        """视口平移 bars 根K线（正数向右）。"""
+        start, stop = self.view
+        self.set_view(start + bars, stop + bars)
+
+    def zoom(self, factor, center=None):
+        """以 center（K线序号，默认视口中心）为中心缩放视口宽度，factor 小于 1 为放大。"""
+        start, stop = self.view
+        center = (start + stop) / 2.0 if center is None else center
+        width = max(5.0, (stop - start) * factor)
+        ratio = (center - start) / max(stop - start, 1)
+        new_start = center - width * ratio
+        self.set_view(new_start, new_start + width)
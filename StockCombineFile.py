@@ -1,40 +1,271 @@
 import os
+import sys
 import json
+import time
+import shutil
+
+from StockBarStore import contract_file_suffix, write_contract_file
+from StockContractCatalog import ContractCatalog
+from StockContractStore import encode_json_record, merge_contract_file
+from StockPipelineMetrics import file_size, record_file
 
 
 DEFAULT_FOLDER = r"E:\stock_json"
+SPILL_FOLDER = ".combine_spill"  # 流式合并的溢出文件目录
+
+def safe_contract_name(contract):
+    """将合约名中的路径分隔符替换为下划线，作为输出文件名。"""
+    return str(contract).replace('/', '_').replace('\\', '_')
+
+
+def group_records_by_contract(records, contract_map):
+    """将记录按 "合约" 字段追加到 contract_map，合约为空的记录跳过。"""
+    for item in records:
+        contract = item.get("合约")
+        if not contract:
+            continue
+        contract_map.setdefault(safe_contract_name(contract), []).append(item)
+
+
+def save_contract_map(contract_map, folder_path, output_format="json", merge=False, catalog=None):
+    """
+    将分组后的数据写入以合约名为文件名的文件，output_format 为 "json" 或列式二进制 "kbar"。
+    merge 为 True 时按日期合并进已有文件（去重并只重写变化的尾部），而不是覆盖。
+    给出 catalog 时同时登记写出的合约文件。
+    """
+    suffix = contract_file_suffix(output_format)
+    for contract, items in contract_map.items():
+        file_name = f"{contract}{suffix}"
+        out_path = os.path.join(folder_path, file_name)
+        start = time.perf_counter()
+        if merge:
+            count = merge_contract_file(out_path, items)
+            if catalog is not None:
+                catalog.update(file_name)
+            print(f"已合并: {out_path}（重写 {count} 条）")
+        else:
+            write_contract_file(out_path, items, output_format)
+            if catalog is not None:
+                catalog.update(file_name, items)
+            print(f"已写入: {out_path}")
+        record_file("combine", out_path, rows_out=len(items), bytes_written=file_size(out_path),
+                    seconds=time.perf_counter() - start)
+
 
-def group_by_contract_and_save(folder_path):
+def write_json_records(path, records):
+    """逐条写出记录，输出与 json.dump(records, f, ensure_ascii=False, indent=4) 完全一致，无需整体驻留内存。"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        empty = True
+        for item in records:
+            f.write('\n' if empty else ',\n')
+            f.write(encode_json_record(item))
+            empty = False
+        f.write(']' if empty else '\n]')
+
+
+def append_json_records(path, records):
+    """
+    在 `write_json_records` 写出的文件末尾追加记录，结果与一次性写出全部记录完全一致，
+    只改写文件结尾的 "]"，已写出的部分不再读取。
+    """
+    with open(path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        f.seek(max(end - 2, 0))
+        empty = f.read() == b'[]'
+        position = end - 1 if empty else end - 2
+        f.seek(position)
+        f.truncate()
+        for item in records:
+            f.write((b'\n' if empty else b',\n') + encode_json_record(item).encode('utf-8'))
+            empty = False
+        f.write(b']' if empty else b'\n]')
+
+
+class ContractAppender:
     """
-    遍历指定文件夹下所有 .temp 文件，按 "合约" 字段归类数据，
-    并将每类数据写入以合约名为文件名的 .json 文件。
+    逐批写出按合约分组的记录，供流水线边处理边输出：
+    JSON 合约文件在本次运行中首次出现时新建，之后每批追加到末尾，任何时刻都是完整的 JSON 文件，
+    最终内容与一次性写出完全一致；kbar 为定长列式布局，记录缓存到 finish() 时写出；
+    merge 为 True 时每批按日期合并进已有文件。给出 catalog 时同时登记写出的合约文件。
+    """
+
+    def __init__(self, folder_path, output_format="json", merge=False, catalog=None):
+        self.folder_path = folder_path
+        self.output_format = output_format
+        self.suffix = contract_file_suffix(output_format)
+        self.merge = merge
+        self.catalog = catalog
+        self.started = set()
+        self.pending = {}  # kbar 非合并模式下缓存的记录
+
+    def add_contract_map(self, contract_map):
+        """写出一批已按合约分组的记录，同一合约的各批按加入顺序拼接。"""
+        for contract, items in contract_map.items():
+            if not items:
+                continue
+            file_name = f"{contract}{self.suffix}"
+            out_path = os.path.join(self.folder_path, file_name)
+            if self.output_format != "json" and not self.merge:
+                self.pending.setdefault(contract, []).extend(items)
+                continue
+            start = time.perf_counter()
+            size_before = file_size(out_path) if contract in self.started or self.merge else 0
+            if self.merge:
+                merge_contract_file(out_path, items)
+                if self.catalog is not None:
+                    self.catalog.update(file_name)
+            elif contract in self.started:
+                append_json_records(out_path, items)
+                if self.catalog is not None:
+                    self.catalog.extend(file_name, items)
+            else:
+                write_json_records(out_path, items)
+                if self.catalog is not None:
+                    self.catalog.update(file_name, items)
+                print(f"已写入: {out_path}")
+            self.started.add(contract)
+            record_file("combine", out_path, rows_out=len(items), bytes_written=max(file_size(out_path) - size_before, 0),
+                        seconds=time.perf_counter() - start)
+
+    def finish(self):
+        """写出缓存的 kbar 合约文件。"""
+        save_contract_map(self.pending, self.folder_path, self.output_format, catalog=self.catalog)
+        self.pending = {}
+
+
+class StreamingCombiner:
+    """
+    内存受限的按合约合并：读取时将记录按合约放入缓冲区（以 JSON 行保存），
+    缓冲总量达到 memory_budget 字节时写入各合约的溢出文件，结束时按合约依次合并溢出文件与剩余缓冲并输出。
+    峰值内存约为预算加单个输入文件，与归档总量无关。
+    """
+
+    def __init__(self, spill_folder, memory_budget):
+        self.spill_folder = spill_folder
+        self.memory_budget = memory_budget
+        self.order = {}  # 合约首次出现的顺序，同时作为溢出文件名
+        self.counts = {}  # 各合约加入的记录条数
+        self.buffers = {}
+        self.buffered_bytes = 0
+        shutil.rmtree(spill_folder, ignore_errors=True)
+        os.makedirs(spill_folder, exist_ok=True)
+
+    def _add(self, contract, item):
+        line = json.dumps(item, ensure_ascii=False)
+        buffer = self.buffers.get(contract)
+        if buffer is None:
+            self.order.setdefault(contract, len(self.order))
+            buffer = self.buffers[contract] = []
+        buffer.append(line)
+        self.counts[contract] = self.counts.get(contract, 0) + 1
+        self.buffered_bytes += sys.getsizeof(line)
+        if self.buffered_bytes >= self.memory_budget:
+            self.flush()
+
+    def add_records(self, records):
+        """按 "合约" 字段加入记录，合约为空的记录跳过。"""
+        for item in records:
+            contract = item.get("合约")
+            if contract:
+                self._add(safe_contract_name(contract), item)
+
+    def add_contract_map(self, contract_map):
+        """加入已按合约分组的记录。"""
+        for contract, items in contract_map.items():
+            for item in items:
+                self._add(contract, item)
+
+    def _spill_path(self, contract):
+        return os.path.join(self.spill_folder, f"{self.order[contract]}.jsonl")
+
+    def flush(self):
+        """将全部缓冲追加写入溢出文件。"""
+        for contract, lines in self.buffers.items():
+            with open(self._spill_path(contract), 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines))
+                f.write('\n')
+        self.buffers = {}
+        self.buffered_bytes = 0
+
+    def _iter_records(self, contract):
+        spill_path = self._spill_path(contract)
+        if os.path.exists(spill_path):
+            with open(spill_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+        for line in self.buffers.pop(contract, []):
+            yield json.loads(line)
+
+    def finish(self, output_folder, output_format="json", merge=False, catalog=None):
+        """
+        按合约合并并写出最终文件（merge 为 True 时按日期合并进已有文件），完成后删除溢出目录。
+        给出 catalog 时同时登记写出的合约文件。
+        """
+        suffix = contract_file_suffix(output_format)
+        for contract in self.order:
+            file_name = f"{contract}{suffix}"
+            out_path = os.path.join(output_folder, file_name)
+            start = time.perf_counter()
+            if merge:
+                count = merge_contract_file(out_path, self._iter_records(contract))
+                if catalog is not None:
+                    catalog.update(file_name)
+                print(f"已合并: {out_path}（重写 {count} 条）")
+            else:
+                records = self._iter_records(contract)
+                if catalog is not None:
+                    records = catalog.track(file_name, records)
+                if output_format == "json":
+                    write_json_records(out_path, records)
+                else:
+                    write_contract_file(out_path, list(records), output_format)
+                print(f"已写入: {out_path}")
+            record_file("combine", out_path, rows_out=self.counts[contract], bytes_written=file_size(out_path),
+                        seconds=time.perf_counter() - start)
+        shutil.rmtree(self.spill_folder, ignore_errors=True)
+
+
+def group_by_contract_and_save(folder_path, output_format="json", memory_budget=None, merge=False):
+    """
+    遍历指定文件夹下所有 .temp 文件（按文件名排序），按 "合约" 字段归类数据，
+    并将每类数据写入以合约名为文件名的 .json（或 .kbar）文件，同时更新数据目录下的合约目录。
+    指定 memory_budget（字节）时使用 `StreamingCombiner` 流式合并，峰值内存不随归档总量增长；
+    merge 为 True 时按日期合并进已有的合约文件，保留历史数据。
     """
     contract_map = {}
+    combiner = None
+    if memory_budget:
+        combiner = StreamingCombiner(os.path.join(folder_path, SPILL_FOLDER), memory_budget)
+    catalog = ContractCatalog.open(folder_path)
 
     # 遍历所有 .temp 文件
-    for file in os.listdir(folder_path):
+    for file in sorted(os.listdir(folder_path)):
         if file.endswith('.temp'):
             file_path = os.path.join(folder_path, file)
+            start = time.perf_counter()
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
             except Exception as e:
                 print(f"读取失败: {file}, 错误: {e}")
+                record_file("combine", file_path, e, bytes_read=file_size(file_path))
                 continue
 
-            for item in data:
-                contract = item.get("合约")
-                if not contract:
-                    continue
-                safe_contract = str(contract).replace('/', '_').replace('\\', '_')
-                contract_map.setdefault(safe_contract, []).append(item)
+            if combiner is not None:
+                combiner.add_records(data)
+            else:
+                group_records_by_contract(data, contract_map)
+            record_file("combine", file_path, rows_in=len(data), bytes_read=file_size(file_path),
+                        seconds=time.perf_counter() - start)
+            del data
 
-    # 写入分组后的 .json 文件
-    for contract, items in contract_map.items():
-        out_path = os.path.join(folder_path, f"{contract}.json")
-        with open(out_path, 'w', encoding='utf-8') as f:
-            json.dump(items, f, ensure_ascii=False, indent=4)
-        print(f"已写入: {out_path}")
+    # 写入分组后的合约文件
+    if combiner is not None:
+        combiner.finish(folder_path, output_format, merge, catalog)
+    else:
+        save_contract_map(contract_map, folder_path, output_format, merge, catalog)
+    catalog.save()
     # 删除所有 .temp 文件
     for file in os.listdir(folder_path):
         if file.endswith('.temp'):
@@ -46,8 +277,8 @@ def group_by_contract_and_save(folder_path):
                 print(f"删除{temp_path}失败: {e}")
 
 
-def main(folder_path=DEFAULT_FOLDER):
-    group_by_contract_and_save(folder_path)
+def main(folder_path=DEFAULT_FOLDER, output_format="json", memory_budget=None, merge=False):
+    group_by_contract_and_save(folder_path, output_format, memory_budget, merge)
 
 
 if __name__ == "__main__":
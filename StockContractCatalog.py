@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import time
+
+import numpy as np
+
+from StockBarStore import BAR_SUFFIX, DATE_COLUMN, is_contract_file, load_bars, read_bar_columns
+from StockContractStore import date_key, load_index
+
+
+# 数据目录下的合约目录：记录每个合约文件的合约代码、品种、交割月份、日期范围与行数，
+# 由合并阶段维护，查看器与命令行的列表、筛选和按日期查询直接使用，无需逐个打开文件
+CATALOG_NAME = "contracts.catalog"
+# 目录文件的修改时间记为数据目录的修改时间，两者一致时打开目录无需逐个 stat 合约文件；
+# 数据目录在该秒数内刚被改动时不记录，以免同一时间刻度内的后续改动被漏掉
+RACY_SECONDS = 2
+_CONTRACT_PATTERN = re.compile(r"^([A-Za-z]+)(\d+)$")
+
+
+def parse_contract(contract):
+    """拆分合约代码为 (品种, 交割月份)，如 "cu2305" -> ("cu", "2305")；无法拆分时交割月份为空。"""
+    match = _CONTRACT_PATTERN.match(contract)
+    return (match.group(1), match.group(2)) if match else (contract, "")
+
+
+class ContractCatalog:
+    """
+    合约目录，保存为数据目录下的 contracts.catalog。
+    条目以文件名为键，登记后在 save() 时补记文件大小与修改时间，refresh() 据此发现目录外的改动。
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, CATALOG_NAME)
+        self.entries = {}
+        self._arrays = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get("files", {})
+
+    @classmethod
+    def open(cls, folder_path, refresh=False):
+        """
+        读取目录。数据目录自上次同步后没有增删、改名文件时直接使用已有条目，只需两次 stat；
+        否则或 refresh 为 True 时与数据目录同步（见 `refresh`），目录文件不存在或有改动时保存。
+        原地改写合约文件不改变数据目录的修改时间，由其他程序原地改写后需传入 refresh=True。
+        """
+        catalog = cls(folder_path)
+        if refresh or not catalog._synced():
+            if catalog.refresh() or not os.path.exists(catalog.path):
+                catalog.save()
+            else:
+                catalog._stamp()
+        return catalog
+
+    def _synced(self):
+        try:
+            return os.stat(self.path).st_mtime_ns == os.stat(self.folder_path).st_mtime_ns
+        except OSError:
+            return False
+
+    def _stamp(self):
+        """将数据目录的修改时间记到目录文件上（不改变数据目录）；数据目录刚被改动时记为不一致，留待下次打开时同步。"""
+        folder_mtime = os.stat(self.folder_path).st_mtime_ns
+        stat = os.stat(self.path)
+        racy = RACY_SECONDS * 1_000_000_000
+        if time.time_ns() - folder_mtime < racy:
+            folder_mtime -= racy  # 错开足够远，时间精度较粗的文件系统上也不会被取整为相等
+        if stat.st_mtime_ns != folder_mtime:
+            os.utime(self.path, ns=(stat.st_atime_ns, folder_mtime))
+
+    def _set(self, file_name, start, end, rows):
+        contract = os.path.splitext(file_name)[0]
+        product, delivery = parse_contract(contract)
+        self.entries[file_name] = {
+            "contract": contract, "product": product, "delivery": delivery,
+            "start": start, "end": end, "rows": rows,
+        }
+        self._arrays = None
+
+    def track(self, file_name, records):
+        """透传记录，遍历结束时按其内容登记该文件，用于写出时顺带统计。"""
+        start = end = None
+        rows = 0
+        for item in records:
+            rows += 1
+            key = date_key(item.get(DATE_COLUMN))
+            if key is not None:
+                start = key if start is None or key < start else start
+                end = key if end is None or key > end else end
+            yield item
+        self._set(file_name, start, end, rows)
+
+    def extend(self, file_name, records):
+        """登记追加到合约文件末尾的记录：与已有条目的日期范围合并、行数累加。"""
+        entry = self.entries.get(file_name)
+        if entry is None:
+            self.update(file_name, records)
+            return
+        start, end, rows = entry["start"], entry["end"], entry["rows"]
+        for item in records:
+            rows += 1
+            key = date_key(item.get(DATE_COLUMN))
+            if key is not None:
+                start = key if start is None or key < start else start
+                end = key if end is None or key > end else end
+        self._set(file_name, start, end, rows)
+
+    def update(self, file_name, records=None):
+        """登记一个合约文件；未给出记录时从文件读取（优先使用 .kbar 日期列或 JSON 日期索引）。"""
+        if records is not None:
+            for _ in self.track(file_name, records):
+                pass
+            return
+        path = os.path.join(self.folder_path, file_name)
+        dates = None
+        if file_name.endswith(BAR_SUFFIX):
+            values, _ = read_bar_columns(path, [DATE_COLUMN]).get(DATE_COLUMN, (None, None))
+            if values is not None and values.dtype.kind in "iu":
+                dates = values
+        else:
+            index = load_index(path)
+            if index is not None:
+                dates = index[0]
+        if dates is None:
+            if file_name.endswith(BAR_SUFFIX):
+                records = load_bars(path, mmap=False).to_dict(orient='records')
+            else:
+                with open(path, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            self.update(file_name, records)
+            return
+        # 没有可解析日期的记录在索引中记为 -1，不计入日期范围
+        dated = dates[dates >= 0]
+        self._set(file_name, int(dated.min()) if len(dated) else None,
+                  int(dated.max()) if len(dated) else None, len(dates))
+
+    def remove(self, file_name):
+        if self.entries.pop(file_name, None) is not None:
+            self._arrays = None
+
+    def refresh(self):
+        """
+        与数据目录同步：登记新增或被改动的合约文件，移除已删除的文件。
+
+        Returns:
+            bool: 目录是否有变化。
+        """
+        files = {file for file in os.listdir(self.folder_path) if is_contract_file(file)}
+        changed = False
+        for file_name in [name for name in self.entries if name not in files]:
+            self.remove(file_name)
+            changed = True
+        for file_name in sorted(files):
+            entry = self.entries.get(file_name)
+            stat = os.stat(os.path.join(self.folder_path, file_name))
+            if entry is None or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+                self.update(file_name)
+                changed = True
+        return changed
+
+    def save(self):
+        for file_name, entry in self.entries.items():
+            path = os.path.join(self.folder_path, file_name)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                entry["size"] = stat.st_size
+                entry["mtime_ns"] = stat.st_mtime_ns
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "files": self.entries}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self._stamp()
+
+    def _columns(self):
+        # 查询用的列式缓存：文件名数组、以换行拼接的文件名及各行起始位置、起止日期数组
+        if self._arrays is None:
+            names = sorted(self.entries)
+            entries = [self.entries[name] for name in names]
+            line_starts = np.cumsum([0] + [len(name) + 1 for name in names[:-1]]) if names else np.zeros(0)
+            self._arrays = (
+                np.array(names, dtype=object),
+                "\n".join(names),
+                np.asarray(line_starts, dtype=np.int64),
+                np.array([entry["start"] if entry["start"] is not None else -1 for entry in entries], dtype=np.int64),
+                np.array([entry["end"] if entry["end"] is not None else -1 for entry in entries], dtype=np.int64),
+            )
+        return self._arrays
+
+    def files(self):
+        """按文件名排序的全部合约文件。"""
+        return self._columns()[0].tolist()
+
+    def filter(self, keyword):
+        """文件名中包含关键字（区分大小写，与原先按文件名筛选一致）的文件。"""
+        names, text, line_starts, _, _ = self._columns()
+        if not keyword or "\n" in keyword:
+            return names.tolist() if not keyword else []
+        # 在拼接文本中查找所有匹配位置，再映射回所在行
+        positions = [match.start() for match in re.finditer(re.escape(keyword), text)]
+        rows = np.unique(np.searchsorted(line_starts, positions, side='right') - 1)
+        return names[rows].tolist()
+
+    def traded_on(self, date):
+        """日期落在其交易区间 [首个交易日, 最后交易日] 内的合约文件。"""
+        key = date_key(date)
+        names, _, _, starts, ends = self._columns()
+        if key is None:
+            return []
+        return names[(starts <= key) & (ends >= key)].tolist()
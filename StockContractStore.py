@@ -0,0 +1,222 @@
+import io
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from StockBarStore import BAR_SUFFIX, DATE_COLUMN, load_bars, read_bar_columns, save_bars
+
+
+# 合约 JSON 文件旁的日期索引：按日期排序的日期键及每条记录在文件中的字节偏移，
+# 合并新数据时二分查找第一个受影响的位置，只截断并重写其后的尾部。
+# 索引为小端 int64 二进制：文件大小、修改时间(ns)、记录数，随后是日期数组与偏移数组
+INDEX_SUFFIX = ".idx"
+_INDEX_HEADER = 3
+
+
+def date_key(value):
+    """将日期值统一为 YYYYMMDD 整数，用于排序与去重；无法解析时返回 None。"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().replace("-", "").replace("/", "")[:8]
+    return int(text) if len(text) == 8 and text.isdigit() else None
+
+
+def encode_json_record(item):
+    """单条记录的文本，与 json.dump(records, f, ensure_ascii=False, indent=4) 中该记录的部分一致。"""
+    return '    ' + json.dumps(item, ensure_ascii=False, indent=4).replace('\n', '\n    ')
+
+
+def _dedupe_sorted(records):
+    """
+    按日期去重（后出现者覆盖先出现者）并按日期排序，返回 (日期键列表, 记录列表)。
+    没有可解析日期的记录无法去重，按原顺序保留在最前，日期键记为 -1（与 `load_window` 一致）。
+    """
+    undated = []
+    by_date = {}
+    for item in records:
+        key = date_key(item.get(DATE_COLUMN))
+        if key is None:
+            undated.append(item)
+        else:
+            by_date[key] = item
+    keys = sorted(by_date)
+    return [-1] * len(undated) + keys, undated + [by_date[key] for key in keys]
+
+
+def _write_index(path, dates, offsets):
+    stat = os.stat(path)
+    header = np.array([stat.st_size, stat.st_mtime_ns, len(dates)], dtype='<i8')
+    with open(path + INDEX_SUFFIX, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(np.asarray(dates, dtype='<i8').tobytes())
+        f.write(np.asarray(offsets, dtype='<i8').tobytes())
+
+
+def load_index(path):
+    """
+    读取合约文件的日期索引；索引不存在或与文件不一致时返回 None。
+
+    Returns:
+        tuple: (dates, offsets) 两个 int64 数组。
+    """
+    index_path = path + INDEX_SUFFIX
+    if not (os.path.exists(path) and os.path.exists(index_path)):
+        return None
+    data = np.fromfile(index_path, dtype='<i8')
+    stat = os.stat(path)
+    if len(data) < _INDEX_HEADER or data[0] != stat.st_size or data[1] != stat.st_mtime_ns:
+        return None
+    count = int(data[2])
+    return data[_INDEX_HEADER:_INDEX_HEADER + count], data[_INDEX_HEADER + count:]
+
+
+def _write_tail(f, start, records, first_index):
+    """
+    从 start 处写入记录及结尾的 "\\n]"，first_index 为第一条记录在文件中的序号。
+
+    Returns:
+        list: 每条记录分隔符的起始字节偏移。
+    """
+    f.seek(start)
+    f.truncate()
+    offsets = []
+    position = start
+    for i, item in enumerate(records, first_index):
+        chunk = (b',\n' if i else b'\n') + encode_json_record(item).encode('utf-8')
+        offsets.append(position)
+        f.write(chunk)
+        position += len(chunk)
+    f.write(b'\n]' if first_index or records else b']')
+    return offsets
+
+
+def rebuild_json_store(path, new_items=()):
+    """全量重写 JSON 合约文件：合并已有记录与新记录，按日期去重排序并重建索引。"""
+    existing = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    dates, records = _dedupe_sorted(list(existing) + list(new_items))
+    with open(path, 'wb') as f:
+        f.write(b'[')
+        offsets = _write_tail(f, 1, records, 0)
+    _write_index(path, dates, offsets)
+    return len(records)
+
+
+def merge_json_store(path, new_items):
+    """
+    将新记录按日期合并进 JSON 合约文件：相同日期的记录被替换，新日期按顺序插入。
+    借助日期索引二分定位第一个受影响的记录，只重写其后的部分；索引缺失或过期时，
+    或新记录中有无法解析日期的记录（需保留在文件最前）时全量重写。
+
+    Returns:
+        int: 重写的记录条数。
+    """
+    new_items = list(new_items)
+    index = load_index(path)
+    new_dates, new_records = _dedupe_sorted(new_items)
+    if index is None or (new_dates and new_dates[0] < 0):
+        return rebuild_json_store(path, new_items)
+    if not new_records:
+        return 0
+    dates, offsets = index
+    start = int(np.searchsorted(dates, new_dates[0], side='left'))
+    with open(path, 'r+b') as f:
+        tail_records = []
+        if start < len(dates):
+            f.seek(int(offsets[start]))
+            tail = f.read().decode('utf-8')
+            tail_records = json.loads('[' + tail.lstrip(','))
+        by_date = dict(zip(dates[start:].tolist(), tail_records))
+        by_date.update(zip(new_dates, new_records))
+        tail_dates = sorted(by_date)
+        position = int(offsets[start]) if start < len(dates) else f.seek(0, os.SEEK_END) - (2 if len(dates) else 1)
+        tail_offsets = _write_tail(f, position, [by_date[key] for key in tail_dates], start)
+    _write_index(path, np.concatenate([dates[:start], tail_dates]), np.concatenate([offsets[:start], tail_offsets]))
+    return len(tail_dates)
+
+
+def merge_bar_store(path, new_items):
+    """
+    .kbar 为定长列式布局，合并后整体重写：按日期去重（新记录优先）并排序，
+    无法解析日期的记录与 JSON 合约文件一样按原顺序保留在最前。
+    """
+    frames = [load_bars(path, mmap=False)] if os.path.exists(path) else []
+    frames.append(pd.DataFrame(list(new_items)))
+    df = pd.concat(frames, ignore_index=True)
+    keys = df[DATE_COLUMN].map(date_key) if DATE_COLUMN in df.columns else pd.Series(np.nan, index=df.index)
+    dated = df[keys.notna()].assign(_key=keys[keys.notna()].astype('int64'))
+    dated = dated.drop_duplicates('_key', keep='last').sort_values('_key', kind='stable').drop(columns='_key')
+    df = pd.concat([df[keys.isna()], dated], ignore_index=True)
+    save_bars(path, df)
+    return len(df)
+
+
+def merge_contract_file(path, new_items):
+    """按后缀将新记录合并进合约文件，文件不存在时新建。"""
+    if path.endswith(BAR_SUFFIX):
+        return merge_bar_store(path, new_items)
+    return merge_json_store(path, new_items)
+
+
+def _window_rows(keys, start, end, margin):
+    """
+    在日期键中二分查找 [start, end] 对应的行，并向前扩展 margin 行作为预热。
+    日期有序时返回切片；无序时按日期稳定排序后返回行号数组。
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    order = None
+    if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+    hi = len(keys) if end is None else int(np.searchsorted(keys, end, side='right'))
+    lo = 0 if start is None else min(int(np.searchsorted(keys, start, side='left')), hi)
+    if lo < hi:
+        lo = max(0, lo - margin)
+    return slice(lo, hi) if order is None else order[lo:hi]
+
+
+def _select_columns(df, columns):
+    return df if columns is None else df[[col for col in columns if col in df.columns]]
+
+
+def load_window(path, start=None, end=None, columns=None, margin=0):
+    """
+    按日期区间 [start, end]（含两端，None 表示不限）读取合约文件的指定列，并向前多读 margin 根K线。
+    .kbar 先内存映射日期列二分定位，再只读取区间内的行；JSON 有有效的日期索引时只读取区间对应的字节，
+    否则读取全文后筛选。
+    """
+    start, end = date_key(start), date_key(end)
+    if path.endswith(BAR_SUFFIX):
+        values, _ = read_bar_columns(path, [DATE_COLUMN])[DATE_COLUMN]
+        keys = values if values.dtype.kind in "iu" else [date_key(v) or -1 for v in values]
+        return load_bars(path, columns, rows=_window_rows(keys, start, end, margin))
+
+    index = load_index(path)
+    if index is None:
+        df = pd.read_json(path)
+        if DATE_COLUMN not in df.columns:
+            return _select_columns(df, columns)
+        keys = [date_key(v) or -1 for v in df[DATE_COLUMN]]
+        rows = _window_rows(keys, start, end, margin)
+        return _select_columns(df.iloc[rows].reset_index(drop=True), columns)
+
+    dates, offsets = index
+    rows = _window_rows(dates, start, end, margin)
+    if not len(dates):
+        return pd.DataFrame()
+    # 区间为空时读取第一条记录以得到列结构
+    first, stop = (rows.start, rows.stop) if rows.start < rows.stop else (0, 1)
+    with open(path, 'rb') as f:
+        f.seek(int(offsets[first]))
+        if stop < len(dates):
+            text = f.read(int(offsets[stop] - offsets[first])).decode('utf-8') + ']'
+        else:
+            text = f.read().decode('utf-8')
+    df = pd.read_json(io.StringIO('[' + text.lstrip(',')))
+    return _select_columns(df if rows.start < rows.stop else df.iloc[0:0], columns)
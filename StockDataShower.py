@@ -13,7 +13,8 @@
 import argparse
 import os
 import platform
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 try:
     import tkinter as tk
@@ -26,19 +27,96 @@ except Exception:
 
 try:
     import matplotlib.pyplot as plt
-    import matplotlib.patches as mpatches
     from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 except Exception:
     plt = None
-    mpatches = None
     FigureCanvasTkAgg = None
 
 import StockFileTotallyProcess
-from StockProcessData import ProcessType, process_json_file
+from StockBarStore import OUTPUT_FORMATS
+from StockContractCatalog import ContractCatalog
+from StockContractStore import date_key
+from StockFrameCache import DEFAULT_CACHE_BYTES, FrameCache
+from StockChartExport import DEFAULT_EXPORT_BARS, EXPORT_FORMATS, export_charts
+from StockChartRender import DEFAULT_VIEW_BARS, KlineChart, prepare_chart_data
+from StockProcessData import ProcessType
 
 
 DEFAULT_DATA_FOLDER = StockFileTotallyProcess.DEFAULT_OUTPUT_FOLDER
 DEFAULT_INPUT_FOLDER = StockFileTotallyProcess.DEFAULT_INPUT_FOLDER
+TABLE_PAGE_SIZE = 200  # 数据表格每次插入的行数，滚动接近底部时加载下一页
+WIDTH_SAMPLE_SIZE = 2000  # 估算列宽时最多采样的行数
+AUTO_WIDTH_LAST_IDX = 13  # 只对“持仓量”及之前的字段自适应宽度
+
+
+def estimate_column_widths(df, last_idx=AUTO_WIDTH_LAST_IDX, sample_size=WIDTH_SAMPLE_SIZE):
+    """
+    估算数据表格的列宽（像素）：前 last_idx + 1 列按内容自适应，其余固定为 100。
+    行数超过 sample_size 时取均匀间隔的样本行，字符串长度按列向量化计算。
+    """
+    sample = df
+    if len(df) > sample_size:
+        sample = df.iloc[np.linspace(0, len(df) - 1, sample_size).astype(int)]
+    widths = []
+    for idx, col in enumerate(df.columns):
+        if idx > last_idx:
+            widths.append(100)
+            continue
+        content_width = int(sample.iloc[:, idx].astype(str).str.len().max()) if len(sample) else 0
+        widths.append(max(len(str(col)), content_width) * 10 + 20)
+    return widths
+
+
+class BackgroundTasks:
+    """
+    在后台线程执行耗时任务，由 Tk 主线程轮询结果并回调，界面控件只在主线程中修改。
+    同一通道（如数据加载、K线图准备）提交新任务时，未开始的旧任务被取消，已开始的旧任务结果被丢弃。
+    """
+
+    POLL_MS = 50
+
+    def __init__(self, root, on_busy_change=None, max_workers=2):
+        self.root = root
+        self.on_busy_change = on_busy_change
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.current = {}  # 通道 -> 当前有效的 Future
+
+    def submit(self, channel, func, on_done, on_error):
+        old = self.current.get(channel)
+        if old is not None:
+            old.cancel()
+        future = self.executor.submit(func)
+        self.current[channel] = future
+        self._notify()
+        self.root.after(self.POLL_MS, self._poll, channel, future, on_done, on_error)
+        return future
+
+    def _poll(self, channel, future, on_done, on_error):
+        if not future.done():
+            self.root.after(self.POLL_MS, self._poll, channel, future, on_done, on_error)
+            return
+        if self.current.get(channel) is not future:
+            return  # 已被同一通道的新任务取代
+        del self.current[channel]
+        self._notify()
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            on_error(error)
+        else:
+            on_done(future.result())
+
+    def busy(self):
+        return bool(self.current)
+
+    def _notify(self):
+        if self.on_busy_change is not None:
+            self.on_busy_change(self.busy())
+
+    def shutdown(self):
+        self.current.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 class DataViewerApp:
@@ -46,11 +124,13 @@ class DataViewerApp:
     一个基于Tkinter的图形界面应用，用于浏览指定文件夹下的JSON数据文件，并支持数据显示和K线图展示。
     """
 
-    def __init__(self, root, default_folder=r"E:\stock_json"):
+    def __init__(self, root, default_folder=r"E:\stock_json", frame_cache=None):
         """
         初始化界面组件，包括文件夹选择、文件列表、数据表格等。
+        frame_cache 为已处理数据的缓存，重复查看同一合约时不再重新解析与处理。
         """
         self.root = root
+        self.frame_cache = frame_cache or FrameCache()
         self.root.title("数据文件查看器")
         self.root.state("zoomed")  # 窗口默认最大化
 
@@ -79,6 +159,14 @@ class DataViewerApp:
         self.filter_entry.pack(side=tk.LEFT, padx=5)
         self.filter_button = tk.Button(top_frame, text="筛选", command=self.filter_files)
         self.filter_button.pack(side=tk.LEFT, padx=5)
+
+        # 后台任务进度指示
+        self.progress = ttk.Progressbar(top_frame, mode="indeterminate", length=120)
+        self.progress.pack(side=tk.LEFT, padx=5)
+        self.status_label = tk.Label(top_frame, text="")
+        self.status_label.pack(side=tk.LEFT, padx=5)
+        self.tasks = BackgroundTasks(root, self.on_busy_change)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.show_bi_var = tk.BooleanVar(value=False)
         self.show_zhongshu_var = tk.BooleanVar(value=False)
         self.checkbox_bi = tk.Checkbutton(
@@ -96,14 +184,22 @@ class DataViewerApp:
         self.file_listbox.pack(pady=10)
         self.file_listbox.bind("<<ListboxSelect>>", self.display_file_data)
 
-        # 数据表格（Treeview）
-        self.tree = ttk.Treeview(root, columns=[], show="headings")
-        self.tree.pack(expand=True, fill="both", pady=10)
+        # 数据表格（Treeview），按页插入行，滚动接近底部时加载下一页
+        table_frame = tk.Frame(root)
+        table_frame.pack(expand=True, fill="both", pady=10)
+        self.tree_scrollbar = ttk.Scrollbar(table_frame, orient="vertical")
+        self.tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree = ttk.Treeview(table_frame, columns=[], show="headings", yscrollcommand=self.on_tree_scroll)
+        self.tree.pack(side=tk.LEFT, expand=True, fill="both")
+        self.tree_scrollbar.config(command=self.tree.yview)
         self.tree.bind("<Double-1>", self.show_kline_chart)  # 双击数据行显示K线图
+        self.loaded_rows = 0
+        self.page_pending = False
 
         # 默认文件夹路径
         self.folder_path = default_folder
         self.all_files = []  # 保存所有文件名
+        self.catalog = None
         # 启动时自动选择文件夹
         if os.path.exists(self.folder_path):
             self.load_value_json_files()
@@ -136,14 +232,26 @@ class DataViewerApp:
 
     def load_value_json_files(self):
         self.file_listbox.delete(0, tk.END)
-        self.all_files = [file for file in os.listdir(self.folder_path) if
-                          file.endswith(".json")]
+        # 文件列表来自合约目录，目录不存在时扫描一次生成
+        self.catalog = ContractCatalog.open(self.folder_path)
+        self.all_files = self.catalog.files()
         for file in self.all_files:
             self.file_listbox.insert(tk.END, file)
 
+    def on_busy_change(self, busy):
+        if busy:
+            self.progress.start(10)
+        else:
+            self.progress.stop()
+            self.status_label.config(text="")
+
+    def on_close(self):
+        self.tasks.shutdown()
+        self.root.destroy()
+
     def display_file_data(self, event):
         """
-        当用户选择文件时，读取JSON文件内容并显示在数据表格中。
+        当用户选择文件时，在后台读取并处理文件，完成后显示在数据表格中；处理期间可切换到其他文件。
         """
         selected_file_index = self.file_listbox.curselection()
         if not selected_file_index:
@@ -151,11 +259,20 @@ class DataViewerApp:
         selected_file = self.file_listbox.get(selected_file_index)
         file_path = os.path.join(self.folder_path, selected_file)
 
+        # 获取选中的ProcessType
+        process_type_desc = self.process_type_var.get()
+        process_type = next((e for e in ProcessType if e.desc == process_type_desc), ProcessType.NO_PROCESS)
+        self.status_label.config(text=f"正在加载 {selected_file}...")
+        self.tasks.submit(
+            "data", lambda: self.frame_cache.get(file_path, process_type), self.show_file_data,
+            lambda e: messagebox.showerror("错误", f"无法加载文件: {e}"))
+
+    def show_file_data(self, df):
+        """在数据表格中显示加载完成的数据（主线程调用）。"""
         try:
-            # 获取选中的ProcessType
-            process_type_desc = self.process_type_var.get()
-            process_type = next((e for e in ProcessType if e.desc == process_type_desc), ProcessType.NO_PROCESS)
-            df = process_json_file(file_path, process_type)
+            stats = self.frame_cache.stats()
+            self.root.title(f"数据文件查看器（缓存命中率 {stats['hit_rate']:.0%}，"
+                            f"{stats['entries']} 项 / {stats['bytes'] // (1024 * 1024)} MB）")
 
             # 清空旧数据
             for col in self.tree["columns"]:
@@ -167,35 +284,48 @@ class DataViewerApp:
             for col in df.columns:
                 self.tree.heading(col, text=col)
 
-            # 插入数据行
-            for _, row in df.iterrows():
-                self.tree.insert("", "end", values=list(row))
-
             self.current_data = df  # 保存当前数据
+            # 只插入第一页，其余行在滚动时加载
+            self.loaded_rows = 0
+            self.load_next_page()
 
-            # 只对“持仓量”及之前的字段自适应宽度
-            columns = list(df.columns)
-            last_idx = 13
-            font = ("微软雅黑", 10)
-            for idx, col in enumerate(columns):
-                if idx <= last_idx:
-                    max_width = max(
-                        [len(str(col))] +
-                        [len(str(row[col])) for _, row in df.iterrows()]
-                    )
-                    pixel_width = max_width * 10 + 20
-                    self.tree.column(col, width=pixel_width)
-                else:
-                    self.tree.column(col, width=100)  # 后续字段宽度固定
+            # 列宽按采样行的字符串长度估算
+            for col, width in zip(df.columns, estimate_column_widths(df)):
+                self.tree.column(col, width=width)
         except Exception as e:
             messagebox.showerror("错误", f"无法加载文件: {e}")
 
+    def load_next_page(self):
+        """向数据表格追加下一页数据行。"""
+        self.page_pending = False
+        df = getattr(self, "current_data", None)
+        if df is None or self.loaded_rows >= len(df):
+            return
+        stop = min(self.loaded_rows + TABLE_PAGE_SIZE, len(df))
+        for values in df.iloc[self.loaded_rows:stop].to_numpy(dtype=object).tolist():
+            self.tree.insert("", "end", values=values)
+        self.loaded_rows = stop
+
+    def on_tree_scroll(self, first, last):
+        """表格滚动回调：同步滚动条，已显示到已加载部分的末尾附近时加载下一页。"""
+        self.tree_scrollbar.set(first, last)
+        df = getattr(self, "current_data", None)
+        if df is not None and float(last) > 0.9 and self.loaded_rows < len(df) and not self.page_pending:
+            self.page_pending = True
+            self.root.after_idle(self.load_next_page)
+
     def filter_files(self):
+        """按合约代码筛选；输入为日期（如 20230105）时列出该日处于交易区间内的合约。"""
         keyword = self.filter_entry.get().strip()
         self.file_listbox.delete(0, tk.END)
-        for file in self.all_files:
-            if keyword in file:
-                self.file_listbox.insert(tk.END, file)
+        if not keyword:
+            files = self.all_files
+        elif date_key(keyword) is not None:
+            files = self.catalog.traded_on(keyword)
+        else:
+            files = self.catalog.filter(keyword)
+        for file in files:
+            self.file_listbox.insert(tk.END, file)
 
     def show_kline_chart(self, event):
         import matplotlib
@@ -210,8 +340,21 @@ class DataViewerApp:
             messagebox.showerror("错误", "数据为空")
             return
 
+        # 数据准备（数组转换、笔线段中枢构建）在后台执行；matplotlib 图形不是线程安全的，完成后在主线程中创建
+        desc = self.process_type_var.get()
+        zen = desc == "缠中论禅"
+        options = {"zen": zen, "show_bi": zen and self.show_bi_var.get(),
+                   "show_zhongshu": zen and self.show_zhongshu_var.get()}
+        self.status_label.config(text="正在生成K线图...")
+        self.tasks.submit(
+            "chart", lambda: prepare_chart_data(df, options["show_bi"], options["show_zhongshu"]),
+            lambda data: self.open_kline_window(df, data, desc, options),
+            lambda e: messagebox.showerror("错误", f"无法生成K线图: {e}"))
+
+    def open_kline_window(self, df, data, desc, options):
+        """以后台准备好的数据创建K线图与窗口（主线程调用）。"""
         try:
-            desc = self.process_type_var.get()
+            chart = KlineChart(df, data=data, **options)
             kline_window = tk.Toplevel(self.root)
             kline_window.state("zoomed")  # 新增：窗口最大化
             if desc == "缠中论禅":
@@ -220,137 +363,52 @@ class DataViewerApp:
                 kline_window.title(f"K线图")
             kline_window.geometry("1000x450")
 
-            n = len(df)
-            base_width = 12
-            if n > 20:
-                fig_width = n * 0.22
-            else:
-                fig_width = base_width
-
-            fig, (ax_k, ax_pos) = plt.subplots(
-                2, 1, figsize=(fig_width, 8), gridspec_kw={'height_ratios': [4, 1]},
-                sharex=True
-            )
-
-            x = range(n)
-            show_bi = desc == "缠中论禅" and self.show_bi_var.get()
-            for i, row in enumerate(df.itertuples()):
-                open_price = float(getattr(row, "开盘价"))
-                close_price = float(getattr(row, "收盘价"))
-                high_price = float(getattr(row, "最高价"))
-                low_price = float(getattr(row, "最低价"))
-                if desc == "缠中论禅":
-                    rect_color = "Goldenrod"
-                else:
-                    rect_color = "red" if close_price > open_price else "green"
-                ax_k.add_patch(
-                    mpatches.Rectangle(
-                        (i - 0.2, min(open_price, close_price)), 0.4,
-                        abs(close_price - open_price),
-                        color=rect_color, zorder=2
-                    )
-                )
-                ax_k.scatter(i - 0.001, high_price, color=rect_color, s=1.01, zorder=3)
-                ax_k.scatter(i - 0.001, low_price, color=rect_color, s=1.01, zorder=3)
-                ax_k.add_patch(
-                    mpatches.Rectangle(
-                        (i - 0.04, low_price), 0.08, high_price - low_price,
-                        color=rect_color, zorder=1
-                    )
-                )
-                # 新增：绘制顶底分型标记
-                if show_bi and "顶底分型" in df.columns:
-                    fenxing = getattr(row, "顶底分型", None)
-                    if fenxing is not None:
-                        # 兼容枚举和字符串
-                        fx_val = str(fenxing)
-                        if "TOP" in fx_val or "顶分型" in fx_val:
-                            # 顶分型，顶部画红色小矩形
-                            ax_k.add_patch(
-                                mpatches.Rectangle(
-                                    (i - 0.12, high_price + (high_price - low_price) * 0.03),
-                                    0.24, (high_price - low_price) * 0.06,
-                                    color="red", zorder=5
-                                )
-                            )
-                        elif "BOTTOM" in fx_val or "底分型" in fx_val:
-                            # 底分型，底部画绿色小矩形
-                            ax_k.add_patch(
-                                mpatches.Rectangle(
-                                    (i - 0.12, low_price - (high_price - low_price) * 0.09),
-                                    0.24, (high_price - low_price) * 0.06,
-                                    color="green", zorder=5
-                                )
-                            )
-            ax_k.set_title(f"K线图")
-            ax_k.set_ylabel("价格")
-            ax_k.set_xlim(-0.5, n - 0.5)
-            ax_k.grid(axis="y")
-
-            # 右侧价格刻度
-            ax_k_right = ax_k.twinx()
-            ax_k_right.set_ylim(ax_k.get_ylim())
-            ax_k_right.set_yticks(ax_k.get_yticks())
-            ax_k_right.set_ylabel("价格", rotation=270, labelpad=15)
-            ax_k_right.yaxis.set_label_position("right")
-            ax_k_right.yaxis.set_ticks_position("right")
-            ax_k_right.tick_params(axis="y", direction="in", pad=2)
-            ax_k_right.grid(False)
-
-            if "成交量" in df.columns and "持仓量" in df.columns:
-                volume = df["成交量"].astype(float).values
-                position = df["持仓量"].astype(float).values
-                ax_pos.bar(x, volume, color="#888888", width=0.6, alpha=0.6, label="成交量")
-                ax_pos.plot(x, position, color="blue", marker="o", markersize=5, label="持仓量")
-                ax_pos.set_ylabel("成交/持仓")
-                ax_pos.legend(loc="upper left", fontsize=8)
-                ax_pos.grid(axis="y")
-                # 右侧持仓量刻度
-                ax_pos_right = ax_pos.twinx()
-                ax_pos_right.set_ylim(ax_pos.get_ylim())
-                ax_pos_right.set_yticks(ax_pos.get_yticks())
-                ax_pos_right.set_ylabel("成交/持仓", rotation=270, labelpad=15)
-                ax_pos_right.yaxis.set_label_position("right")
-                ax_pos_right.yaxis.set_ticks_position("right")
-                ax_pos_right.tick_params(axis="y", direction="in", pad=2)
-                ax_pos_right.grid(False)
-            else:
-                ax_pos.text(0.5, 0.5, "无成交量/持仓量数据", ha="center", va="center", fontsize=12)
-
-            if "日期" in df.columns:
-                ax_pos.set_xticks(list(x))
-                ax_pos.set_xticklabels(df["日期"], rotation=45, fontsize=8)
+            # 图形大小固定为窗口大小，平移/缩放时只重绘当前视口
+            fig, ax_k = chart.fig, chart.ax_k
 
             canvas_frame = tk.Frame(kline_window)
             canvas_frame.pack(fill=tk.BOTH, expand=True)
-            canvas = tk.Canvas(canvas_frame, width=1000, height=800, bg="white")
-            canvas.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-            fig_canvas = FigureCanvasTkAgg(fig, master=canvas)
-            fig_canvas.draw()
+            fig_canvas = FigureCanvasTkAgg(fig, master=canvas_frame)
             fig_widget = fig_canvas.get_tk_widget()
-            fig_widget.update_idletasks()
-            widget_width = max(fig_widget.winfo_reqwidth(), 1000)
-            canvas.create_window((0, 0), window=fig_widget, anchor="nw")
-            canvas.config(scrollregion=(0, 0, widget_width, 800))
+            fig_widget.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+            chart.set_view(0, DEFAULT_VIEW_BARS)
+
+            # 按住左键拖动平移，滚轮缩放
+            drag_state = {}
 
             def on_press(event):
-                canvas.scan_mark(event.x, event.y)
+                if event.button == 1:
+                    drag_state["x"] = event.x
+                    drag_state["view"] = chart.view
 
             def on_drag(event):
-                canvas.scan_dragto(event.x, event.y, gain=1)
+                if "x" not in drag_state or event.button != 1:
+                    return
+                start, stop = drag_state["view"]
+                bar_pixels = ax_k.bbox.width / max(stop - start, 1)
+                shift = (drag_state["x"] - event.x) / bar_pixels
+                chart.set_view(start + shift, stop + shift)
+
+            def on_release(event):
+                drag_state.clear()
 
-            canvas.bind("<ButtonPress-1>", on_press)
-            canvas.bind("<B1-Motion>", on_drag)
+            def on_scroll(event):
+                chart.zoom(0.8 if event.button == "up" else 1.25, event.xdata)
+
+            fig_canvas.mpl_connect("button_press_event", on_press)
+            fig_canvas.mpl_connect("motion_notify_event", on_drag)
+            fig_canvas.mpl_connect("button_release_event", on_release)
+            fig_canvas.mpl_connect("scroll_event", on_scroll)
 
             # 左上角按钮
             btn_frame = tk.Frame(canvas_frame, bg="white")
             btn_frame.place(x=10, y=10)
 
             def move_left():
-                canvas.xview_scroll(-1, "units")
+                chart.pan(-max(1, (chart.view[1] - chart.view[0]) // 4))
 
             def move_right():
-                canvas.xview_scroll(1, "units")
+                chart.pan(max(1, (chart.view[1] - chart.view[0]) // 4))
 
             btn_left = tk.Button(btn_frame, text="←", width=3, command=move_left)
             btn_left.pack(side=tk.LEFT, padx=2)
@@ -405,18 +463,18 @@ class DataViewerApp:
             messagebox.showerror("错误", f"无法生成K线图: {e}")
 
 
-def run_ui(default_folder):
+def run_ui(default_folder, cache_bytes=DEFAULT_CACHE_BYTES, cache_folder=None):
     if tk is None or plt is None or FigureCanvasTkAgg is None:
         print("UI 模式启动失败：缺少 tkinter 或 matplotlib GUI 依赖。")
         return 1
 
     root = tk.Tk()
-    DataViewerApp(root, default_folder)
+    DataViewerApp(root, default_folder, FrameCache(cache_bytes, cache_folder))
     root.mainloop()
     return 0
 
 
-def run_cli(input_folder, data_folder):
+def run_cli(input_folder, data_folder, pipeline_options=None):
     print("进入命令行模式。")
     print(f"输入目录: {input_folder}")
     print(f"数据目录: {data_folder}")
@@ -424,23 +482,25 @@ def run_cli(input_folder, data_folder):
     while True:
         print("\n==== 命令行菜单 ====")
         print("1. 执行全流程（拆分 -> 转换 -> 补全 -> 合并）")
-        print("2. 查看数据目录中的 json 文件")
+        print("2. 查看数据目录中的合约文件")
         print("0. 退出")
         choice = input("请选择操作: ").strip()
 
         if choice == "1":
-            StockFileTotallyProcess.main(input_folder, data_folder)
+            StockFileTotallyProcess.main(input_folder, data_folder, **(pipeline_options or {}))
         elif choice == "2":
             if not os.path.isdir(data_folder):
                 print(f"目录不存在: {data_folder}")
                 continue
-            json_files = [file for file in os.listdir(data_folder) if file.endswith(".json")]
+            catalog = ContractCatalog.open(data_folder)
+            json_files = catalog.files()
             if not json_files:
-                print("未找到 .json 文件")
+                print("未找到合约文件（.json/.kbar）")
                 continue
-            print("发现以下 json 文件:")
+            print("发现以下合约文件:")
             for name in json_files:
-                print(name)
+                entry = catalog.entries[name]
+                print(f"{name}\t{entry['start']} ~ {entry['end']}\t{entry['rows']} 行")
         elif choice == "0":
             print("命令行模式已退出。")
             return 0
@@ -454,19 +514,65 @@ def main(argv=None):
     parser.add_argument("--run-pipeline", action="store_true", help="命令行模式下直接执行一次全流程并退出")
     parser.add_argument("--input-folder", default=DEFAULT_INPUT_FOLDER, help="原始 Excel 输入目录")
     parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER, help="中间文件与结果输出目录")
+    parser.add_argument("--workers", type=int, default=1, help="拆分 Excel 的并行进程数，1 为串行，0 为使用全部 CPU 核心")
+    parser.add_argument("--in-memory", action="store_true", help="全流程在内存中执行，不生成中间文件")
+    parser.add_argument("--incremental", action="store_true", help="按源文件清单只处理新增或变化的工作簿")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="各工作簿经有界队列流水处理，读取、转换与写出重叠执行，边处理边写出合约文件")
+    parser.add_argument("--output-format", choices=sorted(OUTPUT_FORMATS), default="json",
+                        help="按合约输出格式：json 或列式二进制 kbar")
+    parser.add_argument("--memory-budget", type=int, default=0,
+                        help="合并阶段的内存预算（MB），大于 0 时流式合并并将超出部分写入溢出文件")
+    parser.add_argument("--merge", action="store_true", help="按日期合并进已有的合约文件，保留历史并去重")
+    parser.add_argument("--report", default=None,
+                        help="全流程运行报告（JSON）的输出路径，记录各阶段与逐文件的耗时、行数、读写字节数与峰值内存")
+    parser.add_argument("--profile", action="store_true", help="对全流程做 cProfile 分析，结果附在运行报告中并另存 .prof 文件")
+    parser.add_argument("--trace-memory", action="store_true", help="用 tracemalloc 记录各阶段的 Python 内存分配峰值（较慢）")
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help="查看器已处理数据缓存的内存上限（MB）")
+    parser.add_argument("--cache-dir", default=None, help="查看器缓存的磁盘目录，指定后处理结果可跨会话复用")
+    parser.add_argument("--export", default=None, metavar="DIR",
+                        help="无界面导出数据目录中合约的K线图到该目录后退出，并行进程数取 --workers")
+    parser.add_argument("--export-filter", default="", help="导出时的文件名关键字（区分大小写），或日期（导出当日在交易的合约）")
+    parser.add_argument("--export-format", choices=EXPORT_FORMATS, default="png", help="导出的图片格式")
+    parser.add_argument("--export-zen", action="store_true", help="导出缠论处理后的K线图，含分型、笔、线段与中枢")
+    parser.add_argument("--export-bars", type=int, default=DEFAULT_EXPORT_BARS, help="导出图中的末尾K线根数，0 为全部")
     args = parser.parse_args(argv)
 
+    if args.export:
+        results = export_charts(args.data_folder, args.export, args.export_filter, args.export_format, args.workers,
+                                zen=args.export_zen, bars=args.export_bars)
+        return 1 if any(result[4] is not None for result in results) else 0
+
+    pipeline_options = {
+        "workers": args.workers,
+        "in_memory": args.in_memory,
+        "incremental": args.incremental,
+        "pipelined": args.pipelined,
+        "output_format": args.output_format,
+        "memory_budget": args.memory_budget * 1024 * 1024 or None,
+        "merge": args.merge,
+        "report_path": args.report,
+        "profile": args.profile,
+        "trace_memory": args.trace_memory,
+    }
+    try:
+        StockFileTotallyProcess.check_options(args.in_memory, args.incremental, args.pipelined,
+                                              pipeline_options["memory_budget"], args.merge)
+    except ValueError as e:
+        parser.error(str(e))
+
     is_windows = platform.system().lower().startswith("win")
     use_cli = args.debug or not is_windows
 
     if use_cli:
         if args.run_pipeline:
             print("命令行模式：执行一次全流程后退出。")
-            StockFileTotallyProcess.main(args.input_folder, args.data_folder)
+            StockFileTotallyProcess.main(args.input_folder, args.data_folder, **pipeline_options)
             return 0
-        return run_cli(args.input_folder, args.data_folder)
+        return run_cli(args.input_folder, args.data_folder, pipeline_options)
 
-    return run_ui(args.data_folder)
+    return run_ui(args.data_folder, args.cache_mb * 1024 * 1024, args.cache_dir)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,24 @@
 import os
+import numpy as np
 import pandas as pd
 import json
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import StockPipelineMetrics
+from StockPipelineMetrics import file_size
+from StockContractStore import date_key
 
 
 DEFAULT_INPUT_FOLDER = r'E:\work_codes\Stock&Futures\上期所\原始数据'
 DEFAULT_OUTPUT_FOLDER = r'E:\stock_json'
+VALUE_ROW_MIN_NUMERIC = 6  # 数值型单元格个数大于该值的行视为数据行
+TITLE_KEYWORDS = ("前收盘",)  # 包含任一关键字的行视为标题行
+
+# 逐行遍历时单元格为 Python 原生类型，bool 属于 int 子类，同样计为数值
+_NUMERIC_CELL_TYPES = (int, float, bool, np.float64)
 
 
 def find_excel_files(folder_path):
@@ -16,18 +30,184 @@ def find_excel_files(folder_path):
     return excel_files
 
 
-def convert_excel_to_json(excel_file, output_folder):
+def classify_rows(df, min_numeric=VALUE_ROW_MIN_NUMERIC, keywords=TITLE_KEYWORDS):
+    """
+    按列向量化识别数据行与标题行，可复用于其他交易所的表格布局。
+
+    Args:
+        df (pd.DataFrame): 原始表格。
+        min_numeric (int): 数值型且非 NaN 的单元格个数大于该值的行视为数据行。
+        keywords (tuple): 任一单元格文本包含其中关键字的行视为标题行。
+
+    Returns:
+        tuple: (value_mask, title_mask) 两个与 df 行对齐的布尔数组。
+    """
+    numeric_count = np.zeros(len(df), dtype=np.int64)
+    title_mask = np.zeros(len(df), dtype=bool)
+    for j in range(df.shape[1]):
+        col = df.iloc[:, j]
+        if pd.api.types.is_numeric_dtype(col.dtype):
+            numeric_count += col.notna().to_numpy()
+            continue
+        if not (col.dtype == object or pd.api.types.is_string_dtype(col.dtype)):
+            continue
+        cell_types = col.map(type).to_numpy()
+        if col.dtype == object:
+            is_numeric = np.isin(cell_types, _NUMERIC_CELL_TYPES) & col.notna().to_numpy()
+            numeric_count += is_numeric
+        is_str = cell_types == str
+        if keywords and is_str.any():
+            text = col[is_str].astype(str)
+            hit = np.zeros(len(text), dtype=bool)
+            for keyword in keywords:
+                hit |= text.str.contains(keyword, regex=False).to_numpy(dtype=bool)
+            title_mask[np.flatnonzero(is_str)[hit]] = True
+    return numeric_count > min_numeric, title_mask
+
+
+CONTRACT_COLUMN = "合约"  # 唯一按文本保留的列
+DATE_COLUMNS = ("交易日期", "日期")  # 统一为 YYYYMMDD 整数的列
+_EXACT_INT_LIMIT = 2 ** 53  # 超过该绝对值的整数无法由 float64 精确表示
+
+
+def _xlsx_rows(excel_file):
+    """以 openpyxl 只读模式逐行读取 .xlsx 第一个工作表的单元格值。"""
+    from openpyxl import load_workbook
+    book = load_workbook(excel_file, read_only=True, data_only=True, keep_links=False)
     try:
-        # 读取 Excel 文件
-        df = pd.read_excel(excel_file)
+        sheet = book.worksheets[0]
+        # 不按工作表声明的范围补齐各行，也避免缺少范围声明时先整表扫描一遍
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        book.close()
+
+
+def _xls_rows(excel_file):
+    """以 xlrd 逐行读取 .xls 第一个工作表的单元格值，类型与 openpyxl 对齐：空值与错误值为 None，日期为 datetime。"""
+    import xlrd
+    book = xlrd.open_workbook(excel_file, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for i in range(sheet.nrows):
+            row = []
+            for kind, value in zip(sheet.row_types(i), sheet.row_values(i)):
+                if kind == xlrd.XL_CELL_DATE:
+                    try:
+                        value = xlrd.xldate_as_datetime(value, book.datemode)
+                    except (ValueError, OverflowError, xlrd.xldate.XLDateError):
+                        value = None
+                elif kind == xlrd.XL_CELL_BOOLEAN:
+                    value = bool(value)
+                elif kind in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                    value = None
+                row.append(value)
+            yield row
+    finally:
+        book.release_resources()
+
+
+class _BarColumns:
+    """
+    按标题行各列的位置逐行收集数据行：合约列保留文本（缺失为 NaN），日期列经 `date_key` 转为 YYYYMMDD，
+    其余列只收数值，文本等其他单元格记为 NaN。数值存入 float64 缓冲区，列中全部为可精确表示的整数时输出 int64，否则输出 float64。
+    """
+
+    def __init__(self, header):
+        # 重名列取最后一列的值、保留首次出现的顺序，与 `map_value_columns` 一致
+        positions = {}
+        for position, title in enumerate(header):
+            if title is None or title == "":
+                continue
+            positions[title if isinstance(title, str) else str(title)] = position
+        self.names = list(positions)
+        self.positions = list(positions.values())
+        self.text = [] if CONTRACT_COLUMN in positions else None
+        self.numbers = {name: array("d") for name in self.names if name != CONTRACT_COLUMN}
+        self.integral = dict.fromkeys(self.numbers, True)
+
+    def add(self, row):
+        width = len(row)
+        for name, position in zip(self.names, self.positions):
+            value = row[position] if position < width else None
+            if name == CONTRACT_COLUMN:
+                self.text.append(np.nan if value is None or value == "" else value)
+                continue
+            if name in DATE_COLUMNS:
+                value = date_key(value)
+            if type(value) in _NUMERIC_CELL_TYPES and value == value:
+                if self.integral[name] and not (float(value).is_integer() and abs(value) < _EXACT_INT_LIMIT):
+                    self.integral[name] = False
+                self.numbers[name].append(value)
+            else:
+                self.integral[name] = False
+                self.numbers[name].append(np.nan)
+
+    def to_frames(self):
+        """返回 (title_row, value_rows)：标题行为单行，列名即标题文本。"""
+        data = {}
+        for name in self.names:
+            if name == CONTRACT_COLUMN:
+                data[name] = pd.Series(self.text, dtype=object)
+                continue
+            values = np.frombuffer(self.numbers[name], dtype=np.float64)
+            data[name] = values.astype(np.int64) if self.integral[name] else values
+        value_rows = pd.DataFrame(data, columns=self.names)
+        return pd.DataFrame([self.names], columns=self.names, dtype=object), value_rows
+
 
-        # 筛选包含至少六个数值型且值非 NaN 的单元格的行
-        filtered_rows = df[df.apply(lambda row: sum(
-            [1 for cell in row if isinstance(cell, (int, float)) and not pd.isna(cell)]) > 6, axis=1)]
+def split_excel(excel_file, stats=None, min_numeric=VALUE_ROW_MIN_NUMERIC, keywords=TITLE_KEYWORDS):
+    """
+    逐行读取 Excel 文件（.xlsx 用 openpyxl 只读模式，.xls 用 xlrd），拆分出标题行与数据行；给出 stats 字典时记录读入的行数 rows_in。
+    首个包含关键字的行为标题行，数值型单元格多于 min_numeric 个的行为数据行，按标题行各列的位置直接写入带类型的列（见 `_BarColumns`），
+    表头说明、小计、总计等其余行读过即弃。
 
-        # 查找包含关键字的行
-        title_row = df[df.apply(lambda row: any(isinstance(cell, str) and any(
-            keyword in cell for keyword in ["前收盘"]) for cell in row), axis=1)]
+    Returns:
+        tuple: (title_row, filtered_rows) 两个 DataFrame，列名均为标题行各单元格的文本；没有标题行与数据行时均为空。
+
+    Raises:
+        ValueError: 存在数据行但没有标题行。
+    """
+    rows = _xls_rows(excel_file) if excel_file.endswith(".xls") else _xlsx_rows(excel_file)
+    columns = None
+    early = []  # 标题行之前出现的数据行
+    rows_in = 0
+    for row in rows:
+        rows_in += 1
+        if columns is None and keywords and any(
+                isinstance(value, str) and any(keyword in value for keyword in keywords) for value in row):
+            columns = _BarColumns(row)
+            for early_row in early:
+                columns.add(early_row)
+            early = None
+            continue
+        if sum(type(value) in _NUMERIC_CELL_TYPES and value == value for value in row) > min_numeric:
+            if columns is None:
+                early.append(row)
+            else:
+                columns.add(row)
+    if stats is not None:
+        stats["rows_in"] = rows_in
+    if columns is None:
+        if early:
+            raise ValueError("未找到标题行")
+        return pd.DataFrame(), pd.DataFrame()
+    return columns.to_frames()
+
+
+def convert_excel_to_json(excel_file, output_folder, stats=None):
+    """
+    拆分单个 Excel 文件，生成 .title 与 .value 文件。
+    给出 stats 字典时记录读入行数、输出的数据行数与读写字节数。
+
+    Returns:
+        str | None: 转换失败时返回错误信息，成功返回 None。
+    """
+    try:
+        # 读取 Excel 文件并拆分标题行与数据行
+        title_row, filtered_rows = split_excel(excel_file, stats)
+        if stats is not None:
+            stats.update(rows_out=len(filtered_rows), bytes_read=file_size(excel_file), bytes_written=0)
 
         # 构造输出文件路径
         base_name = os.path.basename(excel_file)
@@ -40,6 +220,8 @@ def convert_excel_to_json(excel_file, output_folder):
             with open(title_output_path, 'w', encoding='utf-8') as json_file:
                 json.dump(title_data, json_file, ensure_ascii=False, indent=4)
             print(f"成功转换: {excel_file} -> {title_output_path}")
+            if stats is not None:
+                stats["bytes_written"] += file_size(title_output_path)
 
         # 保存包含至少六个数值型且值非 NaN 的行数据为 .value.json
         if not filtered_rows.empty:
@@ -48,16 +230,73 @@ def convert_excel_to_json(excel_file, output_folder):
             with open(value_output_path, 'w', encoding='utf-8') as json_file:
                 json.dump(value_data, json_file, ensure_ascii=False, indent=4)
             print(f"成功转换: {excel_file} -> {value_output_path}")
+            if stats is not None:
+                stats["bytes_written"] += file_size(value_output_path)
 
     except Exception as e:
         print(f"转换失败: {excel_file}, 错误: {e}")
+        return str(e)
+    return None
+
+
+def convert_excel_with_stats(excel_file, output_folder):
+    """同 `convert_excel_to_json`，额外返回该文件的耗时与行数、字节数，在子进程中统计后交回主进程记录。"""
+    stats = {}
+    start = time.perf_counter()
+    error = convert_excel_to_json(excel_file, output_folder, stats)
+    stats["seconds"] = time.perf_counter() - start
+    return error, stats
+
+
+def iter_excel_files(func, excel_files, workers=1, *args):
+    """
+    对每个 Excel 文件执行 func(excel_file, *args)，按 excel_files 的顺序逐个产出结果。
+    各文件互不依赖，workers 大于 1 时使用进程池并行。
+
+    Args:
+        func: 可被子进程导入的模块级函数。
+        workers (int): 并行进程数，1 为串行，None 或 0 时使用全部 CPU 核心。
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(excel_files) <= 1:
+        for excel_file in excel_files:
+            yield func(excel_file, *args)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(excel_files))) as executor:
+        yield from executor.map(func, excel_files, *(repeat(arg) for arg in args))
+
+
+def map_excel_files(func, excel_files, workers=1, *args):
+    """对每个 Excel 文件执行 func，返回与 excel_files 顺序一致的结果列表，参数同 `iter_excel_files`。"""
+    return list(iter_excel_files(func, excel_files, workers, *args))
+
+
+def convert_excel_files(excel_files, output_folder, workers=1):
+    """
+    批量拆分 Excel 文件，workers 大于 1 时并行读取，输出文件与串行执行完全一致。
+
+    Args:
+        excel_files (list): Excel 文件路径列表。
+        output_folder (str): 输出目录。
+        workers (int): 并行进程数，1 为串行，None 或 0 时使用全部 CPU 核心。
+
+    Returns:
+        list: 转换失败的 (文件路径, 错误信息) 列表。
+    """
+    errors = []
+    for excel_file, (error, stats) in zip(excel_files, iter_excel_files(convert_excel_with_stats, excel_files,
+                                                                         workers, output_folder)):
+        StockPipelineMetrics.record_file("split", excel_file, error, **stats)
+        if error is not None:
+            errors.append((excel_file, error))
+    return errors
 
 
-def main(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER):
+def main(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER, workers=1):
     os.makedirs(output_folder, exist_ok=True)
     excel_files = find_excel_files(input_folder)
-    for excel_file in excel_files:
-        convert_excel_to_json(excel_file, output_folder)
+    return convert_excel_files(excel_files, output_folder, workers)
 
 
 if __name__ == "__main__":
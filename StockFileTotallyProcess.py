@@ -8,35 +8,396 @@
 # 2. 转换json文件中的字段
 # 3. 处理临时文件
 # 4. 合并文件
+# 内存模式（in_memory=True）在内存中串联以上四步，只写出最终的按合约 JSON 文件
+# 增量模式（incremental=True）按源文件清单只处理新增或变化的工作簿，只重写受影响的合约
+# 流水模式（pipelined=True）各工作簿经有界队列依次流过拆分、标题映射与合约补全，边处理边写出合约文件
+# 指定 report_path 或开启 profile/trace_memory 时记录各阶段指标并写出 JSON 运行报告
 # @Version : 1.0
 
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
 import StockDataSpliter
 import StockJsonTransfer
 import StockTempFile
 import StockCombineFile
+from StockBarStore import contract_file_suffix
+from StockContractCatalog import ContractCatalog
+from StockPipelineManifest import PipelineManifest
+from StockPipelineMetrics import RunMetrics, collecting, file_size, record_file, stage
 
 DEFAULT_INPUT_FOLDER = StockDataSpliter.DEFAULT_INPUT_FOLDER
 DEFAULT_OUTPUT_FOLDER = StockDataSpliter.DEFAULT_OUTPUT_FOLDER
+# 未指定报告路径时写入输出目录，不使用 .json 后缀以免被当作合约文件
+DEFAULT_REPORT_NAME = "pipeline.report"
+PIPELINE_QUEUE_SIZE = 4  # 流水模式下相邻阶段之间最多排队的工作簿数
+
+
+def process_excel_in_memory(excel_file, stats=None):
+    """
+    在内存中处理单个 Excel：拆分 -> 标题映射 -> 合约补全 -> 按合约分组，不生成中间文件。
+    给出 stats 字典时记录读入的行数。
+
+    Returns:
+        tuple: (contract_map, error)，contract_map 为合约名到记录列表的映射，失败时 error 为错误信息。
+    """
+    try:
+        title_row, value_rows = StockDataSpliter.split_excel(excel_file, stats)
+        return group_value_rows(title_row, value_rows)
+    except Exception as e:
+        return {}, str(e)
+
+
+def group_value_rows(title_row, value_rows):
+    """标题映射 -> 合约补全 -> 按合约分组，返回 (contract_map, error)。"""
+    contract_map = {}
+    if value_rows.empty:
+        return contract_map, None
+    if title_row.empty:
+        return contract_map, "未找到标题行"
+    mapped = StockJsonTransfer.map_value_columns(title_row.iloc[0].tolist(), value_rows)
+    filled = StockTempFile.fill_contract_column(mapped)
+    StockCombineFile.group_records_by_contract(filled.to_dict(orient='records'), contract_map)
+    return contract_map, None
+
+
+def process_excel_with_stats(excel_file):
+    """同 `process_excel_in_memory`，额外返回该文件的耗时、行数与读取字节数。"""
+    stats = {"bytes_read": file_size(excel_file)}
+    start = time.perf_counter()
+    contract_map, error = process_excel_in_memory(excel_file, stats)
+    stats["rows_out"] = sum(len(items) for items in contract_map.values())
+    stats["seconds"] = time.perf_counter() - start
+    return contract_map, error, stats
+
+
+def _temp_file_order(excel_file):
+    # 与文件模式下合并阶段按 .temp 文件名排序的顺序保持一致
+    return os.path.splitext(os.path.basename(excel_file))[0] + '.temp'
+
+
+def run_in_memory(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER, workers=1,
+                  output_format="json", memory_budget=None, merge=False):
+    """
+    内存流水线：各阶段直接传递 DataFrame，只写出最终的按合约 JSON 文件，输出与文件模式一致。
+    指定 memory_budget（字节）时按合约流式合并，超出预算的缓冲写入溢出文件；
+    merge 为 True 时按日期合并进已有的合约文件。
+
+    Returns:
+        list: 处理失败的 (文件路径, 错误信息) 列表。
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    excel_files = sorted(StockDataSpliter.find_excel_files(input_folder), key=_temp_file_order)
+    print("正在内存中处理Excel文件...")
+    results = StockDataSpliter.iter_excel_files(process_excel_with_stats, excel_files, workers)
+
+    contract_map = {}
+    catalog = ContractCatalog.open(output_folder)
+    combiner = None
+    if memory_budget:
+        combiner = StockCombineFile.StreamingCombiner(
+            os.path.join(output_folder, StockCombineFile.SPILL_FOLDER), memory_budget)
+    errors = []
+    with stage("process"):
+        for excel_file, (file_map, error, stats) in zip(excel_files, results):
+            record_file("process", excel_file, error, **stats)
+            if error is not None:
+                print(f"处理失败: {excel_file}, 错误: {error}")
+                errors.append((excel_file, error))
+                continue
+            if combiner is not None:
+                combiner.add_contract_map(file_map)
+                continue
+            for contract, items in file_map.items():
+                contract_map.setdefault(contract, []).extend(items)
+
+    print("正在合并文件...")
+    with stage("combine"):
+        if combiner is not None:
+            combiner.finish(output_folder, output_format, merge, catalog)
+        else:
+            StockCombineFile.save_contract_map(contract_map, output_folder, output_format, merge, catalog)
+        catalog.save()
+    print("全部处理完成。")
+    return errors
+
+
+_DONE = object()  # 流水模式中表示上游已结束的队列标记
+
+
+def split_workbook(excel_file):
+    """流水模式的读取阶段：拆分单个工作簿，返回 (excel_file, title_row, value_rows, error, stats)。"""
+    stats = {"bytes_read": file_size(excel_file)}
+    start = time.perf_counter()
+    try:
+        title_row, value_rows = StockDataSpliter.split_excel(excel_file, stats)
+        error = None
+    except Exception as e:
+        title_row = value_rows = None
+        error = str(e)
+    stats["seconds"] = time.perf_counter() - start
+    return excel_file, title_row, value_rows, error, stats
+
+
+def _stage_thread(target, failures):
+    # 阶段线程出错时记录异常，由主线程在消费结束后抛出
+    def run():
+        try:
+            target()
+        except BaseException as e:
+            failures.append(e)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
 
 
-def main(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER):
+def run_pipelined(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER, workers=1,
+                  output_format="json", merge=False):
+    """
+    流水模式：读取（拆分）、转换（标题映射与合约补全）、写出三个阶段各自运行，经有界队列逐个传递工作簿，
+    不在阶段之间等待整个目录处理完，也不扫描中间文件。workers 大于 1 时读取阶段使用进程池，
+    队列中放入按顺序提交的 Future。写出阶段按工作簿顺序将各合约的记录追加到合约文件，
+    第一个工作簿处理完即可看到合约文件，最终输出与文件模式一致；内存占用只与排队的工作簿数有关。
+
+    Returns:
+        list: 处理失败的 (文件路径, 错误信息) 列表。
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    excel_files = sorted(StockDataSpliter.find_excel_files(input_folder), key=_temp_file_order)
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(len(excel_files), 1))
+    split_queue = queue.Queue(maxsize=max(PIPELINE_QUEUE_SIZE, workers * 2))
+    group_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    failures = []
+
+    def read_stage():
+        try:
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for excel_file in excel_files:
+                        split_queue.put(executor.submit(split_workbook, excel_file))
+            else:
+                for excel_file in excel_files:
+                    split_queue.put(split_workbook(excel_file))
+        finally:
+            split_queue.put(_DONE)
+
+    def transform_stage():
+        try:
+            while True:
+                item = split_queue.get()
+                if item is _DONE:
+                    break
+                excel_file, title_row, value_rows, error, stats = item.result() if isinstance(item, Future) else item
+                start = time.perf_counter()
+                contract_map = {}
+                if error is None:
+                    try:
+                        contract_map, error = group_value_rows(title_row, value_rows)
+                    except Exception as e:
+                        error = str(e)
+                stats["rows_out"] = sum(len(items) for items in contract_map.values())
+                stats["seconds"] += time.perf_counter() - start
+                group_queue.put((excel_file, contract_map, error, stats))
+        except BaseException:
+            # 出错后继续取走读取阶段的输出，避免其阻塞在已满的队列上
+            while split_queue.get() is not _DONE:
+                pass
+            raise
+        finally:
+            group_queue.put(_DONE)
+
+    print("正在流水处理Excel文件...")
+    threads = [_stage_thread(read_stage, failures), _stage_thread(transform_stage, failures)]
+    catalog = ContractCatalog.open(output_folder)
+    appender = StockCombineFile.ContractAppender(output_folder, output_format, merge, catalog)
+    errors = []
+    with stage("process"):
+        while True:
+            item = group_queue.get()
+            if item is _DONE:
+                break
+            excel_file, contract_map, error, stats = item
+            record_file("process", excel_file, error, **stats)
+            if error is not None:
+                print(f"处理失败: {excel_file}, 错误: {error}")
+                errors.append((excel_file, error))
+                continue
+            appender.add_contract_map(contract_map)
+            print(f"已处理: {excel_file}")
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    with stage("combine"):
+        appender.finish()
+        catalog.save()
+    print("全部处理完成。")
+    return errors
+
+
+def run_incremental(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER, workers=1,
+                    output_format="json"):
+    """
+    增量流水线：依据输出目录下的源文件清单，只重新处理新增或变化的工作簿，
+    并只重写受影响的合约文件。每处理完一个工作簿即保存清单，中断后再次运行会从中断处继续。
+
+    Returns:
+        list: 处理失败的 (文件路径, 错误信息) 列表。
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = PipelineManifest(output_folder, input_folder)
+    excel_files = sorted(StockDataSpliter.find_excel_files(input_folder), key=_temp_file_order)
+    current_keys = {manifest.source_key(excel_file) for excel_file in excel_files}
+
+    # 1. 清理已删除的源文件
+    for key in [key for key in manifest.sources if key not in current_keys]:
+        print(f"源文件已删除: {key}")
+        manifest.remove_source(key)
+    manifest.save()
+
+    # 2. 只处理新增或变化的工作簿
+    changed_files = [excel_file for excel_file in excel_files if not manifest.is_unchanged(excel_file)]
+    print(f"共 {len(excel_files)} 个工作簿，其中 {len(changed_files)} 个需要处理...")
+    errors = []
+    results = StockDataSpliter.iter_excel_files(process_excel_with_stats, changed_files, workers)
+    with stage("process"):
+        for excel_file, (file_map, error, stats) in zip(changed_files, results):
+            record_file("process", excel_file, error, **stats)
+            if error is not None:
+                print(f"处理失败: {excel_file}, 错误: {error}")
+                errors.append((excel_file, error))
+                continue
+            manifest.record_source(excel_file, file_map)
+            manifest.save()
+            print(f"已处理: {excel_file}")
+
+    # 3. 重写受影响的合约，合约内按源文件顺序拼接
+    ordered_keys = [manifest.source_key(excel_file) for excel_file in excel_files
+                    if manifest.source_key(excel_file) in manifest.sources]
+    contract_sources = {}
+    for key in ordered_keys:
+        for contract in manifest.sources[key]["contracts"]:
+            contract_sources.setdefault(contract, []).append(key)
+    partitions = {}
+    catalog = ContractCatalog.open(output_folder)
+    print(f"正在重写 {len(manifest.pending_contracts)} 个合约...")
+    # 重写合约是幂等的，每重写一批保存一次清单即可保证中断后可继续
+    with stage("combine"):
+        for count, contract in enumerate(sorted(manifest.pending_contracts), start=1):
+            items = []
+            for key in contract_sources.get(contract, []):
+                if key not in partitions:
+                    partitions[key] = manifest.load_partition(key)
+                items.extend(partitions[key][contract])
+            if items:
+                StockCombineFile.save_contract_map({contract: items}, output_folder, output_format, catalog=catalog)
+            else:
+                file_name = contract + contract_file_suffix(output_format)
+                out_path = os.path.join(output_folder, file_name)
+                if os.path.exists(out_path):
+                    os.remove(out_path)
+                    print(f"已删除: {out_path}")
+                catalog.remove(file_name)
+            manifest.pending_contracts.discard(contract)
+            if count % 100 == 0:
+                catalog.save()
+                manifest.save()
+        catalog.save()
+        manifest.save()
+    print("全部处理完成。")
+    return errors
+
+
+def run_files(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER, workers=1,
+              output_format="json", memory_budget=None, merge=False):
+    """
+    文件流水线：依次执行四个阶段，各阶段之间通过中间文件传递数据。
+
+    Returns:
+        list: 拆分失败的 (文件路径, 错误信息) 列表。
+    """
     # 1. 拆分Excel并生成json
     print("正在拆分Excel文件...")
-    StockDataSpliter.main(input_folder, output_folder)
+    with stage("split"):
+        errors = StockDataSpliter.main(input_folder, output_folder, workers)
+    for excel_file, error in errors:
+        print(f"拆分失败: {excel_file}, 错误: {error}")
 
     # 2. 转换json字段
     print("正在转换json字段...")
-    StockJsonTransfer.main(output_folder)
+    with stage("transfer"):
+        StockJsonTransfer.main(output_folder)
 
     # 3. 处理临时文件
     print("正在处理临时文件...")
-    StockTempFile.main(output_folder)
+    with stage("fill"):
+        StockTempFile.main(output_folder)
 
     # 4. 合并文件
     print("正在合并文件...")
-    StockCombineFile.main(output_folder)
+    with stage("combine"):
+        StockCombineFile.main(output_folder, output_format, memory_budget, merge)
 
     print("全部处理完成。")
+    return errors
+
+
+def check_options(in_memory=False, incremental=False, pipelined=False, memory_budget=None, merge=False):
+    """检查运行模式与参数的组合：同时选择多种模式，或所选模式不支持的参数，抛出 ValueError。"""
+    modes = [name for name, on in (("内存模式（in_memory）", in_memory), ("增量模式（incremental）", incremental),
+                                   ("流水模式（pipelined）", pipelined)) if on]
+    if len(modes) > 1:
+        raise ValueError(f"只能选择一种运行模式: {'、'.join(modes)}")
+    # 增量模式按合约整体重写，流水模式逐批追加，均不经过带内存预算的流式合并
+    if memory_budget and (incremental or pipelined):
+        raise ValueError(f"{modes[0]}不支持内存预算（memory_budget）")
+    if merge and incremental:
+        raise ValueError(f"{modes[0]}不支持合并进已有文件（merge）")
+
+
+def _run(input_folder, output_folder, workers, in_memory, incremental, pipelined, output_format, memory_budget,
+         merge):
+    if incremental:
+        return run_incremental(input_folder, output_folder, workers, output_format)
+    if pipelined:
+        return run_pipelined(input_folder, output_folder, workers, output_format, merge)
+    if in_memory:
+        return run_in_memory(input_folder, output_folder, workers, output_format, memory_budget, merge)
+    return run_files(input_folder, output_folder, workers, output_format, memory_budget, merge)
+
+
+def main(input_folder=DEFAULT_INPUT_FOLDER, output_folder=DEFAULT_OUTPUT_FOLDER, workers=1, in_memory=False,
+         incremental=False, output_format="json", memory_budget=None, merge=False,
+         report_path=None, profile=False, trace_memory=False, pipelined=False):
+    """
+    运行流水线，模式与参数的组合见 `check_options`。指定 report_path 或开启 profile/trace_memory 时记录各阶段与逐文件的耗时、行数、
+    读写字节数与峰值内存，写出 JSON 运行报告（默认为输出目录下的 pipeline.report），
+    profile 为 True 时另写出同名 .prof 文件。
+    """
+    check_options(in_memory, incremental, pipelined, memory_budget, merge)
+    args = (input_folder, output_folder, workers, in_memory, incremental, pipelined, output_format, memory_budget,
+            merge)
+    if report_path is None and not profile and not trace_memory:
+        return _run(*args)
+
+    metrics = RunMetrics(trace_memory=trace_memory, profile=profile)
+    metrics.options = {
+        "input_folder": input_folder, "output_folder": output_folder, "workers": workers,
+        "mode": ("incremental" if incremental else "pipelined" if pipelined else
+                 "in_memory" if in_memory else "files"),
+        "output_format": output_format, "memory_budget": memory_budget, "merge": merge,
+    }
+    with collecting(metrics):
+        errors = _run(*args)
+    report_path = report_path or os.path.join(output_folder, DEFAULT_REPORT_NAME)
+    metrics.write_report(report_path)
+    print(f"运行报告已写入: {report_path}")
+    return errors
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+from StockProcessData import ProcessType, process_json_file
+
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class FrameCache:
+    """
+    `process_json_file` 结果的 LRU 缓存，键为 (文件路径, 修改时间, 文件大小, ProcessType)，文件变化后自动失效。
+    内存中按 DataFrame 实际占用字节数淘汰最久未使用的条目；指定 disk_folder 时结果同时写入磁盘，
+    下次启动时内存未命中可直接从磁盘读取，免去重新解析与缠论处理。
+    可在多个线程中同时使用，解析与处理在锁外执行。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, disk_folder=None):
+        self.max_bytes = max_bytes
+        self.disk_folder = disk_folder
+        self.entries = OrderedDict()  # 键 -> (DataFrame, 字节数)
+        self.total_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if disk_folder:
+            os.makedirs(disk_folder, exist_ok=True)
+
+    @staticmethod
+    def _key(filename, process_type):
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size, process_type.value
+
+    def _disk_path(self, key):
+        # 每个 (文件, 处理类型) 只保留一个磁盘条目，文件变化后覆盖写入
+        name = hashlib.sha1(f"{key[0]}|{key[3]}".encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.disk_folder, name + ".pkl")
+
+    def _load_disk(self, key):
+        if not self.disk_folder:
+            return None
+        disk_path = self._disk_path(key)
+        if not os.path.exists(disk_path):
+            return None
+        try:
+            with open(disk_path, 'rb') as f:
+                stored_key, df = pickle.load(f)
+        except Exception:
+            return None
+        return df if tuple(stored_key) == key else None
+
+    def _save_disk(self, key, df):
+        disk_path = self._disk_path(key)
+        temp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump((key, df), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, disk_path)
+
+    def _store(self, key, df):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (df, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def get(self, filename: str, process_type: ProcessType):
+        """
+        返回 `process_json_file(filename, process_type)` 的结果，命中时返回缓存数据的副本，
+        调用方修改返回值不会影响缓存。
+        """
+        key = self._key(filename, process_type)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0].copy()
+
+        df = self._load_disk(key)
+        disk_hit = df is not None
+        if not disk_hit:
+            df = process_json_file(filename, process_type)
+            if self.disk_folder:
+                self._save_disk(key, df)
+        with self._lock:
+            if disk_hit:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            if key not in self.entries:
+                self._store(key, df)
+        return df.copy()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """命中与占用统计，用于评估缓存容量是否合适。"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -1,5 +1,8 @@
 import os
 import json
+import time
+
+from StockPipelineMetrics import file_size, record_file
 
 
 DEFAULT_FOLDER = r"E:\stock_json"
@@ -19,6 +22,10 @@ def process_value_and_title_files(folder_path):
         print(f"错误: 未找到同名的 .title 文件: {title_file_path}")
         continue
 
+      start = time.perf_counter()
+      error = None
+      # 读取失败时按 0 行记录，也不会沿用上一个文件的数据
+      value_data, map_list = [], []
       try:
         # 读取 .title 文件并转换为 map
         with open(title_file_path, 'r', encoding='utf-8') as title_file:
@@ -66,6 +73,7 @@ def process_value_and_title_files(folder_path):
       except Exception as e:
         # 捕获并打印处理文件时的异常
         print(f"处理文件时出错: {file}, 错误: {e}")
+        error = e
 
       # 将 map_list 转换为 JSON 并存入 .finished 文件
       finished_file_path = os.path.join(folder_path,
@@ -78,6 +86,36 @@ def process_value_and_title_files(folder_path):
                   indent=4)
 
       print(f"已生成文件: {finished_file_path}")
+      record_file("transfer", value_file_path, error, rows_in=len(value_data), rows_out=len(map_list),
+                  bytes_read=file_size(value_file_path) + file_size(title_file_path),
+                  bytes_written=file_size(finished_file_path), seconds=time.perf_counter() - start)
+
+
+def _json_key(key):
+  """按 json.dump 的规则将字典键转换为字符串，与写入 .finished 后再读取的键保持一致。"""
+  return next(iter(json.loads(json.dumps({key: None}))))
+
+
+def map_value_columns(title_values, value_df):
+  """
+  内存版标题映射：以标题行各单元格的值作为列名，按位置重命名数据行各列，并将 "交易日期" 改名为 "日期"。
+  列顺序与重名列的取值规则与 .finished 文件一致。
+
+  Args:
+    title_values (list): 标题行的单元格值。
+    value_df (pd.DataFrame): 数据行。
+
+  Returns:
+    pd.DataFrame: 映射后的数据行。
+  """
+  columns = {}
+  for position, title in enumerate(title_values):
+    columns[_json_key(title)] = position
+  if "交易日期" in columns:
+    columns["日期"] = columns.pop("交易日期")
+  mapped = value_df.iloc[:, list(columns.values())].copy()
+  mapped.columns = list(columns.keys())
+  return mapped
 
 
 def main(folder_path=DEFAULT_FOLDER):
@@ -0,0 +1,301 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from StockBarStore import DATE_COLUMN, contract_file_suffix, read_contract_file
+from StockContractCatalog import ContractCatalog
+from StockContractStore import date_key, load_window, merge_contract_file
+
+
+# 主力连续合约：同一品种的各交割月份按日期对齐成 日期 x 合约 的矩阵，逐日选出持仓量（或成交量）最大的合约，
+# 切换带滞后：新合约需连续 confirm 天超过当前主力的 threshold 倍才切换，且只向更远的交割月份切换。
+# 结果按品种写入数据目录下的 main 子目录，每行附带截至当日的累计换月价差与比例，读取时据此做后复权；
+# 状态文件记录最近一次换月的日期与合约，增量更新只重算其后的部分并按日期合并进已有文件。
+MAIN_FOLDER = "main"
+STATE_NAME = "main.state"
+CONTRACT_COLUMN = "合约"
+CLOSE_COLUMN = "收盘价"
+RANK_COLUMNS = ("持仓量", "成交量")
+GAP_COLUMN = "累计价差"
+RATIO_COLUMN = "累计比例"
+ADJUST_METHODS = ("none", "add", "ratio")
+PRICE_COLUMNS = ("前收盘", "前结算", "开盘价", "最高价", "最低价", "收盘价", "结算价")
+DEFAULT_THRESHOLD = 1.1
+DEFAULT_CONFIRM_DAYS = 2
+
+
+def _delivery_order(delivery):
+    return (len(delivery), delivery)
+
+
+def select_main(ranks, threshold=DEFAULT_THRESHOLD, confirm=DEFAULT_CONFIRM_DAYS, current=None):
+    """
+    逐日选出主力合约。
+
+    Args:
+        ranks (np.ndarray): 日期 x 合约 的排序指标，列按交割月份升序，未交易处为 NaN。
+        threshold (float): 更远月份的指标需超过当前主力的倍数。
+        confirm (int): 需连续满足条件的天数；当前主力个别日期无数据时沿用其最近的指标，最后一个交易日之后立即切换。
+        current (int): 首日的主力列号，None 时取首个有数据日的最大者。
+
+    Returns:
+        np.ndarray: 每日主力的列号，尚无数据的日期为 -1。
+    """
+    n, m = ranks.shape
+    filled = np.where(np.isnan(ranks), -np.inf, ranks)
+    choice = np.full(n, -1, dtype=np.int64)
+    start = 0
+    if current is None:
+        traded = np.flatnonzero(np.isfinite(filled).any(axis=1))
+        if not len(traded):
+            return choice
+        start = int(traded[0])
+        current = int(np.argmax(filled[start]))
+    confirm = max(1, confirm)
+    # 每段从上次切换处开始，向量化地找出下一个切换日，循环次数等于换月次数
+    while start < n:
+        own = filled[start:, current]
+        # 缺失日沿用最近的指标，只有在当前主力最后一个交易日之后才视为已停止交易
+        days = np.arange(n - start)
+        last_seen = np.maximum.accumulate(np.where(np.isfinite(own), days, -1))
+        expired = days > last_seen[-1]
+        own = np.where(last_seen >= 0, own[np.maximum(last_seen, 0)], -np.inf)
+        later = filled[start:, current + 1:].max(axis=1) if current + 1 < m else np.full(n - start, -np.inf)
+        beaten = (later > threshold * own).astype(np.int64)
+        runs = np.cumsum(beaten)
+        runs[confirm:] -= runs[:-confirm].copy()
+        switch = (runs >= confirm) | (expired & np.isfinite(later))
+        hits = np.flatnonzero(switch)
+        if not len(hits):
+            choice[start:] = current
+            break
+        stop = start + int(hits[0])
+        choice[start:stop] = current
+        current = current + 1 + int(np.argmax(filled[stop, current + 1:]))
+        start = stop
+    return choice
+
+
+def _product_files(catalog, product, since=None, delivery=None):
+    """品种的各交割月份文件，按交割月份排序；可只取 since 之后仍在交易、交割月份不早于 delivery 的合约。"""
+    files = []
+    for file_name, entry in catalog.entries.items():
+        if entry["product"] != product or not entry["delivery"]:
+            continue
+        if since is not None and entry["end"] is not None and entry["end"] < since:
+            continue
+        if delivery is not None and _delivery_order(entry["delivery"]) < _delivery_order(delivery):
+            continue
+        files.append((_delivery_order(entry["delivery"]), entry["contract"], file_name))
+    return [(contract, file_name) for _, contract, file_name in sorted(files)]
+
+
+def _source_stamps(folder_path, files):
+    # 增量窗口内各源文件的大小与修改时间，均未变化时无需重算
+    stamps = {}
+    for _, file_name in files:
+        stat = os.stat(os.path.join(folder_path, file_name))
+        stamps[file_name] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def _load_long(folder_path, files, since):
+    """读取各合约（since 起）的K线并纵向拼接，附加日期键与合约列号。"""
+    frames = []
+    for column, (contract, file_name) in enumerate(files):
+        path = os.path.join(folder_path, file_name)
+        df = read_contract_file(path) if since is None else load_window(path, since)
+        if not len(df) or DATE_COLUMN not in df.columns:
+            continue
+        df = df.assign(**{CONTRACT_COLUMN: contract})
+        keys = df[DATE_COLUMN].map(date_key)
+        df = df[keys.notna()].assign(_key=keys[keys.notna()].astype(np.int64), _column=column)
+        frames.append(df)
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True).drop_duplicates(["_key", "_column"], keep="last")
+
+
+def build_main_frame(long, count, rank=RANK_COLUMNS[0], threshold=DEFAULT_THRESHOLD,
+                     confirm=DEFAULT_CONFIRM_DAYS, current=None, gap=0.0, ratio=1.0):
+    """
+    由各合约拼接的K线生成主力连续序列。
+
+    Args:
+        long (pd.DataFrame): `_load_long` 的结果，含 _key 与 _column。
+        count (int): 合约列数。
+        current (int): 首日的主力列号，增量更新时为上次换月后的合约。
+        gap, ratio: 首日的累计换月价差与比例。
+
+    Returns:
+        pd.DataFrame: 每个交易日一行，为当日主力合约的K线，附加累计价差与累计比例列。
+    """
+    columns = pd.RangeIndex(count)
+    ranks = long.pivot(index="_key", columns="_column", values=rank).reindex(columns=columns)
+    closes = long.pivot(index="_key", columns="_column", values=CLOSE_COLUMN).reindex(columns=columns)
+    choice = select_main(ranks.to_numpy(dtype=float), threshold, confirm, current)
+
+    # 换月日按新旧合约的收盘价计价差，旧合约当日无数据时取其最近的收盘价
+    rows = np.flatnonzero((choice[1:] != choice[:-1]) & (choice[:-1] >= 0)) + 1
+    last_close = closes.ffill().to_numpy(dtype=float)
+    new_close = last_close[rows, choice[rows]]
+    old_close = last_close[rows, choice[rows - 1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step_gap = np.where(np.isfinite(new_close - old_close), new_close - old_close, 0.0)
+        step_ratio = np.where(np.isfinite(new_close / old_close) & (old_close != 0), new_close / old_close, 1.0)
+    gaps = np.zeros(len(choice))
+    ratios = np.ones(len(choice))
+    gaps[rows] = step_gap
+    ratios[rows] = step_ratio
+
+    selected = pd.DataFrame({"_key": ranks.index.to_numpy(), "_column": choice,
+                             GAP_COLUMN: gap + np.cumsum(gaps), RATIO_COLUMN: ratio * np.cumprod(ratios)})
+    merged = selected[choice >= 0].merge(long, on=["_key", "_column"], how="inner", sort=True)
+    return merged.drop(columns=["_key", "_column"])
+
+
+def back_adjust(df, method="add", base=None):
+    """
+    对主力连续序列做后复权：以最新合约为基准，add 为各价格列加上其后的累计换月价差，ratio 为乘以其后的累计比例。
+    base 为基准行的 (累计价差, 累计比例)，默认取 df 的末行。
+    """
+    if method == "none" or not len(df):
+        return df
+    if method not in ADJUST_METHODS:
+        raise ValueError(f"未知的复权方式: {method}")
+    gap, ratio = base if base is not None else (df[GAP_COLUMN].iloc[-1], df[RATIO_COLUMN].iloc[-1])
+    df = df.copy()
+    for col in PRICE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col] + (gap - df[GAP_COLUMN]) if method == "add" else df[col] * (ratio / df[RATIO_COLUMN])
+    return df
+
+
+def load_main(path, method="none", start=None, end=None):
+    """读取主力连续序列（可按日期区间）；复权基准为文件中的最新合约，任意区间的复权结果与全量一致。"""
+    df = load_window(path, start, end)
+    if method == "none" or not len(df):
+        return df
+    tail = load_window(path, df[DATE_COLUMN].iloc[-1], columns=[GAP_COLUMN, RATIO_COLUMN])
+    return back_adjust(df, method, (tail[GAP_COLUMN].iloc[-1], tail[RATIO_COLUMN].iloc[-1]))
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("products", {})
+
+
+def _save_state(path, products):
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": 1, "products": products}, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def update_main_contract(folder_path, product, output_folder, rank=RANK_COLUMNS[0], threshold=DEFAULT_THRESHOLD,
+                         confirm=DEFAULT_CONFIRM_DAYS, output_format="json", rebuild=False, catalog=None,
+                         state=None):
+    """
+    生成或增量更新一个品种的主力连续序列文件（output_folder 下的 <品种>.json/.kbar）。
+    已有结果且设置未变时，从最近一次换月日起只读取仍在交易的合约、重算并合并进已有文件，这些合约文件均未变化时跳过；
+    否则读取该品种全部交割月份全量重建。换月日之前的源数据被修改时需 rebuild。
+
+    Returns:
+        int: 重新计算的交易日数。
+    """
+    catalog = catalog or ContractCatalog.open(folder_path)
+    state = {} if state is None else state
+    path = os.path.join(output_folder, product + contract_file_suffix(output_format))
+    settings = {"rank": rank, "threshold": threshold, "confirm": confirm, "format": output_format}
+    previous = state.get(product)
+    incremental = (not rebuild and previous is not None and os.path.exists(path)
+                   and previous.get("settings") == settings)
+
+    current = None
+    gap, ratio = 0.0, 1.0
+    if incremental:
+        files = _product_files(catalog, product, previous["roll_date"], previous["contract"][len(product):])
+        contracts = [contract for contract, _ in files]
+        incremental = previous["contract"] in contracts
+        if incremental and previous.get("sources") == _source_stamps(folder_path, files):
+            return 0
+    if incremental:
+        since = previous["roll_date"]
+        current = contracts.index(previous["contract"])
+        gap, ratio = previous["gap"], previous["ratio"]
+    else:
+        since = None
+        files = _product_files(catalog, product)
+        if os.path.exists(path):
+            os.remove(path)
+    long = _load_long(folder_path, files, since)
+    if long is None or rank not in long.columns:
+        return 0
+    df = build_main_frame(long, len(files), rank, threshold, confirm, current, gap, ratio)
+    if not len(df):
+        return 0
+
+    os.makedirs(output_folder, exist_ok=True)
+    merge_contract_file(path, df.to_dict(orient='records'))
+    # 记录最后一段主力的起始日期，下次从这里重算
+    contracts = df[CONTRACT_COLUMN].to_numpy()
+    first = int(np.flatnonzero(contracts != contracts[-1])[-1] + 1) if (contracts != contracts[-1]).any() else 0
+    row = df.iloc[first]
+    roll_date, contract = date_key(row[DATE_COLUMN]), str(row[CONTRACT_COLUMN])
+    files = _product_files(catalog, product, roll_date, contract[len(product):])
+    state[product] = {
+        "settings": settings, "contract": contract, "roll_date": roll_date,
+        "gap": float(row[GAP_COLUMN]), "ratio": float(row[RATIO_COLUMN]), "end": date_key(df[DATE_COLUMN].iloc[-1]),
+        "sources": _source_stamps(folder_path, files),
+    }
+    return len(df)
+
+
+def update_main_contracts(folder_path, output_folder=None, products=None, rebuild=False, **options):
+    """
+    为数据目录中的各品种（或指定品种）生成或增量更新主力连续序列，状态保存在输出目录的 main.state。
+
+    Returns:
+        dict: {品种: 重新计算的交易日数}。
+    """
+    output_folder = output_folder or os.path.join(folder_path, MAIN_FOLDER)
+    catalog = ContractCatalog.open(folder_path, refresh=True)
+    state_path = os.path.join(output_folder, STATE_NAME)
+    state = _load_state(state_path)
+    products = products or sorted({entry["product"] for entry in catalog.entries.values() if entry["delivery"]})
+    counts = {}
+    for product in products:
+        counts[product] = update_main_contract(folder_path, product, output_folder, rebuild=rebuild,
+                                               catalog=catalog, state=state, **options)
+    if any(counts.values()):
+        catalog.save()
+        _save_state(state_path, state)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成按持仓量或成交量切换的主力连续合约")
+    parser.add_argument("folder", help="合约文件目录")
+    parser.add_argument("--output", default=None, help=f"输出目录，默认为合约目录下的 {MAIN_FOLDER}")
+    parser.add_argument("--product", action="append", default=None, help="只处理指定品种，可重复")
+    parser.add_argument("--rank", choices=RANK_COLUMNS, default=RANK_COLUMNS[0], help="选择主力的指标")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="新合约需超过当前主力的倍数")
+    parser.add_argument("--confirm", type=int, default=DEFAULT_CONFIRM_DAYS, help="需连续满足条件的天数")
+    parser.add_argument("--output-format", choices=("json", "kbar"), default="json", help="输出格式")
+    parser.add_argument("--rebuild", action="store_true", help="忽略已有结果，全量重建")
+    args = parser.parse_args(argv)
+
+    counts = update_main_contracts(args.folder, args.output, args.product, args.rebuild, rank=args.rank,
+                                   threshold=args.threshold, confirm=args.confirm, output_format=args.output_format)
+    for product, count in counts.items():
+        print(f"{product}\t重新计算 {count} 个交易日")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+
+
+MANIFEST_NAME = "pipeline.manifest"
+PARTITION_FOLDER = ".manifest_cache"
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """分块计算文件内容的 sha256。"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    # 先写临时文件再替换，避免中断时留下半截文件
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+class PipelineManifest:
+    """
+    增量流水线的源文件清单，保存在输出目录下：
+    - 每个源工作簿的大小、修改时间、内容哈希及其贡献的合约；
+    - 每个源工作簿按合约分组后的数据分区（位于 .manifest_cache），供重写受影响合约时复用；
+    - 尚未重写完成的合约（pending_contracts），中断后下次运行可从此处继续。
+    """
+
+    def __init__(self, output_folder, input_folder):
+        self.output_folder = output_folder
+        self.input_folder = input_folder
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.partition_folder = os.path.join(output_folder, PARTITION_FOLDER)
+        self.sources = {}
+        self.pending_contracts = set()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.sources = data.get("sources", {})
+            self.pending_contracts = set(data.get("pending_contracts", []))
+
+    def source_key(self, excel_file):
+        """源文件在清单中的键：相对输入目录的路径。"""
+        return os.path.relpath(excel_file, self.input_folder).replace('\\', '/')
+
+    def is_unchanged(self, excel_file):
+        """
+        判断源文件自上次处理后是否未变化：大小与修改时间一致直接视为未变化，
+        否则比较内容哈希（仅修改时间变化时同步更新清单）。
+        """
+        entry = self.sources.get(self.source_key(excel_file))
+        if entry is None:
+            return False
+        stat = os.stat(excel_file)
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        if entry["size"] == stat.st_size and entry["sha256"] == file_sha256(excel_file):
+            entry["mtime_ns"] = stat.st_mtime_ns
+            return True
+        return False
+
+    def _partition_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.partition_folder, name + ".json")
+
+    def record_source(self, excel_file, contract_map):
+        """
+        记录一个已处理的源文件并保存其数据分区。
+
+        Returns:
+            set: 受影响的合约（旧记录与新结果中出现过的合约）。
+        """
+        key = self.source_key(excel_file)
+        old = self.sources.get(key)
+        affected = set(old["contracts"]) if old else set()
+        affected.update(contract_map)
+        os.makedirs(self.partition_folder, exist_ok=True)
+        _write_json_atomic(self._partition_path(key), contract_map)
+        stat = os.stat(excel_file)
+        self.sources[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(excel_file),
+            "contracts": sorted(contract_map),
+        }
+        self.pending_contracts.update(affected)
+        return affected
+
+    def remove_source(self, key):
+        """移除已不存在的源文件，返回其曾贡献的合约。"""
+        entry = self.sources.pop(key)
+        partition_path = self._partition_path(key)
+        if os.path.exists(partition_path):
+            os.remove(partition_path)
+        affected = set(entry["contracts"])
+        self.pending_contracts.update(affected)
+        return affected
+
+    def load_partition(self, key):
+        with open(self._partition_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        _write_json_atomic(self.path, {
+            "version": 1,
+            "sources": self.sources,
+            "pending_contracts": sorted(self.pending_contracts),
+        })
@@ -0,0 +1,178 @@
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，进程峰值内存记为 None
+    resource = None
+
+
+PROFILE_TOP_FUNCTIONS = 30
+_FILE_FIELDS = ("seconds", "rows_in", "rows_out", "bytes_read", "bytes_written")
+
+# 当前正在收集指标的运行；各阶段通过模块级的 record_file/stage 记录，未开启时不做任何事
+_active = None
+
+
+def file_size(path):
+    """文件大小（字节），文件不存在时返回 0。"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _peak_rss_bytes(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux 下单位为 KB，macOS 下为字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RunMetrics:
+    """
+    一次流水线运行的指标：各阶段耗时、处理的文件数、行数、读写字节数与峰值内存，以及逐文件明细。
+    cumulative_peak_rss_bytes 为阶段结束时进程自启动以来的最高常驻内存（ru_maxrss 无法按阶段重置），
+    之后的阶段会沿用此前最大阶段的值；各阶段自身的峰值需开启 trace_memory，
+    此时用 tracemalloc 记录各阶段 Python 分配的峰值 peak_traced_bytes（会明显变慢）；
+    profile 为 True 时对主进程做 cProfile 分析，报告中附带累计耗时最高的函数。
+    """
+
+    def __init__(self, trace_memory=False, profile=False):
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile() if profile else None
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.start_time = time.perf_counter()
+        self.seconds = None
+        self.options = {}
+        self.stages = {}
+        self.files = []
+
+    def _stage_entry(self, name):
+        return self.stages.setdefault(name, {
+            "seconds": 0.0, "files": 0, "errors": 0,
+            "rows_in": 0, "rows_out": 0, "bytes_read": 0, "bytes_written": 0,
+            "cumulative_peak_rss_bytes": None, "cumulative_peak_children_rss_bytes": None, "peak_traced_bytes": None,
+        })
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.seconds = time.perf_counter() - self.start_time
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个阶段的总耗时、结束时的累计峰值常驻内存与阶段内的 Python 分配峰值，可多次进入同名阶段累加。"""
+        entry = self._stage_entry(name)
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] += time.perf_counter() - start
+            entry["cumulative_peak_rss_bytes"] = _peak_rss_bytes(resource.RUSAGE_SELF) if resource else None
+            entry["cumulative_peak_children_rss_bytes"] = (_peak_rss_bytes(resource.RUSAGE_CHILDREN) if resource
+                                                           else None)
+            if self.trace_memory and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                entry["peak_traced_bytes"] = max(entry["peak_traced_bytes"] or 0, peak)
+
+    def record_file(self, stage, path, error=None, **fields):
+        """记录一个文件在某阶段的明细，并累加到阶段汇总（阶段耗时由 stage() 统计）。"""
+        entry = self._stage_entry(stage)
+        entry["files"] += 1
+        if error is not None:
+            entry["errors"] += 1
+        for name in ("rows_in", "rows_out", "bytes_read", "bytes_written"):
+            entry[name] += fields.get(name) or 0
+        detail = {"stage": stage, "path": str(path)}
+        detail.update({name: fields.get(name) for name in _FILE_FIELDS})
+        if error is not None:
+            detail["error"] = str(error)
+        self.files.append(detail)
+
+    def _profile_summary(self):
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for (file_name, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(file_name)}:{line}({function})",
+                "calls": calls, "tottime": round(tottime, 6), "cumtime": round(cumtime, 6),
+            })
+        rows.sort(key=lambda row: row["cumtime"], reverse=True)
+        return rows[:PROFILE_TOP_FUNCTIONS]
+
+    def report(self):
+        """生成报告字典：逐文件明细按阶段与路径排序，便于两次运行之间对比。"""
+        report = {
+            "version": 2,
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "options": self.options,
+            "stages": self.stages,
+            "files": sorted(self.files, key=lambda item: (item["stage"], item["path"])),
+        }
+        if self.profiler is not None:
+            report["profile"] = self._profile_summary()
+        return report
+
+    def write_report(self, path):
+        """写出 JSON 报告；开启 cProfile 时同时写出同名的 .prof 文件，可用 pstats/snakeviz 查看。"""
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.splitext(path)[0] + ".prof")
+
+
+@contextmanager
+def collecting(metrics):
+    """在 with 块内将 metrics 设为当前运行，块内各阶段的指标记录到其中。"""
+    global _active
+    previous = _active
+    _active = metrics
+    metrics.start()
+    try:
+        yield metrics
+    finally:
+        metrics.stop()
+        _active = previous
+
+
+def active():
+    return _active
+
+
+@contextmanager
+def stage(name):
+    """当前运行的阶段计时；未开启指标收集时不做任何事。"""
+    if _active is None:
+        yield None
+        return
+    with _active.stage(name) as entry:
+        yield entry
+
+
+def record_file(stage_name, path, error=None, **fields):
+    """向当前运行记录一个文件的明细；未开启指标收集时不做任何事。"""
+    if _active is not None:
+        _active.record_file(stage_name, path, error, **fields)
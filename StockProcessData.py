@@ -1,6 +1,14 @@
-import pandas as pd
+import time
+import pickle
+from collections import namedtuple
 from enum import Enum
-import math
+
+import numpy as np
+import pandas as pd
+
+from StockBarStore import DATE_COLUMN, read_contract_file
+from StockContractStore import date_key, load_window
+from StockPipelineMetrics import file_size, record_file
 
 
 class ProcessType(Enum):
@@ -13,170 +21,633 @@ class ProcessType(Enum):
 
 
 def process_json_file(filename: str, process_type: ProcessType):
-    df = pd.read_json(filename)
+    # .json 与列式 .kbar 文件均可读取
+    df = read_contract_file(filename)
     if process_type == ProcessType.NO_PROCESS:
         return df
     elif process_type == ProcessType.ZEN_INCLUDE:
-        return zen_include_process(df)
+        start = time.perf_counter()
+        result = zen_include_process(df)
+        record_file("zen", filename, rows_in=len(df), rows_out=len(result), bytes_read=file_size(filename),
+                    seconds=time.perf_counter() - start)
+        return result
     else:
         raise ValueError("未知的处理类型")
 
     # 这里实现K线缠论的数据合并操作
 
 
+ZEN_COLUMNS = ("开盘价", "最高价", "最低价", "收盘价")
+DEFAULT_WARMUP_BARS = 200
+
+
+def process_window(filename: str, start=None, end=None, columns=None,
+                   process_type: ProcessType = ProcessType.NO_PROCESS, warmup=DEFAULT_WARMUP_BARS):
+    """
+    只加载日期区间 [start, end] 内的指定列并处理，耗时只与区间长度有关。
+    ZEN_INCLUDE 时额外向前加载 warmup 根K线参与包含合并与分型判定，再截取区间内的结果，
+    预热足够长时与全量处理结果一致；区间末尾的分型与全量数据截止于 end 时一致。
+    """
+    if process_type == ProcessType.NO_PROCESS:
+        return load_window(filename, start, end, columns)
+    if process_type != ProcessType.ZEN_INCLUDE:
+        raise ValueError("未知的处理类型")
+    if columns is not None:
+        columns = list(columns) + [col for col in (DATE_COLUMN,) + ZEN_COLUMNS if col not in columns]
+    df = zen_include_process(load_window(filename, start, end, columns, margin=warmup))
+    start = date_key(start)
+    if start is not None and DATE_COLUMN in df.columns:
+        keep = np.array([(date_key(v) or -1) >= start for v in df[DATE_COLUMN]], dtype=bool)
+        df = df[keep].reset_index(drop=True)
+    return df
+
+
 class Type(Enum):
     TOP = "顶分型"
     BOTTOM = "底分型"
 
 
-def zen_include_process(df: pd.DataFrame):
-    df = df.copy().reset_index(drop=True)
-    # 初始化每行最后一个字段为dict，包含value、包含数据、顶底分型
-    last_col = df.columns[-1]
-    df["包含数据"] = 1
+class IncludeMerger:
+    """
+    K线包含合并的状态机。
+
+    已确认的K线保存在栈中，当前K线与栈顶比较：当前包含前一根时弹出栈顶并继续与新的栈顶比较，
+    被前一根包含时并入栈顶，无包含关系时入栈。每根K线至多入栈、出栈各一次，均摊 O(1)。
+    被前一根包含时需要参考下一根原始K线，因此每根K线在下一根到达后才能送入。
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.idx = []  # 保留下来的K线在输入中的位置
+        self.high = []
+        self.low = []
+        self.count = []  # 包含数据
+        self.max_high = float('inf')  # 如果有连续包含，需要更新最大值时，找出最小的那个最大值
+        self.min_low = float('-inf')  # 如果有连续包含，需要更新最小值时，找出最大的那个最小值
+
+    def feed(self, i, cur_high, cur_low, next_high=None, next_low=None):
+        """
+        送入第 i 根K线，next_high/next_low 为下一根原始K线的价格，当前为最后一根时传 None。
+
+        Returns:
+            int: 本次发生变化的第一个栈位置，该位置及之后的合并K线需要刷新。
+        """
+        idx_stack, high_stack, low_stack, count_stack = self.idx, self.high, self.low, self.count
+        cur_count = 1
+        while idx_stack:
+            pre_high = high_stack[-1]
+            pre_low = low_stack[-1]
+            if cur_high >= pre_high and cur_low <= pre_low:
+                # 当前K线包含前一根：调整当前K线后删除前一根，并继续与更前面的K线比较
+                if self.verbose:
+                    print(f"包含关系: 当前行({cur_high}, {cur_low}) 包含 前一行({pre_high}, {pre_low})")
+                if pre_low > self.min_low:
+                    self.min_low = pre_low
+                if pre_high < self.max_high:
+                    self.max_high = pre_high
+                if len(idx_stack) >= 2:
+                    pre2_high = high_stack[-2]
+                    pre2_low = low_stack[-2]
+                    if cur_high < pre2_high or cur_low > pre2_low:
+                        if cur_high > pre2_high:
+                            cur_low = self.min_low
+                        else:
+                            cur_high = self.max_high
+                cur_count += count_stack.pop()
+                idx_stack.pop()
+                high_stack.pop()
+                low_stack.pop()
+                continue
+            if cur_high <= pre_high and cur_low >= pre_low:
+                # 当前K线被前一根包含：调整前一根后删除当前K线
+                if self.verbose:
+                    print(f"包含关系: 当前行({cur_high}, {cur_low}) 被 前一行({pre_high}, {pre_low}) 包含")
+                if cur_low > self.min_low:
+                    self.min_low = cur_low
+                if cur_high < self.max_high:
+                    self.max_high = cur_high
+                if len(idx_stack) >= 2:
+                    pre2_high = high_stack[-2]
+                    if next_high is None or next_high > pre_high or next_low < pre_low:
+                        if pre_high > pre2_high:
+                            low_stack[-1] = self.min_low
+                        else:
+                            high_stack[-1] = self.max_high
+                count_stack[-1] += cur_count
+                return len(idx_stack) - 1
+            # 无包含关系，重置连续包含的极值
+            if self.verbose:
+                print(f"不包含关系: 当前行({cur_high}, {cur_low}) 与 前一行({pre_high}, {pre_low}) 无包含关系")
+            self.max_high = float('inf')
+            self.min_low = float('-inf')
+            break
+        idx_stack.append(i)
+        high_stack.append(cur_high)
+        low_stack.append(cur_low)
+        count_stack.append(cur_count)
+        return len(idx_stack) - 1
+
+    def copy(self):
+        """复制当前状态，用于在不影响原状态的前提下试算最后一根K线。"""
+        other = IncludeMerger(self.verbose)
+        other.idx, other.high, other.low, other.count = self.idx[:], self.high[:], self.low[:], self.count[:]
+        other.max_high, other.min_low = self.max_high, self.min_low
+        return other
+
+    def tail(self, offset):
+        """复制栈中 offset 及之后的部分（连续包含的极值一并复制），用于只在栈顶试算最后一根K线。"""
+        other = IncludeMerger(self.verbose)
+        other.idx, other.high, other.low, other.count = (
+            self.idx[offset:], self.high[offset:], self.low[offset:], self.count[offset:])
+        other.max_high, other.min_low = self.max_high, self.min_low
+        return other
+
+    def arrays(self):
+        """以 numpy 数组返回 (src_idx, merged_high, merged_low, include_count)。"""
+        return (np.asarray(self.idx, dtype=np.int64), np.asarray(self.high, dtype=float),
+                np.asarray(self.low, dtype=float), np.asarray(self.count, dtype=np.int64))
+
+
+def merge_include_bars(high, low, verbose=False):
+    """
+    单次前向扫描完成K线包含关系合并，整体为 O(n)。
+
+    Args:
+        high: 最高价数组（需为有效浮点数）。
+        low: 最低价数组（需为有效浮点数）。
+        verbose (bool): 是否打印合并过程的调试信息。
+
+    Returns:
+        tuple: (src_idx, merged_high, merged_low, include_count)，
+            src_idx 为保留下来的K线在输入中的位置，其余为合并后的最高价、最低价与包含数据。
+    """
+    high = np.asarray(high, dtype=float).tolist()
+    low = np.asarray(low, dtype=float).tolist()
+    merger = IncludeMerger(verbose)
+    feed = merger.feed
+    last = len(high) - 1
+    for i in range(last):
+        feed(i, high[i], low[i], high[i + 1], low[i + 1])
+    if last >= 0:
+        feed(last, high[last], low[last])
+    return merger.arrays()
+
+
+def _assign_price_column(df: pd.DataFrame, col: str, values: np.ndarray):
+    """写回价格列，原列为整数且合并结果仍为整数时保持整数类型。"""
+    if pd.api.types.is_integer_dtype(df[col].dtype) and np.all(values == np.floor(values)):
+        df[col] = values.astype(df[col].dtype)
+    else:
+        df[col] = values
+
+
+class SparseTable:
+    """
+    区间极值稀疏表：O(n log n) 预处理后，以 O(1) 回答任意闭区间 [left, right] 的最大/最小值，
+    且支持以数组形式批量查询。
+    """
+
+    def __init__(self, values, op=np.maximum):
+        values = np.asarray(values, dtype=float)
+        self.op = op
+        n = len(values)
+        levels = max(int(n).bit_length(), 1)
+        fill = -np.inf if op is np.maximum else np.inf
+        self.table = np.full((levels, n), fill)
+        self.table[0] = values
+        for k in range(1, levels):
+            half = 1 << (k - 1)
+            self.table[k, :n - half] = op(self.table[k - 1, :n - half], self.table[k - 1, half:])
+
+    def query(self, left, right):
+        """查询闭区间 [left, right] 的极值，left/right 可为整数或整数数组。"""
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        k = np.frexp((right - left + 1).astype(float))[1] - 1
+        return self.op(self.table[k, left], self.table[k, right - (1 << k) + 1])
+
+
+def detect_fenxing(high):
+    """
+    以错位数组比较判定顶底分型：最高价高于前后两根为顶分型，低于前后两根为底分型，首尾行不判定。
+
+    Returns:
+        tuple: (is_top, is_bottom) 两个布尔数组。
+    """
+    high = np.asarray(high, dtype=float)
+    is_top = np.zeros(len(high), dtype=bool)
+    is_bottom = np.zeros(len(high), dtype=bool)
+    if len(high) >= 3:
+        mid, pre, nxt = high[1:-1], high[:-2], high[2:]
+        is_top[1:-1] = (mid > pre) & (mid > nxt)
+        is_bottom[1:-1] = (mid < pre) & (mid < nxt)
+    return is_top, is_bottom
+
+
+def validate_fenxing(high, low, include_count, fenxing_idx, fenxing_is_top):
+    """
+    用相邻分型校验分型有效性：与前一分型过近或与后一分型间隔不足的剔除，
+    顶分型需为前后分型区间内最高，底分型需为区间内最低。区间极值由稀疏表批量回答。
+
+    Args:
+        high, low: 合并后的最高价、最低价数组。
+        include_count: 包含数据数组。
+        fenxing_idx: 全部顶底分型所在位置（升序）。
+        fenxing_is_top: 与 fenxing_idx 对应，是否为顶分型。
+
+    Returns:
+        np.ndarray: 有效分型所在位置。
+    """
+    fenxing_idx = np.asarray(fenxing_idx, dtype=np.int64)
+    if len(fenxing_idx) < 3:
+        return np.empty(0, dtype=np.int64)
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    single = np.asarray(include_count) < 2
+    i0, i1, i2 = fenxing_idx[:-2], fenxing_idx[1:-1], fenxing_idx[2:]
+    is_top = np.asarray(fenxing_is_top, dtype=bool)[1:-1]
+    gap0 = i1 - i0
+    # 与前一分型过近，无法成笔；间隔为3时需四根K线均未发生包含
+    too_close = (gap0 < 3) | ((gap0 == 3) & single[i0] & single[i1] & single[i0 + 1] & single[i0 + 2])
+    # 必须间隔至少一根K线
+    too_close |= (gap0 < 2) | (i2 - i1 < 2)
+    # 极值校验
+    range_high = SparseTable(high, np.maximum).query(i0, i2)
+    range_low = SparseTable(low, np.minimum).query(i0, i2)
+    extreme = np.where(is_top, high[i1] == range_high, low[i1] == range_low)
+    return i1[~too_close & extreme]
+
+
+def fenxing_codes(values):
+    """将顶底分型列转换为 1（顶）、-1（底）、0（无），兼容枚举和字符串。"""
+    text = pd.Series(values, dtype=object).astype(str)
+    codes = np.zeros(len(text), dtype=np.int8)
+    codes[text.str.contains("TOP|顶分型").to_numpy()] = 1
+    codes[text.str.contains("BOTTOM|底分型").to_numpy()] = -1
+    return codes
+
+
+def _build_zen_frame(df: pd.DataFrame, merged_high, merged_low, include_count):
+    """
+    根据包含合并结果生成缠论输出表：写回合并后的价格、调整开收盘并标记顶底分型。
+
+    Args:
+        df (pd.DataFrame): 合并后保留下来的原始K线行。
+
+    Returns:
+        tuple: (df, is_top, is_bottom)
+    """
+    df = df.reset_index(drop=True)
+    _assign_price_column(df, "最高价", merged_high)
+    _assign_price_column(df, "最低价", merged_low)
+    # 每行追加包含数据、顶底分型、连笔编号字段
+    df["包含数据"] = include_count
     df["顶底分型"] = None
     df["连笔编号"] = 0
-    i = 1
-    max_high = float('inf')  # 如果有连续包含，需要更新最大值时，找出最小的那个最大值
-    min_low = float('-inf')  # 如果有连续包含，需要更新最小值时，找出最大的那个最小值
-    while i < len(df):
-        try:
-            cur_high = float(df.at[i, "最高价"])
-            cur_low = float(df.at[i, "最低价"])
-        except Exception:
-            print(f"第{i}行最高价或最低价无法转换为浮点数，已删除")
-            df = df.drop(i).reset_index(drop=True)
+
+    # 步骤2：调整开盘价和收盘价，阴线开盘取最高、收盘取最低，阳线相反
+    open_p = pd.to_numeric(df["开盘价"], errors="coerce").to_numpy(dtype=float)
+    close_p = pd.to_numeric(df["收盘价"], errors="coerce").to_numpy(dtype=float)
+    falling = open_p > close_p
+    _assign_price_column(df, "开盘价", np.where(falling, merged_high, merged_low))
+    _assign_price_column(df, "收盘价", np.where(falling, merged_low, merged_high))
+
+    # 判定顶底分型（排除首尾行）
+    is_top, is_bottom = detect_fenxing(merged_high)
+    fenxing = np.full(len(df), None, dtype=object)
+    fenxing[is_top] = Type.TOP
+    fenxing[is_bottom] = Type.BOTTOM
+    df["顶底分型"] = fenxing
+    return df, is_top, is_bottom
+
+
+def zen_include_process(df: pd.DataFrame, verbose=False):
+    df = df.copy().reset_index(drop=True)
+    # 步骤1：剔除最高价或最低价无效（无法转换、nan、inf）的行，再做包含合并
+    high = pd.to_numeric(df["最高价"], errors="coerce").to_numpy(dtype=float)
+    low = pd.to_numeric(df["最低价"], errors="coerce").to_numpy(dtype=float)
+    valid = np.isfinite(high) & np.isfinite(low)
+    if not valid.all():
+        if verbose:
+            for i in np.flatnonzero(~valid):
+                print(f"第{i}行最高价或最低价无效（nan/inf），已删除")
+        df = df[valid].reset_index(drop=True)
+        high = high[valid]
+        low = low[valid]
+
+    src_idx, merged_high, merged_low, include_count = merge_include_bars(high, low, verbose)
+    df, _, _ = _build_zen_frame(df.iloc[src_idx], merged_high, merged_low, include_count)
+    return df
+
+
+
+# 笔、线段、中枢的构建结果，均为紧凑的 numpy 数组：
+# bi_idx/seg_idx 为端点所在的合并K线位置，bi_is_top/seg_is_top 标记端点是否为顶；
+# 中枢以起止K线位置与区间 [pivot_low, pivot_high]（ZD/ZG）表示
+ZenStructure = namedtuple("ZenStructure", [
+    "bi_idx", "bi_is_top", "seg_idx", "seg_is_top",
+    "pivot_start", "pivot_end", "pivot_low", "pivot_high",
+])
+
+
+def build_bi(high, low, include_count, fenxing_idx, fenxing_is_top):
+    """
+    单次扫描顶底分型构建笔，返回笔端点在 fenxing_idx 中的下标。
+
+    同类分型相邻时保留更极端的一个；异类分型过近（与 `validate_fenxing` 相同的间距规则）
+    或未创出新高/新低时无法成笔，跳过。
+    """
+    single = np.asarray(include_count) < 2
+    high = np.asarray(high, dtype=float).tolist()
+    low = np.asarray(low, dtype=float).tolist()
+    fenxing_idx = np.asarray(fenxing_idx, dtype=np.int64).tolist()
+    fenxing_is_top = np.asarray(fenxing_is_top, dtype=bool).tolist()
+    points = []
+    for j, (i1, top) in enumerate(zip(fenxing_idx, fenxing_is_top)):
+        if not points:
+            points.append(j)
             continue
-        # 检查无效浮点数（包括nan、inf、-inf）
-        if (math.isnan(cur_high) or math.isnan(cur_low) or
-                math.isinf(cur_high) or math.isinf(cur_low)):
-            print(f"第{i}行最高价或最低价无效（nan/inf），已删除")
-            df = df.drop(i).reset_index(drop=True)
+        last = points[-1]
+        i0 = fenxing_idx[last]
+        if top == fenxing_is_top[last]:
+            # 同类分型取更极端者作为笔的端点
+            if (top and high[i1] > high[i0]) or (not top and low[i1] < low[i0]):
+                points[-1] = j
             continue
-        # 打印调试信息
-        print(
-            f"第{i}行: 日期={df.at[i, '日期'] if '日期' in df.columns else '无'}, "
-            f"最高价={df.at[i, '最高价']}, 最低价={df.at[i, '最低价']}, "
-            f"开盘价={df.at[i, '开盘价']}, 收盘价={df.at[i, '收盘价']}"
-        )
-        cur_high = float(df.at[i, "最高价"])
-        cur_low = float(df.at[i, "最低价"])
-        pre_high = float(df.at[i - 1, "最高价"])
-        pre_low = float(df.at[i - 1, "最低价"])
-        # 包含关系判断
-        if cur_high >= pre_high and cur_low <= pre_low:
-            # 打印包含关系
-            print(f"包含关系: 当前行({cur_high}, {cur_low}) 包含 前一行({pre_high}, {pre_low})")
-            if pre_low > min_low:
-                min_low = pre_low
-            if pre_high < max_high:
-                max_high = pre_high
-            # 需要有前一条的前一条
-            if i - 2 >= 0:
-                pre2_high = float(df.at[i - 2, "最高价"])
-                pre2_low = float(df.at[i - 2, "最低价"])
-                if cur_high < pre2_high or cur_low > pre2_low:
-                    if cur_high > pre2_high:
-                        df.at[i, "最低价"] = min_low
-                    else:
-                        df.at[i, "最高价"] = max_high
-            # 删除前一条
-            df.at[i, "包含数据"] += df.at[i - 1, "包含数据"]
-            df = df.drop(i - 1).reset_index(drop=True)
-            i -= 1  # 删除后索引前移
-        elif cur_high <= pre_high and cur_low >= pre_low:
-            # 打印包含关系
-            print(f"包含关系: 当前行({cur_high}, {cur_low}) 被被被 前一行({pre_high}, {pre_low}) 包含")
-            if cur_low > min_low:
-                min_low = cur_low
-            if cur_high < max_high:
-                max_high = cur_high
-            # 需要有前一条的前一条
-            if i - 2 >= 0:
-                pre2_high = float(df.at[i - 2, "最高价"])
-                if (i == len(df) - 1) or ((i < len(df) - 1) and (
-                        float(df.at[i + 1, "最高价"]) > pre_high or float(df.at[i + 1, "最低价"]) < pre_low)):
-                    if pre_high > pre2_high:
-                        df.at[i - 1, "最低价"] = min_low
-                    else:
-                        df.at[i - 1, "最高价"] = max_high
-            # 删除当前这条
-            df.at[i - 1, "包含数据"] += df.at[i, "包含数据"]
-            df = df.drop(i).reset_index(drop=True)
-        else:
-            # 打印不包含关系
-            print(f"不包含关系: 当前行({cur_high}, {cur_low}) 与 前一行({pre_high}, {pre_low}) 无包含关系")
-            # 如果没有包含关系，更新最大值和最小值
-            max_high = float('inf')  # 如果有连续包含，需要更新最大值时，找出最小的那个最大值
-            min_low = float('-inf')  # 如果有连续包含，需要更新最小值时，找出最大的那个最小值
-            i += 1
-
-    # 步骤2：调整开盘价和收盘价
-    for i, row in df.iterrows():
-        open_p = float(row["开盘价"])
-        close_p = float(row["收盘价"])
-        high_p = float(row["最高价"])
-        low_p = float(row["最低价"])
-        if open_p > close_p:
-            df.at[i, "开盘价"] = high_p
-            df.at[i, "收盘价"] = low_p
-        else:
-            df.at[i, "开盘价"] = low_p
-            df.at[i, "收盘价"] = high_p
-
-        # 判定顶底分型（排除首尾行）
-        if 0 < i < len(df) - 1:
-            pre_row = df.iloc[i - 1]
-            next_row = df.iloc[i + 1]
-            if high_p > float(pre_row["最高价"]) and high_p > float(next_row["最高价"]):
-                df.at[i, "顶底分型"] = Type.TOP
-            elif high_p < float(pre_row["最高价"]) and high_p < float(next_row["最高价"]):
-                df.at[i, "顶底分型"] = Type.BOTTOM
-
-    # 步骤3：缠论笔的分型校验
-    fenxing_idx = []
-    for i, row in df.iterrows():
-        if df.at[i, "顶底分型"] is not None:
-            fenxing_idx.append(i)
-
-    # 用连续笔的分型来检测顶底有效性
-    # 从第一个顶底参数开始，连续画笔
-    # 假设 j0 和 j1 无法构成一个笔，则按照类型来判断
-    # 首先如果两者是间距过近，且类型相同，则判断势能更强的那个是有效的
-    # 如果两者类型不同，则暂时无法判断哪个是有效哦，需要根据后续的节点来判断，有可能两者都能形成笔或者多笔，如果存在包含关系
-    # 则被包含的的连续笔都是无效的。
-    # 如果有多个连续笔最后都没有包含关系，则将其一起绘制在图上
-    # 如果是因为两者顶底分型类型相同，则j1是无效的顶底分型
-    # 假设j0 和 j1 能够形成一笔，则j0肯定是有效的一个顶底分型，接下来只需要判定 j1和j2之间是否成笔，如果不成笔则需要判定哪一个顶底
-    # 分型是无效的。
-    valid_idx = []
-    for j in range(1, len(fenxing_idx) - 1):
-        i0, i1, i2 = fenxing_idx[j - 1], fenxing_idx[j], fenxing_idx[j + 1]
-        fx0, fx1, fx2 = df.at[i0, "顶底分型"], df.at[i1, "顶底分型"], df.at[i2, "顶底分型"]
-        # 首先排除fx0与fx1紧密相连导致无法成笔的情况,两者过近时，如果类型相同则直接清除fx1
-        #      如果fx0和fx1类型不同，则判断fx1与fx2的类型是否相同，如果fx1与fx2类型相同，则清除fx1
-        #      如果fx1与fx2类型不同，则判断
-        if i1 - i0 < 3 or (i1 - i0 == 3 and df.at[i0, "包含数据"] < 2 and df.at[i1, "包含数据"] < 2
-                            and df.at[i0 + 1, "包含数据"] < 2 and df.at[i0 + 2, "包含数据"] < 2):
+        gap = i1 - i0
+        if gap < 3 or (gap == 3 and single[i0] and single[i1] and single[i0 + 1] and single[i0 + 2]):
             continue
-        # 必须间隔至少一根K线
-        if i1 - i0 < 2 or i2 - i1 < 2:
+        # 向上笔的顶须高于起点底的最高价，向下笔的底须低于起点顶的最低价
+        if (top and high[i1] <= high[i0]) or (not top and low[i1] >= low[i0]):
             continue
-        # 极值校验
-        if fx1 == Type.TOP:
-            # i1区间内最高
-            if df.at[i1, "最高价"] != max(df.loc[i0:i2, "最高价"]):
-                continue
-        elif fx1 == Type.BOTTOM:
-            # i1区间内最低
-            if df.at[i1, "最低价"] != min(df.loc[i0:i2, "最低价"]):
+        points.append(j)
+    return np.asarray(points, dtype=np.int64)
+
+
+def build_segments(price, is_top):
+    """
+    单次扫描笔端点构建线段，返回线段端点在笔端点序列中的下标。
+
+    线段至少包含三笔；反向至少走出三笔且突破线段最后一笔的起点时，确认当前线段的终点。
+    未确认的最后一段若已满三笔，同样作为末端输出。
+
+    Args:
+        price: 笔端点价格，顶取最高价、底取最低价。
+        is_top: 笔端点是否为顶。
+    """
+    price = np.asarray(price, dtype=float).tolist()
+    is_top = np.asarray(is_top, dtype=bool).tolist()
+    if len(price) < 2:
+        return np.arange(len(price), dtype=np.int64)
+    seg = [0]
+    cand = None  # 当前线段的候选终点
+    reverse = None  # 候选终点之后最极端的反向端点
+    for k in range(1, len(price)):
+        up = not is_top[seg[-1]]
+        if is_top[k] == up:
+            if cand is None or (up and price[k] > price[cand]) or (not up and price[k] < price[cand]):
+                cand = k
+                reverse = None
+            continue
+        if cand is None:
+            continue
+        if reverse is None or (up and price[k] < price[reverse]) or (not up and price[k] > price[reverse]):
+            reverse = k
+        broken = price[reverse] < price[cand - 1] if up else price[reverse] > price[cand - 1]
+        if cand - seg[-1] >= 3 and k - cand >= 3 and broken:
+            seg.append(cand)
+            cand, reverse = reverse, None
+    if cand is not None and cand - seg[-1] >= 3:
+        seg.append(cand)
+    return np.asarray(seg, dtype=np.int64)
+
+
+def build_pivots(stroke_low, stroke_high):
+    """
+    单次扫描相邻笔的价格区间构建中枢：连续三笔的区间交集非空即形成中枢，
+    ZG 取三笔高点的最小值、ZD 取低点的最大值，后续笔与 [ZD, ZG] 仍有重叠则延伸中枢。
+    区间交集随扫描滚动维护，不做两两比较。
+
+    Returns:
+        tuple: (first, last, zd, zg)，first/last 为中枢首末笔的下标。
+    """
+    stroke_low = np.asarray(stroke_low, dtype=float)
+    stroke_high = np.asarray(stroke_high, dtype=float)
+    m = len(stroke_low)
+    first, last, zd_list, zg_list = [], [], [], []
+    if m >= 3:
+        # 连续三笔的区间交集，向量化求出所有候选起点
+        win_low = np.maximum(np.maximum(stroke_low[:-2], stroke_low[1:-1]), stroke_low[2:])
+        win_high = np.minimum(np.minimum(stroke_high[:-2], stroke_high[1:-1]), stroke_high[2:])
+        overlap = (win_low < win_high).tolist()
+        win_low = win_low.tolist()
+        win_high = win_high.tolist()
+        low_list = stroke_low.tolist()
+        high_list = stroke_high.tolist()
+        k = 0
+        while k < m - 2:
+            if not overlap[k]:
+                k += 1
                 continue
-        valid_idx.append(i1)
+            zd, zg = win_low[k], win_high[k]
+            end = k + 2
+            while end + 1 < m and low_list[end + 1] < zg and high_list[end + 1] > zd:
+                end += 1
+            first.append(k)
+            last.append(end)
+            zd_list.append(zd)
+            zg_list.append(zg)
+            # 离开中枢的那一笔之后再寻找下一个中枢
+            k = end + 1
+    return (np.asarray(first, dtype=np.int64), np.asarray(last, dtype=np.int64),
+            np.asarray(zd_list, dtype=float), np.asarray(zg_list, dtype=float))
 
-    # 先清空所有分型
-    #df["顶底分型"] = None
-    #for idx in valid_idx:
-        #df.at[idx, "顶底分型"] = Type.TOP if df.at[idx, "最高价"] == max(
-            #df.loc[idx - 1:idx + 1, "最高价"]) else Type.BOTTOM
 
-    return df
+def build_zen_structure(df: pd.DataFrame):
+    """
+    基于 `zen_include_process` 的输出（合并K线与顶底分型）构建笔、线段与中枢。
+
+    Returns:
+        ZenStructure: 各端点与中枢的紧凑索引数组，位置均为合并K线的行号。
+    """
+    high = pd.to_numeric(df["最高价"], errors="coerce").to_numpy(dtype=float)
+    low = pd.to_numeric(df["最低价"], errors="coerce").to_numpy(dtype=float)
+    fenxing = df["顶底分型"].to_numpy(dtype=object)
+    is_top = fenxing == Type.TOP
+    fenxing_idx = np.flatnonzero(is_top | (fenxing == Type.BOTTOM))
+    points = build_bi(high, low, df["包含数据"].to_numpy(), fenxing_idx, is_top[fenxing_idx])
+    bi_idx = fenxing_idx[points]
+    bi_is_top = is_top[bi_idx]
+    bi_price = np.where(bi_is_top, high[bi_idx], low[bi_idx])
+
+    seg = build_segments(bi_price, bi_is_top)
+    seg_idx = bi_idx[seg]
+
+    # 每一笔的价格区间：低点取两端点中底的最低价，高点取顶的最高价
+    start_price, end_price = bi_price[:-1], bi_price[1:]
+    first, last, zd, zg = build_pivots(np.minimum(start_price, end_price), np.maximum(start_price, end_price))
+    return ZenStructure(
+        bi_idx=bi_idx, bi_is_top=bi_is_top, seg_idx=seg_idx, seg_is_top=bi_is_top[seg],
+        pivot_start=bi_idx[first], pivot_end=bi_idx[last + 1], pivot_low=zd, pivot_high=zg,
+    )
+
+# 增量处理一次追加后的变化：start 及之后的合并K线被 bars 替换，fenxing 为 (位置, 顶底分型) 的变化列表；
+# tentative 为暂存的最后一根K线按末尾K线试算出的临时尾部（同为 ZenUpdate，叠加在 bars 之后），下次追加时可能改变
+ZenUpdate = namedtuple("ZenUpdate", ["start", "bars", "fenxing", "tentative"], defaults=(None,))
+TRIAL_DEPTH = 4  # 试算临时尾部时复制的栈顶K线数，被弹出到不足时加倍重试
+
+
+def _fenxing_at(high, k):
+    """第 k 根合并K线的顶底分型，首尾行不判定。"""
+    if 0 < k < len(high) - 1:
+        if high[k] > high[k - 1] and high[k] > high[k + 1]:
+            return Type.TOP
+        if high[k] < high[k - 1] and high[k] < high[k + 1]:
+            return Type.BOTTOM
+    return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+class ZenIncrementalProcessor:
+    """
+    增量缠论处理器：保存包含合并的未确认状态（连续包含的 max_high/min_low、待确认的栈顶K线）
+    与顶底分型候选，逐根追加新K线，每次追加均摊 O(1)，只发出发生变化的合并K线与分型。
+
+    被前一根包含时需要参考下一根原始K线，因此最后追加的一根会暂存，待下一根到达后才送入合并状态机；
+    `to_dataframe` 会把暂存的K线按末尾K线试算，结果与对全量历史执行 `zen_include_process` 一致。
+    每次追加返回的 ZenUpdate 附带同样试算的临时尾部 tentative，只复制栈顶几根K线，通常为 O(1)。
+    """
+
+    def __init__(self, verbose=False):
+        self.merger = IncludeMerger(verbose)
+        self.rows = []  # 所有有效的原始K线
+        self.fenxing = []  # 与合并K线一一对应的顶底分型
+        self.fenxing_idx = []  # 顶底分型候选所在位置（升序）
+        self._pending = None  # 尚未送入合并状态机的最后一根K线 (位置, 最高价, 最低价)
+
+    def __len__(self):
+        return len(self.merger.idx)
+
+    def append(self, bar, tentative=True):
+        """
+        追加一根K线（含 最高价/最低价/开盘价/收盘价 字段的 dict），最高价或最低价无效时忽略。
+        tentative 为 False 时不试算临时尾部，只需已确认结果的调用方可省去这部分开销。
+
+        Returns:
+            ZenUpdate: 本次追加引起的合并K线与分型变化。
+        """
+        return self._collect(self._advance(bar), tentative)
+
+    def extend(self, bars, tentative=True):
+        """
+        批量追加K线，bars 可为 dict 列表或 DataFrame。
+
+        Returns:
+            ZenUpdate: 整批追加引起的合并K线与分型变化，临时尾部只在整批结束时试算一次。
+        """
+        if isinstance(bars, pd.DataFrame):
+            bars = bars.to_dict(orient="records")
+        start = len(self.merger.idx)
+        for bar in bars:
+            start = min(start, self._advance(bar))
+        return self._collect(start, tentative)
+
+    def _advance(self, bar):
+        """推进状态机，返回发生变化的第一个合并K线位置。"""
+        high = _to_float(bar.get("最高价"))
+        low = _to_float(bar.get("最低价"))
+        if not (np.isfinite(high) and np.isfinite(low)):
+            return len(self.merger.idx)
+        self.rows.append(dict(bar))
+        pending = self._pending
+        self._pending = (len(self.rows) - 1, high, low)
+        if pending is None:
+            return len(self.merger.idx)
+        start = self.merger.feed(pending[0], pending[1], pending[2], high, low)
+        self._refresh_fenxing(start)
+        return start
+
+    def _refresh_fenxing(self, start):
+        """分型只依赖前后各一根合并K线，重新判定 start 前一根及之后的分型。"""
+        high = self.merger.high
+        n = len(high)
+        begin = max(start - 1, 0)
+        del self.fenxing[begin:]
+        while self.fenxing_idx and self.fenxing_idx[-1] >= begin:
+            self.fenxing_idx.pop()
+        for k in range(begin, n):
+            fx = _fenxing_at(high, k)
+            if fx is not None:
+                self.fenxing_idx.append(k)
+            self.fenxing.append(fx)
+
+    def _bar_at(self, k, merger=None, fenxing=None):
+        """第 k 根合并K线；给出试算的 merger 时 k 为其中的位置，分型取 fenxing。"""
+        if merger is None:
+            merger, fenxing = self.merger, self.fenxing[k]
+        bar = dict(self.rows[merger.idx[k]])
+        high, low = merger.high[k], merger.low[k]
+        falling = _to_float(bar.get("开盘价")) > _to_float(bar.get("收盘价"))
+        bar["最高价"] = high
+        bar["最低价"] = low
+        bar["开盘价"] = high if falling else low
+        bar["收盘价"] = low if falling else high
+        bar["包含数据"] = merger.count[k]
+        bar["顶底分型"] = fenxing
+        bar["连笔编号"] = 0
+        return bar
+
+    def _collect(self, start, tentative=True):
+        n = len(self.merger.idx)
+        bars = [self._bar_at(k) for k in range(start, n)]
+        fenxing = [(k, self.fenxing[k]) for k in range(max(start - 1, 0), n)]
+        return ZenUpdate(start, bars, fenxing, self._tentative() if tentative else None)
+
+    def _tentative(self):
+        """把暂存的K线按末尾K线送入栈顶副本试算，返回临时尾部；没有暂存K线时为 None。"""
+        if self._pending is None:
+            return None
+        n = len(self.merger.idx)
+        depth = TRIAL_DEPTH
+        while True:
+            offset = max(n - depth, 0)
+            trial = self.merger.tail(offset)
+            start = trial.feed(*self._pending)
+            # 副本在试算中至少保留两根时，比较所用的栈顶K线均在副本内，结果与整栈试算一致
+            if len(trial.idx) >= 3 or offset == 0:
+                break
+            depth *= 2
+        high = trial.high
+        begin = max(start - 1, 0)
+        codes = [_fenxing_at(high, k) for k in range(begin, len(high))]
+        bars = [self._bar_at(k, trial, codes[k - begin]) for k in range(start, len(high))]
+        return ZenUpdate(offset + start, bars, [(offset + begin + j, fx) for j, fx in enumerate(codes)])
+
+    def to_dataframe(self):
+        """返回当前全部K线的缠论处理结果，最后一根按末尾K线试算，不影响后续追加。"""
+        merger = self.merger
+        if self._pending is not None:
+            merger = merger.copy()
+            merger.feed(*self._pending)
+        src_idx, merged_high, merged_low, include_count = merger.arrays()
+        df = pd.DataFrame([self.rows[i] for i in src_idx])
+        if df.empty:
+            return df
+        df, _, _ = _build_zen_frame(df, merged_high, merged_low, include_count)
+        return df
+
+    def save(self, path):
+        """保存处理器状态，供下一个交易日继续追加。"""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,264 @@
+import os
+import json
+import argparse
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from StockBacktest import BAR_COLUMNS, RULES, BarData, run_backtest
+from StockBarStore import DATE_COLUMN, is_contract_file, read_contract_file
+from StockContractCatalog import ContractCatalog
+from StockContractStore import date_key
+
+
+# 参数扫描：各合约的K线只读取一次，按列打包进一个内存映射文件，工作进程只读映射、不复制也不经 pickle 传递；
+# 任务按合约分块，同一进程内缓存最近使用合约的 BarData，均线、缠论分型等指标在各组参数间复用。
+# 结果逐块追加写入 JSON 行文件，中断后以同一结果文件再次运行只补跑未完成的组合。
+BARS_SUFFIX = ".bars"  # 扫描期间的K线打包文件，位于结果文件旁，结束后删除
+BAR_CACHE_CONTRACTS = 4  # 每个工作进程缓存的合约个数
+DEFAULT_CHUNK_SIZE = 16  # 每个任务包含的参数组合数
+
+# 工作进程中的打包K线与合约缓存，由 _init_worker 设置
+_packed = None
+_offsets = None
+_bar_cache = OrderedDict()
+
+
+def param_grid(grid):
+    """将 {参数名: 取值列表} 展开为参数字典列表，按参数名的给出顺序做笛卡尔积。"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def params_key(params):
+    """参数组合的规范化文本，用作结果去重与续跑的键。"""
+    return json.dumps(params, ensure_ascii=False, sort_keys=True)
+
+
+def _row_counts(files):
+    """
+    各合约文件的行数，取自所在数据目录的合约目录；条目缺失或与文件大小、修改时间不一致时重新登记
+    （.kbar 读尾部描述与日期列，JSON 读日期索引，均缺失时才整文件读取），不写回目录文件。
+    """
+    catalogs = {}
+    counts = []
+    for file in files:
+        folder, file_name = os.path.split(file)
+        catalog = catalogs.get(folder)
+        if catalog is None:
+            catalog = catalogs[folder] = ContractCatalog(folder)
+        entry = catalog.entries.get(file_name)
+        stat = os.stat(file)
+        if entry is None or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+            catalog.update(file_name)
+            entry = catalog.entries[file_name]
+        counts.append(entry["rows"])
+    return counts
+
+
+def pack_contracts(files, path):
+    """
+    读取各合约文件的K线列，按 BAR_COLUMNS 的顺序以 float64 列式写入 path（形状为 列数 x 总行数），
+    日期存为 YYYYMMDD，无法解析的日期记为 -1。先由 `_row_counts` 得到各合约行数并创建映射，再逐个合约读取写入。
+
+    Returns:
+        np.ndarray: 各合约在打包数组中的起止行，长度为合约数 + 1。
+    """
+    offsets = np.cumsum([0] + _row_counts(files)).astype(np.int64)
+    packed = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(len(BAR_COLUMNS), int(offsets[-1])))
+    # 逐个合约读取、写入映射后即释放，内存中只保留一个合约的K线
+    for file, start, stop in zip(files, offsets[:-1], offsets[1:]):
+        df = read_contract_file(file)
+        if len(df) != stop - start:
+            raise ValueError(f"合约文件在打包期间被修改: {file}")
+        bars = BarData(df)
+        if DATE_COLUMN in df.columns:
+            packed[0, start:stop] = [date_key(value) or -1 for value in df[DATE_COLUMN].tolist()]
+        for row, (attr, _) in enumerate(BAR_COLUMNS[1:], start=1):
+            packed[row, start:stop] = getattr(bars, attr)
+    packed.flush()
+    del packed
+    return offsets
+
+
+def _init_worker(path, offsets):
+    global _packed, _offsets
+    _packed = np.load(path, mmap_mode='r')
+    _offsets = offsets
+    _bar_cache.clear()
+
+
+def _release_worker():
+    # 释放映射后才能在 Windows 上删除打包文件
+    global _packed
+    _packed = None
+    _bar_cache.clear()
+
+
+def _contract_bars(index):
+    bars = _bar_cache.get(index)
+    if bars is not None:
+        _bar_cache.move_to_end(index)
+        return bars
+    start, stop = int(_offsets[index]), int(_offsets[index + 1])
+    arrays = {attr: _packed[row, start:stop] for row, (attr, _) in enumerate(BAR_COLUMNS)}
+    # 日期以整数形式参与回测结果，其余列直接使用映射视图
+    arrays["date"] = np.asarray(arrays["date"]).astype(np.int64)
+    bars = _bar_cache[index] = BarData.from_arrays(arrays)
+    if len(_bar_cache) > BAR_CACHE_CONTRACTS:
+        _bar_cache.popitem(last=False)
+    return bars
+
+
+def _run_chunk(index, combos, rule, options):
+    """在一个合约上回测一批参数组合，返回 (合约序号, 参数, 汇总指标或错误信息) 列表。"""
+    rule = RULES[rule] if isinstance(rule, str) else rule
+    bars = _contract_bars(index)
+    results = []
+    for params in combos:
+        try:
+            results.append((index, params, run_backtest(bars, rule, params, **options).stats))
+        except Exception as e:
+            results.append((index, params, {"error": str(e)}))
+    return results
+
+
+def _read_results(result_path, header):
+    """
+    读取已有结果文件，与本次扫描的设置不一致时报错。
+
+    Returns:
+        tuple: (已完成的 (文件名, 参数键) 集合, 完整行的总字节数)；中断时写了一半的末行不计入，续跑前截掉。
+    """
+    done = set()
+    size = 0
+    if not os.path.exists(result_path):
+        return done, size
+    with open(result_path, 'rb') as f:
+        for number, line in enumerate(f):
+            if not line.endswith(b"\n"):
+                break
+            row = json.loads(line)
+            if number == 0:
+                if row != header:
+                    raise ValueError(f"结果文件 {result_path} 与本次扫描的准则或回测设置不一致")
+            else:
+                done.add((row["file"], params_key(row["params"])))
+            size += len(line)
+    return done, size
+
+
+def load_results(result_path):
+    """将结果文件读成表格：每行一个 (合约文件, 参数组合)，参数与各项指标各占一列。"""
+    rows = []
+    with open(result_path, 'r', encoding='utf-8') as f:
+        f.readline()
+        for line in f:
+            if line.endswith("\n"):
+                row = json.loads(line)
+                rows.append({"file": row["file"], **row["params"], **row["stats"]})
+    return pd.DataFrame(rows)
+
+
+def run_sweep(files, rule, grid, result_path, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, **options):
+    """
+    在多个合约上扫描参数网格。
+
+    Args:
+        files (list): 合约文件路径。
+        rule (str | callable): `StockBacktest.RULES` 中的准则名，或可被子进程导入的模块级准则函数。
+        grid (dict): {参数名: 取值列表}。
+        result_path (str): 结果文件（JSON 行），已存在时跳过其中已完成的组合。
+        workers (int): 并行进程数，1 为在当前进程中执行，None 或 0 时使用全部 CPU 核心。
+        chunk_size (int): 每个任务包含的参数组合数。
+        options: 传给 `run_backtest` 的费用与资金设置。
+
+    Returns:
+        pd.DataFrame: 全部结果，见 `load_results`。
+    """
+    rule_name = rule if isinstance(rule, str) else f"{rule.__module__}.{rule.__qualname__}"
+    header = {"version": 1, "rule": rule_name, "options": options}
+    done, valid_size = _read_results(result_path, header)
+    combos = param_grid(grid)
+    names = [os.path.basename(file) for file in files]
+    tasks = []
+    for index, name in enumerate(names):
+        pending = [params for params in combos if (name, params_key(params)) not in done]
+        tasks.extend((index, pending[i:i + chunk_size]) for i in range(0, len(pending), max(1, chunk_size)))
+    print(f"共 {len(files)} 个合约、{len(combos)} 组参数，待运行 {sum(len(chunk) for _, chunk in tasks)} 组")
+
+    if tasks:
+        if not workers:
+            workers = os.cpu_count() or 1
+        bars_path = result_path + BARS_SUFFIX + ".npy"
+        offsets = pack_contracts(files, bars_path)
+        try:
+            with open(result_path, 'a', encoding='utf-8') as out:
+                out.truncate(valid_size)
+                if valid_size == 0:
+                    out.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+                def write(results):
+                    for index, params, stats in results:
+                        out.write(json.dumps({"file": names[index], "params": params, "stats": stats},
+                                             ensure_ascii=False) + "\n")
+                    out.flush()
+
+                if workers <= 1:
+                    _init_worker(bars_path, offsets)
+                    for index, chunk in tasks:
+                        write(_run_chunk(index, chunk, rule, options))
+                else:
+                    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                             initargs=(bars_path, offsets)) as executor:
+                        futures = [executor.submit(_run_chunk, index, chunk, rule, options) for index, chunk in tasks]
+                        for future in as_completed(futures):
+                            write(future.result())
+        finally:
+            _release_worker()
+            if os.path.exists(bars_path):
+                os.remove(bars_path)
+    return load_results(result_path)
+
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _parse_values(text):
+    name, _, values = text.partition("=")
+    return name, [_parse_value(value) for value in values.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在多个合约上扫描交易准则的参数网格")
+    parser.add_argument("folder", help="合约文件目录")
+    parser.add_argument("result", help="结果文件（JSON 行），已存在时续跑未完成的组合")
+    parser.add_argument("--rule", choices=sorted(RULES), default="ma_cross", help="交易准则")
+    parser.add_argument("--grid", action="append", default=[], help="参数取值，形如 fast=3,5,8，可重复")
+    parser.add_argument("--filter", default="", help="只扫描文件名包含该关键字的合约")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数，0 为使用全部 CPU 核心")
+    parser.add_argument("--multiplier", type=float, default=1.0, help="合约乘数")
+    parser.add_argument("--fee-rate", type=float, default=0.0, help="按成交金额计的手续费率")
+    parser.add_argument("--fee-per-lot", type=float, default=0.0, help="每手固定手续费")
+    parser.add_argument("--slippage", type=float, default=0.0, help="每手滑点（价格点数）")
+    args = parser.parse_args(argv)
+
+    files = [os.path.join(args.folder, file) for file in sorted(os.listdir(args.folder))
+             if is_contract_file(file) and args.filter.lower() in file.lower()]
+    table = run_sweep(files, args.rule, dict(_parse_values(text) for text in args.grid), args.result, args.workers,
+                      multiplier=args.multiplier, fee_rate=args.fee_rate, fee_per_lot=args.fee_per_lot,
+                      slippage=args.slippage)
+    if len(table) and "total_return" in table.columns:
+        print(table.sort_values("total_return", ascending=False).head(20).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from StockBarStore import contract_file_suffix, write_contract_file
+
+
+# 合成的上期所行情数据，用于基准测试与离线调试，不依赖真实归档。
+# 工作簿布局与交易所导出一致：首行为表名，随后空行、含 "前收盘" 的标题行，
+# 各合约的数据行只在首行填写合约代码（其余留空，由补全阶段向下填充），每个合约后跟一行小计，表尾为总计。
+SHFE_COLUMNS = ["合约", "交易日期", "前收盘", "前结算", "开盘价", "最高价", "最低价", "收盘价", "结算价",
+                "涨跌1", "涨跌2", "成交量", "成交金额", "持仓量"]
+DEFAULT_START_DATE = "2000-01-03"
+DEFAULT_PRODUCTS = ("cu", "al", "zn", "au", "ag", "rb")
+PRICE_TICK = 10
+
+
+def trading_dates(n, start=DEFAULT_START_DATE):
+    """从 start 起的 n 个工作日，返回 YYYYMMDD 整数数组。"""
+    days = np.busday_offset(np.datetime64(start, 'D'), np.arange(n), roll='forward')
+    text = np.datetime_as_string(days, unit='D')
+    return np.char.replace(text, "-", "").astype(np.int64)
+
+
+def contract_codes(count, first_delivery=2401):
+    """生成 count 个合约代码，依次轮换品种与交割月份，如 cu2401、al2401、…"""
+    codes = []
+    for i in range(count):
+        product = DEFAULT_PRODUCTS[i % len(DEFAULT_PRODUCTS)]
+        year, month = divmod(first_delivery % 100 - 1 + i // len(DEFAULT_PRODUCTS), 12)
+        codes.append(f"{product}{first_delivery // 100 + year:02d}{month + 1:02d}")
+    return codes
+
+
+def generate_bars(n, contract="cu2401", seed=0, start=DEFAULT_START_DATE, start_price=60000):
+    """
+    生成 n 根日K线，列名与列顺序与按合约输出的文件一致（"交易日期" 改名为 "日期" 并位于末列）。
+    价格为按最小变动价位取整的整数随机游走，开高低收满足 最低价 <= 开盘价、收盘价 <= 最高价，相同 seed 结果相同。
+    """
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0.0, start_price * 0.012, n)
+    close = np.maximum(np.round((start_price + np.cumsum(steps)) / PRICE_TICK) * PRICE_TICK, PRICE_TICK * 10)
+    pre_close = np.concatenate([[start_price], close[:-1]])
+    open_p = np.maximum(pre_close + np.round(rng.normal(0.0, start_price * 0.004, n) / PRICE_TICK) * PRICE_TICK,
+                        PRICE_TICK)
+    high = np.maximum(open_p, close) + rng.integers(0, 30, n) * PRICE_TICK
+    low = np.maximum(np.minimum(open_p, close) - rng.integers(0, 30, n) * PRICE_TICK, PRICE_TICK)
+    settle = np.round((high + low + close * 2) / 4 / PRICE_TICK) * PRICE_TICK
+    pre_settle = np.concatenate([[start_price], settle[:-1]])
+    volume = rng.integers(100, 200000, n)
+    position = np.maximum(50000 + np.cumsum(rng.integers(-3000, 3001, n)), 100)
+    prices = {
+        "前收盘": pre_close, "前结算": pre_settle, "开盘价": open_p, "最高价": high, "最低价": low,
+        "收盘价": close, "结算价": settle, "涨跌1": close - pre_close, "涨跌2": close - pre_settle,
+    }
+    df = pd.DataFrame({"合约": contract, **{name: values.astype(np.int64) for name, values in prices.items()}})
+    df["成交量"] = volume
+    df["成交金额"] = np.round(volume * settle * 5 / 10000, 2)
+    df["持仓量"] = position
+    df["日期"] = trading_dates(n, start)
+    return df
+
+
+def _workbook_rows(blocks, title):
+    # 数据行只在每个合约的首行写合约代码；小计行数值单元格少，拆分阶段会将其过滤
+    yield [title] + [None] * (len(SHFE_COLUMNS) - 1)
+    yield [None] * len(SHFE_COLUMNS)
+    yield list(SHFE_COLUMNS)
+    for block in blocks:
+        values = block.rename(columns={"日期": "交易日期"})[SHFE_COLUMNS[1:]].to_numpy(dtype=object)
+        contract = block["合约"].iloc[0] if len(block) else None
+        for i, row in enumerate(values.tolist()):
+            yield [contract if i == 0 else None] + row
+        yield ["小计", None, None, None, None, None, None, None, None, None, None,
+               int(block["成交量"].sum()), float(block["成交金额"].sum()), int(block["持仓量"].iloc[-1])]
+    yield ["总计"] + [None] * (len(SHFE_COLUMNS) - 1)
+
+
+def write_workbook(path, blocks, title="上海期货交易所 合成行情"):
+    """
+    将若干合约的K线（`generate_bars` 的结果）按交易所布局写入一个工作簿，按后缀写出 .xlsx 或 .xls。
+    """
+    rows = _workbook_rows(blocks, title)
+    if path.endswith(".xls"):
+        try:
+            import xlwt
+        except ImportError:
+            raise ImportError("写出 .xls 工作簿需要 xlwt（见 environment.yml），或改用 .xlsx（--excel-format xlsx）") from None
+        book = xlwt.Workbook(encoding="utf-8")
+        sheet = book.add_sheet("Sheet1")
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                if value is not None:
+                    sheet.write(r, c, value.item() if isinstance(value, np.generic) else value)
+        book.save(path)
+        return
+    from openpyxl import Workbook
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet("Sheet1")
+    for row in rows:
+        sheet.append([value.item() if isinstance(value, np.generic) else value for value in row])
+    book.save(path)
+
+
+def generate_archive(folder, total_bars, contracts=4, workbooks=1, seed=0, excel_format="xlsx"):
+    """
+    生成合成的原始数据归档：共 total_bars 根K线平均分给 contracts 个合约，
+    每个合约的K线按时间切成 workbooks 段，第 i 个工作簿包含所有合约的第 i 段，与按月/按年导出的归档一致。
+
+    Returns:
+        list: 生成的工作簿路径。
+    """
+    os.makedirs(folder, exist_ok=True)
+    bars_per_contract = max(1, total_bars // contracts)
+    series = [generate_bars(bars_per_contract, code, seed + i, start_price=20000 + 5000 * i)
+              for i, code in enumerate(contract_codes(contracts))]
+    bounds = np.linspace(0, bars_per_contract, workbooks + 1).astype(int)
+    paths = []
+    for w in range(workbooks):
+        blocks = [df.iloc[bounds[w]:bounds[w + 1]] for df in series]
+        path = os.path.join(folder, f"shfe_{w:04d}.{excel_format}")
+        write_workbook(path, [block for block in blocks if len(block)], f"上海期货交易所 合成行情 第{w + 1}期")
+        paths.append(path)
+    return paths
+
+
+def generate_contract_files(folder, bars, contracts=1, seed=0, output_format="json"):
+    """
+    直接生成按合约输出的文件（跳过 Excel 与流水线），每个合约 bars 根K线。
+
+    Returns:
+        list: 生成的合约文件路径。
+    """
+    os.makedirs(folder, exist_ok=True)
+    suffix = contract_file_suffix(output_format)
+    paths = []
+    for i, code in enumerate(contract_codes(contracts)):
+        df = generate_bars(bars, code, seed + i, start_price=20000 + 5000 * i)
+        path = os.path.join(folder, code + suffix)
+        write_contract_file(path, df.to_dict(orient='records'), output_format)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成的上期所行情数据")
+    parser.add_argument("folder", help="输出目录")
+    parser.add_argument("--bars", type=int, default=10000, help="K线总根数（合约文件模式下为每个合约的根数）")
+    parser.add_argument("--contracts", type=int, default=4, help="合约个数")
+    parser.add_argument("--workbooks", type=int, default=1, help="工作簿个数，各合约的K线按时间切分到各工作簿")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同参数与种子生成的数据完全相同")
+    parser.add_argument("--excel-format", choices=("xlsx", "xls"), default="xlsx", help="工作簿格式")
+    parser.add_argument("--contract-files", choices=("json", "kbar"), default=None,
+                        help="直接生成按合约输出的文件而不是工作簿")
+    args = parser.parse_args(argv)
+
+    if args.contract_files:
+        paths = generate_contract_files(args.folder, args.bars, args.contracts, args.seed, args.contract_files)
+    else:
+        paths = generate_archive(args.folder, args.bars, args.contracts, args.workbooks, args.seed, args.excel_format)
+    print(f"已生成 {len(paths)} 个文件: {args.folder}")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
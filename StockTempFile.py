@@ -1,5 +1,11 @@
 import os
 import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from StockPipelineMetrics import file_size, record_file
 
 
 DEFAULT_FOLDER = r"E:\stock_json"
@@ -33,12 +39,14 @@ def fill_contract_and_save(folder_path):
     for file in os.listdir(folder_path):
         if file.endswith('.finished'):
             file_path = os.path.join(folder_path, file)
+            start = time.perf_counter()
             with open(file_path, 'r', encoding='utf-8') as f:
                 try:
                     # 读取 JSON 数据
                     data = json.load(f)
                 except Exception as e:
                     print(f"文件{file}读取失败: {e}")
+                    record_file("fill", file_path, e, bytes_read=file_size(file_path))
                     continue
 
             # 替换 "合约" 字段为空或为 "nan" 的值
@@ -55,9 +63,34 @@ def fill_contract_and_save(folder_path):
             new_path = os.path.join(folder_path, new_file)
             with open(new_path, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=4)
+            record_file("fill", file_path, rows_in=len(data), rows_out=len(data), bytes_read=file_size(file_path),
+                        bytes_written=file_size(new_path), seconds=time.perf_counter() - start)
             # print(f"已保存: {new_path}")
 
 
+def fill_contract_column(df):
+    """
+    内存版合约补全："合约" 为 NaN 的行取前一个非 NaN 值，首个非 NaN 值之前的行置为 None，
+    与 .temp 文件的处理规则一致。
+
+    Args:
+        df (pd.DataFrame): 已完成标题映射的数据行。
+
+    Returns:
+        pd.DataFrame: 补全合约后的数据行。
+    """
+    if "合约" not in df.columns:
+        return df
+    values = df["合约"].to_numpy(dtype=object)
+    # 仅浮点 NaN 需要补全，None 与其他值均作为新的前值
+    nan_mask = pd.isna(values) & ~np.equal(values, None)
+    positions = np.maximum.accumulate(np.where(nan_mask, -1, np.arange(len(values))))
+    filled = np.where(positions >= 0, values[np.maximum(positions, 0)], None)
+    df = df.copy()
+    df["合约"] = pd.Series(filled, index=df.index, dtype=object)
+    return df
+
+
 def main(folder_path=DEFAULT_FOLDER):
     fill_contract_and_save(folder_path)
 